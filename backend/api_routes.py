@@ -1,15 +1,45 @@
 
-from fastapi import APIRouter, HTTPException
-from fastapi.responses import JSONResponse
+import asyncio
+import json
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import JSONResponse, StreamingResponse
 from typing import Optional
-from schemas import ChatRequest, ChatResponse, RenameRequest
+from schemas import ChatRequest, ChatResponse, PortfolioHoldings, PortfolioPredictionRequest, RenameRequest
 import services
 
 router = APIRouter()
 
+# How often a long-running request checks whether its client is still connected.
+DISCONNECT_POLL_INTERVAL = 1.0
+
+async def run_until_disconnect(http_request: Request, coro):
+    """
+    Runs `coro` and cancels it if the client goes away before it finishes, so
+    abandoned chats stop holding Ollama connections and generation slots.
+    """
+    task = asyncio.ensure_future(coro)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_INTERVAL)
+            if done:
+                return task.result()
+            if await http_request.is_disconnected():
+                task.cancel()
+                raise HTTPException(status_code=499, detail="Client disconnected.")
+    finally:
+        if not task.done():
+            task.cancel()
+
 @router.post("/chat", response_model=ChatResponse)
-async def chat_endpoint(request: ChatRequest):
-    return await services.handle_chat(request)
+async def chat_endpoint(request: ChatRequest, http_request: Request):
+    return await run_until_disconnect(http_request, services.handle_chat(request))
+
+@router.post("/chat/stream")
+async def chat_stream_endpoint(request: ChatRequest):
+    async def ndjson_events():
+        async for event in services.stream_chat(request):
+            yield json.dumps(event) + "\n"
+    return StreamingResponse(ndjson_events(), media_type="application/x-ndjson")
 
 @router.post("/watchlist/{user_id}")
 async def add_to_watchlist(user_id: str, ticker: str):
@@ -23,10 +53,30 @@ async def remove_from_watchlist(user_id: str, ticker: str):
 async def get_watchlist(user_id: str):
     return await services.get_watchlist(user_id)
 
+@router.put("/portfolio/{user_id}")
+async def set_portfolio(user_id: str, holdings: PortfolioHoldings):
+    return await services.set_portfolio(user_id, holdings)
+
+@router.get("/portfolio/{user_id}")
+async def get_portfolio(user_id: str):
+    return await services.get_portfolio(user_id)
+
+@router.get("/portfolio/{user_id}/predictions")
+async def get_portfolio_predictions(user_id: str, tickers: Optional[str] = None, days: int = 90):
+    return await services.get_portfolio_advice(user_id, tickers, days)
+
+@router.post("/portfolio/predictions")
+async def score_portfolios(request: PortfolioPredictionRequest):
+    return await services.score_portfolios(request)
+
 @router.get("/stocks")
 async def get_stocks(limit: Optional[int] = None):
     return await services.get_stocks(limit)
 
+@router.get("/inference/stats")
+async def get_inference_stats():
+    return await services.get_inference_metrics()
+
 @router.get("/stock/{ticker}")
 async def get_single_stock_data(ticker: str):
     return await services.get_single_stock_data(ticker)
@@ -36,20 +86,28 @@ async def get_stock_data(tickers: str):
     return await services.get_stock_data(tickers)
 
 @router.get("/conversations/{user_id}")
-async def get_conversations(user_id: str):
-    return await services.get_conversations(user_id)
+async def get_conversations(user_id: str, limit: Optional[int] = None, before: Optional[str] = None, since: Optional[str] = None):
+    return await services.get_conversations(user_id, limit, before, since)
 
 @router.delete("/conversations/{user_id}/{conversation_id}")
 async def delete_conversation(user_id: str, conversation_id: str):
     return await services.delete_conversation(user_id, conversation_id)
 
+@router.delete("/users/{user_id}", status_code=202)
+async def delete_user_data(user_id: str):
+    return await services.delete_user_data(user_id)
+
+@router.get("/users/{user_id}/deletion/{job_id}")
+async def get_deletion_job(user_id: str, job_id: str):
+    return await services.get_deletion_job(user_id, job_id)
+
 @router.put("/conversations/{user_id}/{conversation_id}/rename")
 async def rename_conversation(user_id: str, conversation_id: str, request: RenameRequest):
     return await services.rename_conversation(user_id, conversation_id, request)
 
 @router.get("/chat_history/{user_id}/{conversation_id}")
-async def get_chat_history(user_id: str, conversation_id: str):
-    return await services.get_chat_history(user_id, conversation_id)
+async def get_chat_history(user_id: str, conversation_id: str, limit: Optional[int] = None, before: Optional[str] = None, after: Optional[str] = None, since: Optional[str] = None):
+    return await services.get_chat_history(user_id, conversation_id, limit, before, after, since)
 
 @router.get("/historical-data/{ticker}")
 async def get_historical_data_endpoint(ticker: str, days: int = 90):
@@ -0,0 +1,320 @@
+# backend/benchmarks/fake_firestore.py
+"""
+An in-memory Firestore double for benchmarks.
+
+Covers the part of the firebase_admin Firestore client the backend uses:
+collections and documents (set with merge, update, delete, get,
+collections), queries with where / order_by (including `__name__`) / limit /
+start_after / end_before / select,
+stream and get, list_documents (with show_missing), write batches and the SERVER_TIMESTAMP sentinel. Every
+round trip (a document read or write, a query, a batch commit) sleeps
+`latency` seconds, as the synchronous client blocks for the RPC.
+
+`install(client)` registers the double as `firebase_config.db` and stands in
+for `firebase_admin.firestore`, so the real SDK and its credentials are never
+touched; it must run before services and persistence are imported.
+"""
+import copy
+import functools
+import sys
+import threading
+import time
+import types
+import uuid
+from datetime import datetime, timezone
+
+SERVER_TIMESTAMP = object()
+
+class NotFound(Exception):
+    pass
+
+class Query:
+    ASCENDING = "ASCENDING"
+    DESCENDING = "DESCENDING"
+
+    _OPERATORS = {
+        "==": lambda a, b: a == b,
+        "!=": lambda a, b: a != b,
+        "<": lambda a, b: a < b,
+        "<=": lambda a, b: a <= b,
+        ">": lambda a, b: a > b,
+        ">=": lambda a, b: a >= b,
+        "in": lambda a, b: a in b,
+        "not-in": lambda a, b: a not in b,
+        "array_contains": lambda a, b: isinstance(a, list) and b in a,
+    }
+
+    def __init__(self, parent, filters=(), orders=(), limit=None, cursor=None, end=None, fields=None):
+        self._parent = parent
+        self._filters = tuple(filters)
+        self._orders = tuple(orders)
+        self._limit = limit
+        self._cursor = cursor
+        self._end = end
+        self._fields = fields
+
+    def _copy(self, **changes):
+        state = {
+            "filters": self._filters, "orders": self._orders, "limit": self._limit,
+            "cursor": self._cursor, "end": self._end, "fields": self._fields, **changes,
+        }
+        return Query(self._parent, **state)
+
+    def where(self, field_path: str, op_string: str, value):
+        if op_string not in self._OPERATORS:
+            raise ValueError(f"Unsupported operator {op_string!r}")
+        return self._copy(filters=self._filters + ((field_path, op_string, _normalize(value)),))
+
+    def order_by(self, field_path: str, direction: str = ASCENDING):
+        return self._copy(orders=self._orders + ((field_path, direction),))
+
+    def limit(self, count: int):
+        return self._copy(limit=count)
+
+    def start_after(self, document_fields_or_snapshot):
+        return self._copy(cursor=_cursor_row(document_fields_or_snapshot))
+
+    def end_before(self, document_fields_or_snapshot):
+        return self._copy(end=_cursor_row(document_fields_or_snapshot))
+
+    def select(self, field_paths):
+        return self._copy(fields=list(field_paths))
+
+    def _compare(self, a, b) -> int:
+        for field, direction in self._orders:
+            if field == "__name__":
+                left, right = a[0], b[0]
+            else:
+                left, right = a[1].get(field), b[1].get(field)
+            if left != right:
+                result = -1 if left < right else 1
+                return -result if direction == self.DESCENDING else result
+        return (a[0] > b[0]) - (a[0] < b[0])
+
+    def stream(self):
+        client = self._parent._client
+        client._round_trip()
+        rows = []
+        for path, data in client._children(self._parent._path):
+            if any(field not in data or not self._OPERATORS[op](data[field], value) for field, op, value in self._filters):
+                continue
+            if any(field != "__name__" and field not in data for field, _ in self._orders):
+                continue
+            rows.append((path[-1], data, path))
+        rows.sort(key=functools.cmp_to_key(self._compare))
+        if self._cursor is not None:
+            rows = [row for row in rows if self._compare(row, self._cursor) > 0]
+        if self._end is not None:
+            rows = [row for row in rows if self._compare(row, self._end) < 0]
+        if self._limit is not None:
+            rows = rows[:self._limit]
+        for doc_id, data, path in rows:
+            if self._fields is not None:
+                data = {field: data[field] for field in self._fields if field in data}
+            yield DocumentSnapshot(DocumentReference(client, path), copy.deepcopy(data))
+
+    def get(self):
+        return list(self.stream())
+
+class CollectionReference(Query):
+    def __init__(self, client, path: tuple):
+        self._client = client
+        self._path = path
+        super().__init__(self)
+
+    @property
+    def id(self) -> str:
+        return self._path[-1]
+
+    def document(self, document_id: str = None):
+        return DocumentReference(self._client, self._path + (document_id or uuid.uuid4().hex[:20],))
+
+    def add(self, data: dict):
+        ref = self.document()
+        ref.set(data)
+        return datetime.now(timezone.utc), ref
+
+    def list_documents(self, page_size: int = None, show_missing: bool = False):
+        self._client._round_trip()
+        for doc_id in self._client._document_ids(self._path, show_missing):
+            yield DocumentReference(self._client, self._path + (doc_id,))
+
+class DocumentSnapshot:
+    def __init__(self, reference, data):
+        self.reference = reference
+        self._data = data
+
+    @property
+    def id(self) -> str:
+        return self.reference.id
+
+    @property
+    def exists(self) -> bool:
+        return self._data is not None
+
+    def to_dict(self):
+        return copy.deepcopy(self._data)
+
+    def get(self, field_path: str):
+        return (self._data or {}).get(field_path)
+
+class DocumentReference:
+    def __init__(self, client, path: tuple):
+        self._client = client
+        self._path = path
+
+    @property
+    def id(self) -> str:
+        return self._path[-1]
+
+    @property
+    def path(self) -> str:
+        return "/".join(self._path)
+
+    def collection(self, name: str) -> CollectionReference:
+        return CollectionReference(self._client, self._path + (name,))
+
+    def collections(self):
+        self._client._round_trip()
+        return [CollectionReference(self._client, self._path + (name,)) for name in self._client._subcollections(self._path)]
+
+    def get(self) -> DocumentSnapshot:
+        self._client._round_trip()
+        return DocumentSnapshot(self, self._client._read(self._path))
+
+    def set(self, data: dict, merge: bool = False):
+        self._client._round_trip()
+        self._client._write(self._path, data, merge)
+
+    def update(self, data: dict):
+        self._client._round_trip()
+        self._client._write(self._path, data, merge=True, must_exist=True)
+
+    def delete(self):
+        self._client._round_trip()
+        self._client._delete(self._path)
+
+class WriteBatch:
+    def __init__(self, client):
+        self._client = client
+        self._ops = []
+
+    def set(self, reference: DocumentReference, data: dict, merge: bool = False):
+        self._ops.append(("set", reference, data, merge))
+
+    def update(self, reference: DocumentReference, data: dict):
+        self._ops.append(("update", reference, data, True))
+
+    def delete(self, reference: DocumentReference):
+        self._ops.append(("delete", reference, None, False))
+
+    def commit(self):
+        self._client._round_trip()
+        with self._client._lock:
+            for kind, reference, data, merge in self._ops:
+                if kind == "delete":
+                    self._client._delete(reference._path)
+                else:
+                    self._client._write(reference._path, data, merge, must_exist=kind == "update")
+        self._ops = []
+
+def _cursor_row(document_fields_or_snapshot) -> tuple:
+    """A cursor as the (id, data) row Query._compare takes; `__name__` may be an id or a reference."""
+    if isinstance(document_fields_or_snapshot, DocumentSnapshot):
+        return document_fields_or_snapshot.id, document_fields_or_snapshot._data or {}
+    fields = _normalize(dict(document_fields_or_snapshot))
+    name = fields.pop("__name__", "")
+    return (name if isinstance(name, str) else name.id), fields
+
+def _normalize(value):
+    if value is SERVER_TIMESTAMP:
+        return datetime.now(timezone.utc)
+    if isinstance(value, datetime) and value.tzinfo is None:
+        # Firestore stores naive datetimes as UTC and returns them timezone-aware.
+        return value.replace(tzinfo=timezone.utc)
+    if isinstance(value, dict):
+        return {key: _normalize(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_normalize(item) for item in value]
+    return value
+
+class FakeFirestore:
+    """The client: documents are kept by their full path, (collection, id, collection, id, ...)."""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.round_trips = 0
+        self._documents = {}
+        self._lock = threading.RLock()
+
+    def _round_trip(self):
+        self.round_trips += 1
+        if self.latency > 0:
+            time.sleep(self.latency)
+
+    def _read(self, path: tuple):
+        with self._lock:
+            data = self._documents.get(path)
+            return copy.deepcopy(data)
+
+    def _write(self, path: tuple, data: dict, merge: bool = False, must_exist: bool = False):
+        data = _normalize(copy.deepcopy(data))
+        with self._lock:
+            current = self._documents.get(path)
+            if must_exist and current is None:
+                raise NotFound(f"No document to update: {'/'.join(path)}")
+            self._documents[path] = {**current, **data} if merge and current is not None else data
+
+    def _delete(self, path: tuple):
+        with self._lock:
+            self._documents.pop(path, None)
+
+    def _children(self, collection_path: tuple):
+        depth = len(collection_path) + 1
+        with self._lock:
+            return [
+                (path, data) for path, data in self._documents.items()
+                if len(path) == depth and path[:-1] == collection_path
+            ]
+
+    def _document_ids(self, collection_path: tuple, show_missing: bool) -> list:
+        """IDs of the documents in a collection; with `show_missing`, also of missing ones that have subcollections."""
+        depth = len(collection_path)
+        with self._lock:
+            return sorted({
+                path[depth] for path in self._documents
+                if path[:depth] == collection_path and (len(path) == depth + 1 or (show_missing and len(path) > depth + 1))
+            })
+
+    def _subcollections(self, document_path: tuple) -> list:
+        depth = len(document_path)
+        with self._lock:
+            return sorted({path[depth] for path in self._documents if len(path) > depth + 1 and path[:depth] == document_path})
+
+    def collection(self, name: str) -> CollectionReference:
+        return CollectionReference(self, (name,))
+
+    def batch(self) -> WriteBatch:
+        return WriteBatch(self)
+
+    def document_count(self) -> int:
+        return len(self._documents)
+
+def install(client: FakeFirestore):
+    """Registers `client` as firebase_config.db, with firebase_admin.firestore backed by this module."""
+    firestore = types.ModuleType("firebase_admin.firestore")
+    firestore.SERVER_TIMESTAMP = SERVER_TIMESTAMP
+    firestore.Query = Query
+    firestore.client = lambda app=None: client
+
+    firebase_admin = types.ModuleType("firebase_admin")
+    firebase_admin.firestore = firestore
+    firebase_admin._apps = {"[DEFAULT]": None}
+
+    firebase_config = types.ModuleType("firebase_config")
+    firebase_config.db = client
+    firebase_config.firestore = firestore
+
+    sys.modules["firebase_admin"] = firebase_admin
+    sys.modules["firebase_admin.firestore"] = firestore
+    sys.modules["firebase_config"] = firebase_config
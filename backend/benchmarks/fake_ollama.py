@@ -0,0 +1,179 @@
+# backend/benchmarks/fake_ollama.py
+"""
+An Ollama-compatible /api/chat stub for benchmarks.
+
+Answers every prompt the backend sends (chat intent, ticker extraction, time
+window, titles, analysis cards, watchlist summaries and free-text summaries)
+with canned content of the right shape, recognised by its system prompt.
+Latency is modelled as a fixed time to the first token plus a per-token
+delay, and at most `parallel` generations run at once, like Ollama's
+OLLAMA_NUM_PARALLEL; requests beyond that queue. Both `stream: true` (NDJSON
+chunks) and `stream: false` are supported.
+
+Used by benchmarks.load_test, or on its own (from the backend directory):
+    python -m benchmarks.fake_ollama --port 11434 --latency 0.5 --token-latency 0.02
+"""
+import argparse
+import asyncio
+import json
+import random
+import re
+from datetime import datetime, timezone
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+DEFAULT_MODEL = "gemma3"
+
+_TICKER_PATTERN = re.compile(r"\$?\b([A-Z][A-Z0-9]{0,4}(?:[.-][A-Z])?)\b")
+_DAYS_PATTERN = re.compile(r"(\d+)\s*(day|week|month|year)s?", re.IGNORECASE)
+_DAYS_PER_UNIT = {"day": 1, "week": 7, "month": 30, "year": 365}
+
+_SUMMARY_SENTENCES = [
+    "The stock has traded in a steady range, with the moving average acting as support.",
+    "Momentum indicators such as the RSI and MACD point to a balanced market without strong overbought signals.",
+    "Volatility has eased recently, though earnings season could bring larger price swings.",
+    "Investors should weigh the dividend yield and valuation against the broader market trend.",
+    "Overall the outlook is neutral, and a diversified portfolio limits the risk of any single position.",
+]
+
+def _tickers(text: str) -> list:
+    tickers = []
+    for match in _TICKER_PATTERN.finditer(text):
+        if match.group(1) not in tickers and match.group(1) not in ("I", "A"):
+            tickers.append(match.group(1))
+    return tickers
+
+def _days(text: str) -> int:
+    match = _DAYS_PATTERN.search(text)
+    if not match:
+        return 90
+    return int(match.group(1)) * _DAYS_PER_UNIT[match.group(2).lower()]
+
+def _finrl_data(text: str) -> dict:
+    try:
+        return json.loads(text[text.index("{"):text.rindex("}") + 1])
+    except ValueError:
+        return {}
+
+def _card(finrl_data: dict) -> dict:
+    action = str(finrl_data.get("recommended_action", "HOLD")).upper()
+    ticker = finrl_data.get("ticker", "the stock")
+    tag = {"BUY": "BULLISH", "SELL": "BEARISH"}.get(action, "NEUTRAL")
+    return {
+        "summary_text": f"The model recommends to {action.lower()} {ticker} based on its recent technical indicators.",
+        "action_tags": [tag, "SHORT-TERM", "MODERATE-RISK"],
+        "pros": [
+            f"The MACD for {ticker} supports the {action} signal.",
+            "The RSI is within a normal range, so the stock is not overbought.",
+        ],
+        "cons": [
+            "Market volatility could reverse the short-term trend.",
+            "Technical indicators do not account for upcoming earnings.",
+        ],
+    }
+
+def canned_reply(messages: list, summary_sentences: int = 2) -> str:
+    """The content the stub answers `messages` with, chosen by the system prompt."""
+    system = next((m.get("content", "") for m in messages if m.get("role") == "system"), "")
+    user = next((m.get("content", "") for m in reversed(messages) if m.get("role") == "user"), "")
+
+    if "Analyze the user's message" in system:
+        intent = {
+            "analyze_watchlist": "watchlist" in user.lower() and not _tickers(user),
+            "tickers": _tickers(user),
+            "days": _days(user),
+        }
+        if '"title"' in system:
+            intent["title"] = "Stock Outlook Discussion"
+        return json.dumps(intent)
+    if "identify all company names" in system:
+        return json.dumps({"tickers": _tickers(user)})
+    if "time window in days" in system:
+        return str(_days(user))
+    if "title generation" in system:
+        return "Stock Outlook Discussion"
+    if "determine if the user wants to analyze their stock watchlist" in system:
+        return "true" if "watchlist" in user.lower() else "false"
+    if "FinRL model data" in system:
+        return json.dumps(_card(_finrl_data(user)))
+    if "summary for a watchlist analysis" in system:
+        return json.dumps({"summary_text": "Your watchlist is balanced between buy and hold signals, with few sell recommendations."})
+    return " ".join(_SUMMARY_SENTENCES[:max(1, summary_sentences)])
+
+def create_app(latency: float = 0.5, token_latency: float = 0.01, jitter: float = 0.1,
+               parallel: int = 4, summary_sentences: int = 2, seed: int = 7) -> FastAPI:
+    """
+    The stub as an ASGI app. A reply takes `latency` seconds to its first
+    token and `token_latency` seconds per further token (whitespace-separated
+    word), each scaled by a random factor within +/-`jitter`.
+    """
+    app = FastAPI(title="Ollama stub")
+    rng = random.Random(seed)
+    state = {"slots": None, "requests": 0}
+
+    def slots() -> asyncio.Semaphore:
+        if state["slots"] is None:
+            state["slots"] = asyncio.Semaphore(parallel)
+        return state["slots"]
+
+    def scaled(seconds: float) -> float:
+        return max(0.0, seconds * (1 + rng.uniform(-jitter, jitter)))
+
+    def chunk(model: str, content: str, done: bool) -> dict:
+        return {
+            "model": model,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "message": {"role": "assistant", "content": content},
+            "done": done,
+        }
+
+    @app.get("/api/tags")
+    async def tags():
+        return {"models": [{"name": f"{DEFAULT_MODEL}:latest", "model": f"{DEFAULT_MODEL}:latest"}]}
+
+    @app.post("/api/chat")
+    async def chat(request: Request):
+        payload = await request.json()
+        model = payload.get("model", DEFAULT_MODEL)
+        content = canned_reply(payload.get("messages", []), summary_sentences)
+        tokens = re.findall(r"\S+\s*", content) or [content]
+        state["requests"] += 1
+
+        if not payload.get("stream", True):
+            async with slots():
+                await asyncio.sleep(scaled(latency + token_latency * (len(tokens) - 1)))
+            return JSONResponse(chunk(model, content, True))
+
+        async def generate():
+            async with slots():
+                await asyncio.sleep(scaled(latency))
+                for index, token in enumerate(tokens):
+                    if index:
+                        await asyncio.sleep(scaled(token_latency))
+                    yield json.dumps(chunk(model, token, False)) + "\n"
+                yield json.dumps(chunk(model, "", True)) + "\n"
+
+        return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+    @app.get("/stub/stats")
+    async def stats():
+        return {"requests": state["requests"]}
+
+    return app
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--latency", type=float, default=0.5, help="Seconds to the first token.")
+    parser.add_argument("--token-latency", type=float, default=0.01, help="Seconds per further token.")
+    parser.add_argument("--jitter", type=float, default=0.1)
+    parser.add_argument("--parallel", type=int, default=4, help="Generations served at once; the rest queue.")
+    args = parser.parse_args()
+    app = create_app(args.latency, args.token_latency, args.jitter, args.parallel)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
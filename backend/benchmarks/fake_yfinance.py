@@ -0,0 +1,132 @@
+# backend/benchmarks/fake_yfinance.py
+"""
+A yfinance stand-in that replays daily bars from the trade data.
+
+The bars of the trade panel (trade_data_sp500.csv, or its memory-mapped
+directory) are relabelled onto consecutive weekdays ending at the last
+completed session, so the history store and the indicator refresh see data
+that is current. `download` returns frames shaped like yf.download's
+(a (ticker, field) column MultiIndex with group_by="ticker", flat columns for
+a single ticker) and `Ticker(t).info` carries the quote and profile fields
+data_utils reads. Every call sleeps `latency` seconds to stand in for the
+network round trip. Unknown tickers come back empty, as they do from Yahoo.
+
+`install(market)` registers the replay as the `yfinance` module; it must run
+before data_utils is imported.
+"""
+import os
+import re
+import sys
+import time
+import types
+import numpy as np
+import pandas as pd
+
+_PERIOD_PATTERN = re.compile(r"(\d+)(d|wk|mo|y)")
+_PERIOD_BARS = {"d": 1, "wk": 5, "mo": 21, "y": 252}
+_FIELDS = ["Open", "High", "Low", "Close", "Adj Close", "Volume"]
+
+def last_completed_session() -> pd.Timestamp:
+    # Same rule as data_utils.last_completed_session; data_utils can't be
+    # imported before the replay is installed.
+    now = pd.Timestamp.now(tz=os.getenv("MARKET_TIMEZONE", "America/New_York")).tz_localize(None)
+    today = now.normalize()
+    if today.dayofweek < 5 and now >= today + pd.Timedelta(f"{os.getenv('MARKET_CLOSE_TIME', '16:15')}:00"):
+        return today
+    return today - pd.offsets.BDay(1)
+
+class ReplayMarket:
+    """
+    Daily bars of `panel` on replayed dates, served through a yfinance-like API.
+    The last bar falls on `last_session` (default: the last completed session).
+    """
+
+    def __init__(self, panel, latency: float = 0.0, last_session=None):
+        self.panel = panel
+        self.latency = latency
+        end = last_completed_session() if last_session is None else pd.Timestamp(last_session)
+        self.dates = pd.bdate_range(end=end, periods=len(panel.dates))
+        self.slots = {ticker: i for i, ticker in enumerate(panel.tickers)}
+        self.calls = 0
+
+    def _wait(self):
+        self.calls += 1
+        if self.latency > 0:
+            time.sleep(self.latency)
+
+    def _rows(self, start=None, end=None, period=None) -> slice:
+        if start is not None or end is not None:
+            first = 0 if start is None else self.dates.searchsorted(pd.Timestamp(start))
+            # yfinance's `end` is exclusive.
+            last = len(self.dates) if end is None else self.dates.searchsorted(pd.Timestamp(end))
+            return slice(first, last)
+        match = _PERIOD_PATTERN.fullmatch(period or "1mo")
+        bars = int(match.group(1)) * _PERIOD_BARS[match.group(2)] if match else len(self.dates)
+        return slice(max(0, len(self.dates) - bars), len(self.dates))
+
+    def bars(self, ticker: str, rows: slice) -> pd.DataFrame:
+        """OHLCV frame of `ticker` over `rows`, indexed by date; empty for unknown tickers."""
+        slot = self.slots.get(ticker)
+        if slot is None:
+            return pd.DataFrame(columns=_FIELDS)
+        present = np.asarray(self.panel.present[rows, slot])
+        column = lambda name: np.asarray(self.panel.arrays[name][rows, slot], dtype=np.float64)[present]
+        close = column("close")
+        frame = pd.DataFrame({
+            "Open": column("open"),
+            "High": column("high"),
+            "Low": column("low"),
+            "Close": close,
+            "Adj Close": close,
+            "Volume": column("volume"),
+        }, index=pd.DatetimeIndex(self.dates[rows][present], name="Date"))
+        return frame
+
+    def download(self, tickers, start=None, end=None, period=None, interval="1d", group_by="column", **kwargs) -> pd.DataFrame:
+        self._wait()
+        single = isinstance(tickers, str) and len(tickers.split()) == 1
+        names = tickers.split() if isinstance(tickers, str) else list(tickers)
+        rows = self._rows(start, end, period)
+        frames = {t: self.bars(t, rows) for t in names}
+        frames = {t: frame for t, frame in frames.items() if not frame.empty}
+        if not frames:
+            return pd.DataFrame()
+        if single and group_by != "ticker":
+            return frames[names[0]]
+        return pd.concat(frames, axis=1)
+
+    def info(self, ticker: str) -> dict:
+        self._wait()
+        bars = self.bars(ticker, slice(0, len(self.dates)))
+        if bars.empty:
+            return {}
+        latest = bars.iloc[-1]
+        return {
+            "symbol": ticker,
+            "longName": f"{ticker} Inc.",
+            "shortName": ticker,
+            "currency": "USD",
+            "regularMarketPrice": float(latest["Close"]),
+            "previousClose": float(bars["Close"].iloc[-2]) if len(bars) > 1 else None,
+            "dayHigh": float(latest["High"]),
+            "dayLow": float(latest["Low"]),
+            "open": float(latest["Open"]),
+        }
+
+def install(market: ReplayMarket) -> types.ModuleType:
+    """Registers `market` as the `yfinance` module for everything imported afterwards."""
+    module = types.ModuleType("yfinance")
+
+    class Ticker:
+        def __init__(self, ticker: str):
+            self.ticker = ticker.upper()
+
+        @property
+        def info(self) -> dict:
+            return market.info(self.ticker)
+
+    module.download = market.download
+    module.Ticker = Ticker
+    module.market = market
+    sys.modules["yfinance"] = module
+    return module
@@ -0,0 +1,117 @@
+# backend/benchmarks/indicator_parity.py
+"""
+Checks the vectorized indicator engine against the per-ticker stockstats path
+and times both, then checks that the incremental IndicatorState (warmed up,
+snapshotted, restored and fed the final bar) lands on the same values.
+Uses a synthetic random-walk universe so it runs offline.
+
+Run from the backend directory:
+    python -m benchmarks.indicator_parity --tickers 500 --days 90
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+from stockstats import StockDataFrame as Sdf
+from indicators import INDICATOR_COLUMNS, PARITY_ATOL, PARITY_RTOL, preprocess_panel
+from indicator_state import IndicatorState
+
+def make_universe(num_tickers: int, num_days: int, seed: int = 7) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range(end="2025-06-30", periods=num_days)
+    frames = []
+    for i in range(num_tickers):
+        close = 50 + 150 * rng.random() + np.cumsum(rng.normal(0, 1.5, num_days))
+        close = np.maximum(close, 1.0)
+        spread = np.abs(rng.normal(0, 1.0, num_days))
+        frames.append(pd.DataFrame({
+            "date": dates,
+            "open": close + rng.normal(0, 0.5, num_days),
+            "high": close + spread,
+            "low": close - spread,
+            "close": close,
+            "volume": rng.integers(1_000_000, 50_000_000, num_days).astype(float),
+            "tic": f"T{i:04d}",
+        }))
+    return pd.concat(frames, ignore_index=True)
+
+def stockstats_per_ticker(df: pd.DataFrame) -> pd.DataFrame:
+    """The previous preprocess_for_finrl implementation, applied ticker by ticker."""
+    results = []
+    for _, ticker_df in df.groupby("tic", sort=True):
+        stock = Sdf(ticker_df.copy().set_index("date"))
+        for column in INDICATOR_COLUMNS:
+            stock[column]
+        stock.reset_index(inplace=True)
+        if "date" not in stock.columns and "index" in stock.columns:
+            stock.rename(columns={"index": "date"}, inplace=True)
+        processed = pd.DataFrame()
+        for column in ["date", "open", "high", "low", "close", "volume", "tic"] + INDICATOR_COLUMNS:
+            processed[column] = stock[column]
+        results.append(processed.bfill())
+    return pd.concat(results, ignore_index=True)
+
+def check_columns(actual: pd.DataFrame, expected: pd.DataFrame) -> bool:
+    """Prints the max error per indicator column; returns True if all are within tolerance."""
+    ok = True
+    for column in INDICATOR_COLUMNS:
+        a = actual[column].to_numpy(dtype=float)
+        e = expected[column].to_numpy(dtype=float)
+        close = np.isclose(a, e, rtol=PARITY_RTOL, atol=PARITY_ATOL, equal_nan=True)
+        max_error = np.nanmax(np.abs(a - e)) if len(a) else 0.0
+        status = "ok" if close.all() else f"MISMATCH in {int((~close).sum())} rows"
+        ok &= bool(close.all())
+        print(f"  {column:<13} max abs error {max_error:.2e}  {status}")
+    return ok
+
+def check_incremental(df: pd.DataFrame, panel: pd.DataFrame) -> bool:
+    dates = sorted(df["date"].unique())
+    tickers = sorted(df["tic"].unique())
+    state = IndicatorState(tickers)
+    state.update(df[df["date"] < dates[-1]])
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "indicator_state.npz")
+        state.save(path)
+        state = IndicatorState.load(path, tickers)
+
+    start = time.perf_counter()
+    state.update(df[df["date"] == dates[-1]])
+    update_seconds = time.perf_counter() - start
+    print(f"  incremental update of one bar for every ticker: {update_seconds * 1000:.1f} ms")
+
+    actual = pd.DataFrame([state.latest(t) for t in tickers])
+    expected = panel[panel["date"] == dates[-1]].sort_values("tic").reset_index(drop=True)
+    return check_columns(actual, expected)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--tickers", type=int, default=500)
+    parser.add_argument("--days", type=int, default=90)
+    args = parser.parse_args()
+
+    df = make_universe(args.tickers, args.days)
+
+    start = time.perf_counter()
+    expected = stockstats_per_ticker(df)
+    stockstats_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    actual = preprocess_panel(df)
+    panel_seconds = time.perf_counter() - start
+
+    print(f"{args.tickers} tickers x {args.days} days")
+    print(f"  stockstats per ticker: {stockstats_seconds * 1000:9.1f} ms")
+    print(f"  vectorized panel:      {panel_seconds * 1000:9.1f} ms ({stockstats_seconds / panel_seconds:.0f}x)")
+
+    ok = check_columns(actual, expected)
+    print("incremental state vs. vectorized panel (last bar)")
+    ok &= check_incremental(df, actual)
+
+    sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main()
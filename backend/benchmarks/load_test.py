@@ -0,0 +1,349 @@
+# backend/benchmarks/load_test.py
+"""
+Load test of the FastAPI app against local stand-ins for its dependencies.
+
+The app from main.py runs under uvicorn in a child process, with the
+in-memory Firestore double (benchmarks.fake_firestore) and the yfinance
+replay of the trade data (benchmarks.fake_yfinance) installed in place of the
+real clients, and OLLAMA_API_URL pointed at the Ollama stub
+(benchmarks.fake_ollama) served from this process. The history, card cache
+and precompute SQLite files and the indicator state snapshot live in a fresh
+temporary directory, so every run starts cold and the real ones are untouched. Users are seeded with a watchlist and a conversation with chat
+history.
+
+A fixed, seeded sequence of requests (by default chat turns naming 1-10
+tickers, watchlist reads and chat history pages) is then sent by
+`--concurrency` clients, each issuing its next request as soon as the previous
+one returns. The report gives throughput and p50/p95/p99 latency per
+endpoint, plus the server's per-stage timings from /metrics. `--json` writes
+the same numbers, with the git commit, for comparison between commits.
+
+Run from the backend directory (needs the PPO model and trade data):
+    python -m benchmarks.load_test --concurrency 16 --requests 400
+    python -m benchmarks.load_test --mix chat=1 --max-tickers 10 --json results.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+import httpx
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_MIX = "chat=4,watchlist=3,history=3"
+
+_STAGE_LINE = re.compile(r'^stage_duration_seconds_(sum|count)\{stage="([^"]+)"\} (\S+)$')
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def _user_id(index: int) -> str:
+    return f"bench-user-{index}"
+
+def _conversation_id(index: int) -> str:
+    return f"bench-conversation-{index}"
+
+def _load_tickers() -> list:
+    from trade_store import load_trade_panel
+    return list(load_trade_panel().tickers)
+
+# --- Server process ---
+
+def seed_users(db, tickers: list, args):
+    """Gives every benchmark user a watchlist and one conversation with `args.history_messages` messages."""
+    rng = random.Random(args.seed)
+    start = datetime.now(timezone.utc) - timedelta(days=30)
+    for index in range(args.users):
+        user = db.collection('users').document(_user_id(index))
+        for ticker in rng.sample(tickers, min(args.watchlist_size, len(tickers))):
+            user.collection('watchlist').document(ticker).set({'ticker': ticker, 'added_at': start})
+        conversation = user.collection('conversations').document(_conversation_id(index))
+        conversation.set({'title': 'Benchmark conversation', 'timestamp': start})
+        batch = db.batch()
+        for number in range(args.history_messages):
+            batch.set(conversation.collection('messages').document(), {
+                'timestamp': start + timedelta(minutes=number),
+                'sender': 'user' if number % 2 == 0 else 'bot',
+                'message': f"Benchmark message {number}",
+            })
+        batch.commit()
+
+def serve(args):
+    """Runs the app with the fakes installed. Started by run() as a child process."""
+    from benchmarks import fake_firestore, fake_yfinance
+    from trade_store import load_trade_panel
+
+    db = fake_firestore.FakeFirestore()
+    fake_firestore.install(db)
+    panel = load_trade_panel()
+    fake_yfinance.install(fake_yfinance.ReplayMarket(panel, latency=args.yfinance_latency))
+    seed_users(db, list(panel.tickers), args)
+    db.latency = args.firestore_latency
+
+    import uvicorn
+    from main import app
+    print(f"Backend: Benchmark server seeded {db.document_count()} documents, serving on port {args.port}")
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning", access_log=False)
+
+# --- Load generation ---
+
+def parse_mix(mix: str) -> dict:
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in ("chat", "chat_stream", "watchlist", "history"):
+            raise SystemExit(f"Unknown workload {name!r} in --mix; use chat, chat_stream, watchlist or history.")
+        weights[name.strip()] = float(weight or 1)
+    return weights
+
+def build_requests(tickers: list, args, count: int, seed: int) -> list:
+    """
+    A seeded list of (endpoint label, method, path, params, json body,
+    scroll back) tuples. History reads with `scroll back` set also fetch the
+    next older page, as half of readers do.
+    """
+    rng = random.Random(seed)
+    weights = parse_mix(args.mix)
+    kinds = list(weights)
+    requests = []
+    for _ in range(count):
+        kind = rng.choices(kinds, weights=list(weights.values()))[0]
+        index = rng.randrange(args.users)
+        user_id, conversation_id = _user_id(index), _conversation_id(index)
+        if kind in ("chat", "chat_stream"):
+            named = rng.sample(tickers, rng.randint(1, min(args.max_tickers, len(tickers))))
+            listed = named[0] if len(named) == 1 else ", ".join(named[:-1]) + " and " + named[-1]
+            body = {
+                "user_id": user_id,
+                "conversation_id": conversation_id,
+                "user_message": f"What is the outlook for {listed} over the next {rng.choice((7, 30, 90))} days?",
+            }
+            path = "/chat" if kind == "chat" else "/chat/stream"
+            requests.append((f"POST {path}", "POST", path, None, body, False))
+        elif kind == "watchlist":
+            requests.append(("GET /watchlist/{user_id}", "GET", f"/watchlist/{user_id}", None, None, False))
+        else:
+            params = {"limit": args.page_size}
+            path = f"/chat_history/{user_id}/{conversation_id}"
+            requests.append(("GET /chat_history/{user_id}/{conversation_id}", "GET", path, params, None, rng.random() < 0.5))
+    return requests
+
+async def _send(client: httpx.AsyncClient, method: str, path: str, params, body):
+    if path == "/chat/stream":
+        async with client.stream(method, path, json=body) as response:
+            async for _ in response.aiter_bytes():
+                pass
+            return response
+    return await client.request(method, path, params=params, json=body)
+
+async def drive(base_url: str, requests: list, concurrency: int) -> tuple:
+    """Sends `requests` in order from `concurrency` clients. Returns ({label: [(seconds, ok)]}, elapsed)."""
+    results = {}
+    queue = list(reversed(requests))
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=httpx.Timeout(300.0)) as client:
+        async def worker():
+            while queue:
+                label, method, path, params, body, scroll_back = queue.pop()
+                start = time.perf_counter()
+                try:
+                    response = await _send(client, method, path, params, body)
+                    ok = response.status_code < 400
+                    if ok and scroll_back:
+                        page = response.json()
+                        if page.get("has_more") and page.get("next_before"):
+                            results.setdefault(label, []).append((time.perf_counter() - start, ok))
+                            start = time.perf_counter()
+                            response = await client.get(path, params={**params, "before": page["next_before"]})
+                            ok = response.status_code < 400
+                except httpx.HTTPError:
+                    ok = False
+                results.setdefault(label, []).append((time.perf_counter() - start, ok))
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return results, time.perf_counter() - start
+
+def summarize(results: dict, elapsed: float) -> dict:
+    summary = {}
+    everything = []
+    for label, samples in sorted(results.items()):
+        everything.extend(samples)
+        summary[label] = _stats(samples, elapsed)
+    summary["all"] = _stats(everything, elapsed)
+    return summary
+
+def _stats(samples: list, elapsed: float) -> dict:
+    latencies = np.array([seconds for seconds, _ in samples]) * 1000
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) if len(latencies) else (0.0, 0.0, 0.0)
+    return {
+        "requests": len(samples),
+        "errors": sum(not ok for _, ok in samples),
+        "throughput_rps": len(samples) / elapsed if elapsed else 0.0,
+        "p50_ms": float(p50),
+        "p95_ms": float(p95),
+        "p99_ms": float(p99),
+        "max_ms": float(latencies.max()) if len(latencies) else 0.0,
+    }
+
+def parse_stage_metrics(text: str) -> dict:
+    """{stage: {"count", "total_s"}} from the stage_duration_seconds series of /metrics."""
+    stages = {}
+    for line in text.splitlines():
+        match = _STAGE_LINE.match(line)
+        if match:
+            kind, stage, value = match.groups()
+            stages.setdefault(stage, {})["count" if kind == "count" else "total_s"] = float(value)
+    return stages
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def _start_stub(args):
+    import uvicorn
+    from benchmarks.fake_ollama import create_app
+
+    port = _free_port()
+    app = create_app(args.ollama_latency, args.ollama_token_latency, parallel=args.ollama_parallel, seed=args.seed)
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", access_log=False))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        if not thread.is_alive():
+            raise SystemExit("The Ollama stub failed to start.")
+        time.sleep(0.05)
+    return server, thread, f"http://127.0.0.1:{port}"
+
+def _wait_until_up(base_url: str, process: subprocess.Popen, timeout: float, log_path: str):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f"The backend exited during startup; see {log_path}")
+        try:
+            response = httpx.get(f"{base_url}/readyz", timeout=2)
+            if response.status_code == 200:
+                return
+            if response.json().get("status") == "failed":
+                raise SystemExit(f"The backend failed to load the model: {response.json().get('error')}")
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    raise SystemExit(f"The backend did not come up within {timeout:.0f}s; see {log_path}")
+
+def print_report(summary: dict, stages: dict, elapsed: float):
+    print(f"\n{'endpoint':<48} {'reqs':>6} {'errs':>5} {'req/s':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for label, s in summary.items():
+        print(f"{label:<48} {s['requests']:>6} {s['errors']:>5} {s['throughput_rps']:>7.2f} "
+              f"{s['p50_ms']:>8.1f} {s['p95_ms']:>8.1f} {s['p99_ms']:>8.1f} {s['max_ms']:>8.1f}")
+    print(f"\nMeasured for {elapsed:.1f}s.")
+    if stages:
+        print(f"\n{'server stage':<40} {'calls':>8} {'total s':>9} {'mean ms':>9}")
+        for stage, s in sorted(stages.items(), key=lambda item: item[1].get("total_s", 0), reverse=True):
+            count = s.get("count", 0)
+            mean = s.get("total_s", 0) / count * 1000 if count else 0.0
+            print(f"{stage:<40} {count:>8.0f} {s.get('total_s', 0):>9.2f} {mean:>9.1f}")
+
+def run(args):
+    tickers = _load_tickers()
+    workdir = tempfile.mkdtemp(prefix="finrl-bench-")
+    log_path = args.server_log or os.path.join(workdir, "server.log")
+    stub, stub_thread, stub_url = _start_stub(args)
+    port = _free_port()
+    env = {
+        **os.environ,
+        "OLLAMA_API_URL": f"{stub_url}/api/chat",
+        "HISTORY_DB_PATH": os.path.join(workdir, "history.sqlite3"),
+        "CARD_CACHE_PATH": os.path.join(workdir, "card_cache.sqlite3"),
+        "PRECOMPUTE_DB_PATH": os.path.join(workdir, "precompute.sqlite3"),
+        "INDICATOR_STATE_PATH": os.path.join(workdir, "indicator_state.npz"),
+        "PYTHONUNBUFFERED": "1",
+    }
+    forwarded = [
+        "--port", str(port), "--seed", str(args.seed), "--users", str(args.users),
+        "--watchlist-size", str(args.watchlist_size), "--history-messages", str(args.history_messages),
+        "--firestore-latency", str(args.firestore_latency), "--yfinance-latency", str(args.yfinance_latency),
+    ]
+    base_url = f"http://127.0.0.1:{port}"
+    print(f"Starting the backend (log: {log_path})...")
+    with open(log_path, "w") as log:
+        process = subprocess.Popen(
+            [sys.executable, "-m", "benchmarks.load_test", "--serve", *forwarded],
+            cwd=BACKEND_DIR, env=env, stdout=log, stderr=subprocess.STDOUT,
+        )
+    try:
+        _wait_until_up(base_url, process, args.startup_timeout, log_path)
+        if args.warmup:
+            print(f"Warming up with {args.warmup} requests...")
+            asyncio.run(drive(base_url, build_requests(tickers, args, args.warmup, args.seed + 1), args.concurrency))
+        print(f"Sending {args.requests} requests from {args.concurrency} clients (mix {args.mix})...")
+        results, elapsed = asyncio.run(drive(base_url, build_requests(tickers, args, args.requests, args.seed), args.concurrency))
+        stages = parse_stage_metrics(httpx.get(f"{base_url}/metrics", timeout=10).text)
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+        stub.should_exit = True
+        stub_thread.join(timeout=5)
+
+    summary = summarize(results, elapsed)
+    print_report(summary, stages, elapsed)
+    if args.json:
+        report = {
+            "commit": _git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "settings": {key: value for key, value in vars(args).items() if key not in ("json", "serve", "port", "server_log")},
+            "elapsed_s": elapsed,
+            "endpoints": summary,
+            "stages": stages,
+        }
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nWrote {args.json}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=16, help="Clients sending requests at once.")
+    parser.add_argument("--requests", type=int, default=400, help="Measured requests.")
+    parser.add_argument("--warmup", type=int, default=40, help="Unmeasured requests sent first.")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="Workload weights: chat, chat_stream, watchlist, history.")
+    parser.add_argument("--max-tickers", type=int, default=10, help="Chat turns name 1 to this many tickers.")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--watchlist-size", type=int, default=10)
+    parser.add_argument("--history-messages", type=int, default=200, help="Seeded messages per conversation.")
+    parser.add_argument("--page-size", type=int, default=50, help="Chat history page size.")
+    parser.add_argument("--ollama-latency", type=float, default=0.5, help="Stub seconds to the first token.")
+    parser.add_argument("--ollama-token-latency", type=float, default=0.01, help="Stub seconds per further token.")
+    parser.add_argument("--ollama-parallel", type=int, default=4, help="Generations the stub serves at once.")
+    parser.add_argument("--yfinance-latency", type=float, default=0.15, help="Seconds per replayed yfinance call.")
+    parser.add_argument("--firestore-latency", type=float, default=0.02, help="Seconds per Firestore round trip.")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--startup-timeout", type=float, default=300, help="Seconds to wait for the model to load.")
+    parser.add_argument("--server-log", help="Where the backend's output goes (default: the run's temp directory).")
+    parser.add_argument("--json", help="Also write the results to this file.")
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, default=8000, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.serve:
+        serve(args)
+    else:
+        run(args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+# backend/benchmarks/policy_inference.py
+"""
+Checks the exported policy artifacts against the stable-baselines3 policy,
+then compares the inference backends' latency and memory.
+
+Parity runs every backend on the same observations: the latest trade-data
+observation with randomly drawn portfolios (cash and share counts) in the
+cash and holdings slots. fp32 exports must match SB3 within --atol; int8
+variants are reported with their largest deviation and the share of
+BUY/SELL/HOLD decisions that agree with SB3. Latency is the median over
+--repeat calls per batch size. Memory is the peak RSS of a fresh process that
+imports the backend, loads it and runs one forward pass, so it includes
+torch, SB3 or onnxruntime as each backend needs them.
+
+Export first (see policy_export.py), then run from the backend directory:
+    python -m benchmarks.policy_inference --batch-sizes 1 8 64 --samples 512
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+import numpy as np
+from policy_backends import _ARTIFACT_SUFFIXES, artifact_path, load_policy_backend
+from policy_export import PPO_MODEL_PATH
+
+# Same thresholds as finrl_engine._build_predictions.
+BUY_THRESHOLD = 0.05
+SELL_THRESHOLD = -0.05
+
+def make_observations(samples: int, seed: int) -> np.ndarray:
+    """`samples` copies of the latest observation, each with a random portfolio."""
+    from finrl.config import INDICATORS
+    from observation import LatestObservation
+    from trade_store import load_trade_panel
+
+    observation = LatestObservation(load_trade_panel().latest_slice(), INDICATORS, 1000000)
+    rng = np.random.default_rng(seed)
+    rows = []
+    for _ in range(samples):
+        held = rng.choice(observation.tickers, size=rng.integers(0, min(20, len(observation.tickers)) + 1), replace=False)
+        shares = {ticker: float(rng.integers(1, 500)) for ticker in held}
+        rows.append(observation.with_holdings(float(rng.uniform(0, 2_000_000)), shares))
+    return np.stack(rows).astype(np.float32)
+
+def decisions(actions: np.ndarray) -> np.ndarray:
+    return np.where(actions > BUY_THRESHOLD, 1, np.where(actions < SELL_THRESHOLD, -1, 0))
+
+def load_exact(model_path: str, name: str):
+    """The backend `name`, or None if it can't be loaded (load_policy_backend would fall back to sb3)."""
+    backend = load_policy_backend(model_path, name)
+    return backend if backend.name == name else None
+
+def median_ms(fn, repeat: int) -> float:
+    fn()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return float(np.median(times)) * 1000
+
+def measure_rss(model_path: str, name: str):
+    """Run in a child process: loads `name`, runs one forward pass and prints its timings and peak RSS as JSON."""
+    start = time.perf_counter()
+    backend = load_exact(model_path, name)
+    if backend is None:
+        print(json.dumps(None))
+        return
+    loaded = time.perf_counter() - start
+    backend.predict(np.zeros((1, backend.state_space), dtype=np.float32))
+    print(json.dumps({
+        "load_s": loaded,
+        "first_forward_s": time.perf_counter() - start - loaded,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }))
+
+def _child_rss(model_path: str, name: str):
+    result = subprocess.run(
+        [sys.executable, "-m", "benchmarks.policy_inference", "--model", model_path, "--measure-rss", name],
+        capture_output=True, text=True,
+    )
+    lines = result.stdout.strip().splitlines()
+    return json.loads(lines[-1]) if result.returncode == 0 and lines else None
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default=PPO_MODEL_PATH, help="SB3 model path without .zip.")
+    parser.add_argument("--backends", nargs="+", help="Default: sb3 and every exported artifact found.")
+    parser.add_argument("--samples", type=int, default=512, help="Observations for the parity check.")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8, 64])
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--atol", type=float, default=1e-4, help="Largest allowed fp32 deviation from SB3.")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--measure-rss", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure_rss:
+        measure_rss(args.model, args.measure_rss)
+        return
+
+    names = args.backends or ["sb3", *(name for name in _ARTIFACT_SUFFIXES if os.path.exists(artifact_path(args.model, name)))]
+    backends = {}
+    for name in names:
+        backend = load_exact(args.model, name)
+        if backend is None:
+            print(f"Skipping {name}: it could not be loaded.")
+        else:
+            backends[name] = backend
+    if "sb3" not in backends:
+        raise SystemExit("The SB3 reference policy could not be loaded.")
+
+    observations = make_observations(args.samples, args.seed)
+    reference = backends["sb3"].predict(observations)
+    print(f"Parity against sb3 on {len(observations)} observations:")
+    print(f"  {'backend':<18} {'max |diff|':>11} {'mean |diff|':>12} {'same decision':>14}")
+    failed = []
+    for name, backend in backends.items():
+        if name == "sb3":
+            continue
+        actions = backend.predict(observations)
+        diff = np.abs(actions - reference)
+        agreement = float(np.mean(decisions(actions) == decisions(reference)))
+        print(f"  {name:<18} {diff.max():>11.2e} {diff.mean():>12.2e} {agreement:>13.2%}")
+        if not name.endswith("-int8") and diff.max() > args.atol:
+            failed.append(name)
+
+    print(f"\nLatency (median of {args.repeat}, ms per call / us per row):")
+    print(f"  {'backend':<18}" + "".join(f" {'batch ' + str(size):>18}" for size in args.batch_sizes))
+    for name, backend in backends.items():
+        cells = []
+        for size in args.batch_sizes:
+            batch = observations[np.arange(size) % len(observations)]
+            ms = median_ms(lambda: backend.predict(batch), args.repeat)
+            cells.append(f"{ms:>8.3f} / {ms * 1000 / size:>7.1f}")
+        print(f"  {name:<18}" + "".join(f" {cell:>18}" for cell in cells))
+
+    print("\nFresh process per backend (import + load, first forward pass, peak RSS):")
+    for name in backends:
+        stats = _child_rss(args.model, name)
+        if stats is None:
+            print(f"  {name:<18} measurement failed")
+            continue
+        print(f"  {name:<18} {stats['load_s']:>7.2f}s {stats['first_forward_s'] * 1000:>9.1f} ms {stats['peak_rss_mb']:>9.0f} MB")
+
+    if failed:
+        raise SystemExit(f"Exported actors differ from the SB3 policy by more than {args.atol}: {', '.join(failed)}")
+
+if __name__ == "__main__":
+    main()
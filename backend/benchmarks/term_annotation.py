@@ -0,0 +1,117 @@
+# backend/benchmarks/term_annotation.py
+"""
+Checks the compiled TermAnnotator against the previous add_tooltips regex on
+random text, then times annotation across glossary sizes and text lengths.
+Time per character should stay flat as either grows. The previous
+implementation (one alternation of every term, rebuilt on each call) is timed
+alongside for the smaller glossaries.
+
+The previous pattern was joined with a non-raw '|\\b', i.e. a backspace
+character, so only the longest term could ever match. The reference here is
+the pattern as intended: \\b(term|term|...)\\b, longest terms first.
+
+Run from the backend directory:
+    python -m benchmarks.term_annotation --glossary-sizes 20 1000 5000 20000
+"""
+import argparse
+import json
+import random
+import re
+import string
+import time
+from term_annotator import FINANCIAL_TERMS_PATH, TermAnnotator
+
+def legacy_add_tooltips(glossary: dict, text: str) -> list:
+    """The previous add_tooltips, with the word boundaries it meant (see module docstring)."""
+    if not glossary or not text:
+        return [{"text": text, "isTerm": False}]
+    sorted_terms = sorted(glossary.keys(), key=len, reverse=True)
+    pattern = re.compile(r'\b(' + '|'.join(re.escape(term) for term in sorted_terms) + r')\b', re.IGNORECASE)
+    parts = []
+    last_idx = 0
+    for match in pattern.finditer(text):
+        start, end = match.span()
+        if start > last_idx:
+            parts.append({"text": text[last_idx:start], "isTerm": False})
+        term = match.group(0)
+        parts.append({"text": term, "isTerm": True, "definition": glossary.get(term.lower(), {}).get("definition", "")})
+        last_idx = end
+    if last_idx < len(text):
+        parts.append({"text": text[last_idx:], "isTerm": False})
+    return parts
+
+def make_glossary(size: int, base: dict, rng: random.Random) -> dict:
+    glossary = dict(base)
+    words = ["".join(rng.choices(string.ascii_lowercase, k=rng.randint(3, 10))) for _ in range(max(size, 1))]
+    while len(glossary) < size:
+        term = " ".join(rng.sample(words, rng.choice((1, 1, 2, 3))))
+        glossary.setdefault(term, {"definition": f"Definition of {term}."})
+    return glossary
+
+def make_text(length: int, glossary: dict, rng: random.Random) -> str:
+    terms = list(glossary)
+    filler = ["the", "market", "stocks", "rallied", "as", "investors", "weighed", "earnings", "and", "rates", "Bonds", "irate"]
+    words, size = [], 0
+    while size < length:
+        word = rng.choice(terms) if rng.random() < 0.15 else rng.choice(filler)
+        word = word.upper() if rng.random() < 0.1 else word
+        words.append(word + rng.choice(("", "", "", "s", ",", ".")))
+        size += len(words[-1]) + 1
+    return " ".join(words)[:length]
+
+def timed(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--glossary-sizes", type=int, nargs="+", default=[20, 1000, 5000, 20000])
+    parser.add_argument("--text-lengths", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--legacy-max-glossary", type=int, default=5000, help="Skip timing the old regex above this glossary size.")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    try:
+        with open(FINANCIAL_TERMS_PATH, "r") as f:
+            base = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        base = {}
+
+    print("Parity with the previous implementation:")
+    for size in (len(base) or 20, 500):
+        glossary = make_glossary(size, base, rng)
+        annotator = TermAnnotator(glossary)
+        samples = [make_text(rng.randint(0, 400), glossary, rng) for _ in range(300)]
+        mismatches = sum(annotator.annotate(text) != legacy_add_tooltips(glossary, text) for text in samples)
+        print(f"  {len(glossary):>6} terms, {len(samples)} texts: {mismatches} mismatches")
+        if mismatches:
+            raise SystemExit("Annotator output differs from the previous implementation.")
+
+    print("\nTiming (best of %d):" % args.repeat)
+    print(f"  {'terms':>6} {'chars':>8} {'compile ms':>11} {'annotate ms':>12} {'ns/char':>8} {'previous ms':>12}")
+    for size in args.glossary_sizes:
+        glossary = make_glossary(size, base, rng)
+        start = time.perf_counter()
+        annotator = TermAnnotator(glossary)
+        compile_ms = (time.perf_counter() - start) * 1000
+        for length in args.text_lengths:
+            text = make_text(length, glossary, rng)
+            seconds = timed(lambda: annotator.annotate(text), args.repeat)
+            previous = "-"
+            if size <= args.legacy_max_glossary:
+                previous = f"{timed(lambda: legacy_add_tooltips(glossary, text), 1) * 1000:.1f}"
+            print(f"  {size:>6} {length:>8} {compile_ms:>11.1f} {seconds * 1000:>12.2f} {seconds / length * 1e9:>8.0f} {previous:>12}")
+
+    texts = [make_text(rng.randint(40, 200), base or make_glossary(20, base, rng), rng) for _ in range(1000)]
+    annotator = TermAnnotator(base or make_glossary(20, base, rng))
+    one_by_one = timed(lambda: [annotator.annotate(text) for text in texts], args.repeat)
+    batched = timed(lambda: annotator.annotate_many(texts), args.repeat)
+    print(f"\n{len(texts)} short texts: {one_by_one * 1000:.1f} ms one by one, {batched * 1000:.1f} ms with annotate_many")
+
+if __name__ == "__main__":
+    main()
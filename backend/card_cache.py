@@ -0,0 +1,208 @@
+# backend/card_cache.py
+"""
+Content-addressed cache for LLM card analyses.
+
+A card's analysis depends only on the FinRL data it is generated from, so it
+is cached under a hash of the model-relevant fields: an in-memory LRU in front
+of an SQLite table that survives restarts. Entries are keyed by prediction
+date, and everything older is dropped once a newer trading day shows up.
+Concurrent requests for the same key share one generation.
+"""
+import asyncio
+import hashlib
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+from cache_utils import LRUCache
+
+CARD_CACHE_PATH = os.getenv("CARD_CACHE_PATH", "inference_engine/card_cache.sqlite3")
+CARD_CACHE_SIZE = int(os.getenv("CARD_CACHE_SIZE", "1024"))
+
+# Live-price fields change every few seconds. For the cache key they are
+# bucketed to this relative step (current_price) and this many percentage
+# points (percent_change); 0 keys on the exact values.
+CARD_CACHE_PRICE_STEP = float(os.getenv("CARD_CACHE_PRICE_STEP", "0.005"))
+CARD_CACHE_PERCENT_STEP = float(os.getenv("CARD_CACHE_PERCENT_STEP", "0.5"))
+
+# Indicator values are keyed to this many significant digits, so float noise
+# from recomputation doesn't split the cache.
+_SIGNIFICANT_DIGITS = 6
+
+def _round_significant(value):
+    if not isinstance(value, (int, float)) or isinstance(value, bool) or value == 0 or not math.isfinite(value):
+        return value
+    return round(value, _SIGNIFICANT_DIGITS - 1 - int(math.floor(math.log10(abs(value)))))
+
+def _bucket(value, step: float, relative: bool):
+    if not isinstance(value, (int, float)) or isinstance(value, bool) or step <= 0:
+        return value
+    if relative:
+        if value <= 0:
+            return value
+        return f"log:{round(math.log(value) / math.log1p(step))}"
+    return f"step:{round(value / step)}"
+
+def card_cache_key(finrl_data: dict, namespace: str = "") -> str:
+    """
+    Canonical hash of the fields of `finrl_data` that the LLM prompt depends
+    on. `namespace` (e.g. the model name) separates otherwise equal keys.
+    """
+    key_metrics = dict(finrl_data.get("key_metrics") or {})
+    current_price = key_metrics.pop("current_price", None)
+    percent_change = key_metrics.pop("percent_change", None)
+    canonical = {
+        "namespace": namespace,
+        "ticker": finrl_data.get("ticker"),
+        "prediction_date": finrl_data.get("prediction_date"),
+        "recommended_action": finrl_data.get("recommended_action"),
+        "action_value": _round_significant(finrl_data.get("action_value")),
+        "key_metrics": {name: _round_significant(value) for name, value in key_metrics.items()},
+        "current_price": _bucket(current_price, CARD_CACHE_PRICE_STEP, relative=True),
+        "percent_change": _bucket(percent_change, CARD_CACHE_PERCENT_STEP, relative=False),
+    }
+    # reasoning_prompt is derived from the ticker and date; anything else is keyed as-is.
+    canonical["other"] = {k: v for k, v in finrl_data.items() if k not in canonical and k not in ("key_metrics", "reasoning_prompt")}
+    encoded = json.dumps(canonical, sort_keys=True, default=str, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode()).hexdigest()
+
+class CardCache:
+    def __init__(self, path: str = CARD_CACHE_PATH, maxsize: int = CARD_CACHE_SIZE):
+        self.path = path
+        self.memory = LRUCache(maxsize)
+        self._local = threading.local()
+        self._inflight = {}
+        self._latest_date = None
+        self.disk_hits = 0
+        self.generations = 0
+        self.shared = 0
+        self._disk_available = True
+        try:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = self._connection()
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS cards (key TEXT PRIMARY KEY, prediction_date TEXT, response TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            row = connection.execute("SELECT MAX(prediction_date) FROM cards").fetchone()
+            self._latest_date = row[0] if row else None
+        except Exception as e:
+            print(f"Backend: Card cache disk tier unavailable, using memory only: {e}")
+            self._disk_available = False
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30)
+            self._local.connection = connection
+        return connection
+
+    def _disk_get(self, key: str):
+        row = self._connection().execute("SELECT response FROM cards WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _disk_set(self, key: str, prediction_date: str, response: dict):
+        with self._connection() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO cards (key, prediction_date, response, created_at) VALUES (?, ?, ?, ?)",
+                (key, prediction_date, json.dumps(response), time.time()),
+            )
+
+    def _disk_purge_before(self, prediction_date: str):
+        with self._connection() as connection:
+            connection.execute("DELETE FROM cards WHERE prediction_date < ?", (prediction_date,))
+
+    async def _roll_date(self, prediction_date: str):
+        """Drops every entry older than `prediction_date` once a newer trading day appears."""
+        if not prediction_date or (self._latest_date is not None and prediction_date <= self._latest_date):
+            return
+        previous, self._latest_date = self._latest_date, prediction_date
+        if previous is None:
+            return
+        self.memory.clear()
+        if self._disk_available:
+            try:
+                await asyncio.to_thread(self._disk_purge_before, prediction_date)
+            except Exception as e:
+                print(f"Backend: Could not purge old card analyses: {e}")
+
+    async def _disk_lookup(self, key: str):
+        if not self._disk_available:
+            return None
+        try:
+            response = await asyncio.to_thread(self._disk_get, key)
+        except Exception as e:
+            print(f"Backend: Card cache disk read failed: {e}")
+            return None
+        if response is not None:
+            self.disk_hits += 1
+            self.memory.set(key, response)
+        return response
+
+    async def set(self, key: str, prediction_date: str, response: dict):
+        self.memory.set(key, response)
+        if self._disk_available:
+            try:
+                await asyncio.to_thread(self._disk_set, key, prediction_date, response)
+            except Exception as e:
+                print(f"Backend: Card cache disk write failed: {e}")
+
+    async def get_or_generate(self, finrl_data: dict, generate, namespace: str = "") -> dict:
+        """
+        Returns the cached analysis for `finrl_data`, or runs `generate(finrl_data)`.
+        Concurrent callers with the same key await one generation; it keeps
+        running if they disconnect, so its result still reaches the cache.
+        Responses containing "error" are returned but not cached.
+        """
+        prediction_date = finrl_data.get("prediction_date")
+        await self._roll_date(prediction_date)
+        if prediction_date and self._latest_date and prediction_date < self._latest_date:
+            # A stale prediction date; generate without polluting the cache.
+            return await generate(finrl_data)
+
+        key = card_cache_key(finrl_data, namespace)
+        cached = self.memory.get(key)
+        if cached is not None:
+            return dict(cached)
+
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._load_or_generate(key, prediction_date, finrl_data, generate))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            self.shared += 1
+        return dict(await asyncio.shield(task))
+
+    async def _load_or_generate(self, key: str, prediction_date: str, finrl_data: dict, generate) -> dict:
+        response = await self._disk_lookup(key)
+        if response is not None:
+            return response
+        self.generations += 1
+        response = await generate(finrl_data)
+        if "error" not in response:
+            await self.set(key, prediction_date, response)
+        return response
+
+    def stats(self) -> dict:
+        return {
+            "memory": self.memory.stats(),
+            "disk_hits": self.disk_hits,
+            "generations": self.generations,
+            "shared_generations": self.shared,
+        }
+
+_cache = None
+_cache_guard = threading.Lock()
+
+def get_card_cache() -> CardCache:
+    """The process-wide cache, opened on first use."""
+    global _cache
+    with _cache_guard:
+        if _cache is None:
+            _cache = CardCache()
+        return _cache
@@ -1,98 +1,335 @@
 # backend/data_utils.py
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
-from stockstats import StockDataFrame as Sdf
-import yfinance as yf
-from datetime import datetime, timedelta
+from datetime import timedelta
+from cache_utils import LRUCache
+from instrumentation import instrumented
+from history_store import get_history_store
+from indicators import preprocess_panel
+from lazy_imports import LazyModule
 
+# Imported on the first download rather than at startup.
+yf = LazyModule("yfinance")
+
+# Sessions are dated in the exchange's timezone; a day's bar counts as complete
+# from MARKET_CLOSE_TIME on (a little after the 16:00 close, once it is final).
+MARKET_TIMEZONE = os.getenv("MARKET_TIMEZONE", "America/New_York")
+MARKET_CLOSE_TIME = os.getenv("MARKET_CLOSE_TIME", "16:15")
+
+# Process-wide market-data cache. One yfinance `.info` download fills both the
+# quote (short-lived) and the profile (company name, changes rarely).
+QUOTE_TTL = float(os.getenv("QUOTE_TTL_SECONDS", "15"))
+PROFILE_TTL = float(os.getenv("PROFILE_TTL_SECONDS", str(3 * 24 * 3600)))
+MARKET_DATA_CACHE_SIZE = int(os.getenv("MARKET_DATA_CACHE_SIZE", "2048"))
+# Failed lookups are remembered briefly so a bad ticker doesn't hammer upstream.
+MARKET_DATA_ERROR_TTL = 10.0
+
+_quote_cache = LRUCache(MARKET_DATA_CACHE_SIZE, ttl=QUOTE_TTL)
+_profile_cache = LRUCache(MARKET_DATA_CACHE_SIZE, ttl=PROFILE_TTL)
+# Upper bound on per-ticker upstream calls a bulk quote request runs at once.
+BULK_QUOTE_CONCURRENCY = int(os.getenv("BULK_QUOTE_CONCURRENCY", "8"))
+# Daily bars downloaded for bulk quotes; enough to find the previous close over a long weekend.
+BULK_QUOTE_PERIOD = "5d"
+
+_bulk_executor = ThreadPoolExecutor(max_workers=BULK_QUOTE_CONCURRENCY, thread_name_prefix="bulk-quote")
+# Concurrent .info downloads for the same ticker are collapsed into one. Tickers
+# are striped over a fixed set of locks, so arbitrary user-supplied tickers don't
+# grow a lock table; tickers sharing a stripe just wait for each other.
+FETCH_LOCK_STRIPES = 64
+_fetch_locks = [threading.Lock() for _ in range(FETCH_LOCK_STRIPES)]
+_upstream_fetches = 0
+
+@instrumented("preprocess_for_finrl")
 def preprocess_for_finrl(df):
     """
     Preprocesses the fetched data to match the FinRL model's input format.
+    Accepts data for one or many tickers (long format with a 'tic' column);
+    all tickers are processed together by the vectorized indicator engine.
     """
     if df.empty:
         return df
 
-    df_copy = df.copy().set_index('date')
-    stock = Sdf(df_copy)
-
-    # Add technical indicators
-    stock['macd']
-    stock['rsi_30']
-    stock['cci_30']
-    stock['boll_ub'] # Upper Bollinger Band
-    stock['boll_lb'] # Lower Bollinger Band
-    stock['dx_30'] # Directional Movement Index
-    stock['close_30_sma']
-    stock['close_60_sma']
-    
-    stock.reset_index(inplace=True)
-    
-    if 'date' not in stock.columns and 'index' in stock.columns:
-        stock.rename(columns={'index': 'date'}, inplace=True)
-    
-    required_columns = ['date', 'open', 'high', 'low', 'close', 'volume', 'tic', 'macd', 'rsi_30', 'cci_30', 'boll_ub', 'boll_lb', 'dx_30','close_30_sma', 'close_60_sma']
+    # Some indicators have NaN values for the first few rows; preprocess_panel
+    # back-fills them per ticker.
+    return preprocess_panel(df)
+
+def _quote_from_info(ticker: str, info: dict) -> dict:
+    if not info or 'regularMarketPrice' not in info:
+        return {"error": f"Could not fetch data for {ticker}. Ticker might be invalid or data not available."}
+
+    current_price = info.get('regularMarketPrice')
+    previous_close = info.get('previousClose')
     
-    # Create a new dataframe with only the required columns
-    processed_df = pd.DataFrame()
-    for col in required_columns:
-        if col in stock.columns:
-            processed_df[col] = stock[col]
+    change = current_price - previous_close if current_price and previous_close else 0
+    percent_change = (change / previous_close) * 100 if previous_close else 0
+
+    return {
+        "current_price": current_price,
+        "change": change,
+        "percent_change": percent_change,
+        "high_price_of_the_day": info.get('dayHigh'),
+        "low_price_of_the_day": info.get('dayLow'),
+        "open_price_of_the_day": info.get('open'),
+        "previous_close_price": previous_close
+    }
+
+def _profile_from_info(ticker: str, info: dict) -> dict:
+    return {"name": info.get('longName') or info.get('shortName') or ticker}
+
+def _ticker_lock(key: str) -> threading.Lock:
+    return _fetch_locks[hash(key) % FETCH_LOCK_STRIPES]
 
-    # Some indicators might have NaN values for the first few rows, let's fill them
-    processed_df = processed_df.bfill()
+@instrumented("yfinance.info")
+def _fetch_info(ticker: str, cache: LRUCache):
+    """
+    Downloads the `.info` blob for `ticker` once and stores both the quote and
+    the profile derived from it. Concurrent callers for the same ticker wait for
+    the one in-flight download, then find `cache` filled instead of starting
+    their own.
+    """
+    global _upstream_fetches
+    key = ticker.upper()
+    with _ticker_lock(key):
+        if cache.peek(key) is not None:
+            return
+        try:
+            _upstream_fetches += 1
+            info = yf.Ticker(ticker).info
+        except Exception as e:
+            print(f"Error fetching data from yfinance for {ticker}: {e}")
+            _quote_cache.set(key, {"error": f"An unexpected error occurred while fetching data from yfinance for {ticker}."}, ttl=MARKET_DATA_ERROR_TTL)
+            return
 
-    return processed_df
+        quote = _quote_from_info(ticker, info)
+        _quote_cache.set(key, quote, ttl=MARKET_DATA_ERROR_TTL if "error" in quote else QUOTE_TTL)
+        _profile_cache.set(key, _profile_from_info(ticker, info or {}), ttl=None if info else MARKET_DATA_ERROR_TTL)
 
 def get_yfinance_quote(ticker: str):
     """
     Fetches the latest quote for a given ticker using yfinance.
+    Served from the market-data cache for QUOTE_TTL seconds.
     """
-    try:
-        stock = yf.Ticker(ticker)
-        info = stock.info
-
-        if not info or 'regularMarketPrice' not in info:
-            return {"error": f"Could not fetch data for {ticker}. Ticker might be invalid or data not available."}
-
-        current_price = info.get('regularMarketPrice')
-        previous_close = info.get('previousClose')
-        
-        change = current_price - previous_close if current_price and previous_close else 0
-        percent_change = (change / previous_close) * 100 if previous_close else 0
-
-        return {
-            "current_price": current_price,
-            "change": change,
-            "percent_change": percent_change,
-            "high_price_of_the_day": info.get('dayHigh'),
-            "low_price_of_the_day": info.get('dayLow'),
-            "open_price_of_the_day": info.get('open'),
-            "previous_close_price": previous_close
-        }
-    except Exception as e:
-        print(f"Error fetching data from yfinance for {ticker}: {e}")
-        return {"error": f"An unexpected error occurred while fetching data from yfinance for {ticker}."}
+    key = ticker.upper()
+    quote = _quote_cache.get(key)
+    if quote is None:
+        _fetch_info(ticker, _quote_cache)
+        quote = _quote_cache.peek(key) or {"error": f"Could not fetch data for {ticker}. Ticker might be invalid or data not available."}
+    return dict(quote)
 
 def get_yfinance_profile(ticker: str):
     """
     Fetches company profile data (specifically, the company name) using yfinance.
+    Served from the market-data cache for PROFILE_TTL seconds.
     """
-    try:
-        stock = yf.Ticker(ticker)
-        info = stock.info
-        return {"name": info.get('longName') or info.get('shortName') or ticker}
-    except Exception as e:
-        print(f"Error fetching profile from yfinance for {ticker}: {e}")
+    key = ticker.upper()
+    profile = _profile_cache.get(key)
+    if profile is None:
+        _fetch_info(ticker, _profile_cache)
+        profile = _profile_cache.peek(key)
+    if profile is None:
         return {"name": ticker, "error": "Could not fetch profile data."}
+    return dict(profile)
+
+@instrumented("yfinance.download_quotes")
+def _download_quotes(tickers: list[str]) -> dict:
+    """
+    Quotes for many tickers from one batched yf.download of the last few daily
+    bars: the latest bar gives the price and the day's range, the bar before it
+    the previous close. Tickers missing from the download are left out.
+    """
+    global _upstream_fetches
+    _upstream_fetches += 1
+    df = yf.download(
+        tickers,
+        period=BULK_QUOTE_PERIOD,
+        interval="1d",
+        group_by="ticker",
+        progress=False,
+        auto_adjust=False,
+        threads=True,
+    )
+    if df is None or df.empty:
+        return {}
+
+    quotes = {}
+    for ticker in tickers:
+        try:
+            if isinstance(df.columns, pd.MultiIndex):
+                if ticker not in df.columns.get_level_values(0):
+                    continue
+                bars = df[ticker]
+            else:
+                bars = df
+            bars = bars.dropna(subset=["Close"])
+            if bars.empty:
+                continue
+            latest = bars.iloc[-1]
+            info = {
+                "regularMarketPrice": float(latest["Close"]),
+                "previousClose": float(bars["Close"].iloc[-2]) if len(bars) > 1 else None,
+                "dayHigh": float(latest["High"]),
+                "dayLow": float(latest["Low"]),
+                "open": float(latest["Open"]),
+            }
+            quotes[ticker] = _quote_from_info(ticker, info)
+        except Exception as e:
+            print(f"Error reading bulk quote for {ticker}: {e}")
+    return quotes
+
+def get_bulk_quotes(tickers: list[str]) -> dict:
+    """
+    Fetches quotes and company names for a list of tickers at once.
+    Cached quotes are used as-is; the rest come from one batched download, and
+    only tickers it couldn't cover fall back to per-ticker lookups, at most
+    BULK_QUOTE_CONCURRENCY at a time. Names not yet cached are looked up only
+    for tickers that got a quote.
+
+    Returns {ticker: quote} in input order, each quote carrying a "name", or
+    {"error": ...} for tickers that failed; one bad ticker doesn't fail the rest.
+    """
+    tickers = list(dict.fromkeys(t.strip().upper() for t in tickers if t and t.strip()))
+    quotes = {t: _quote_cache.get(t) for t in tickers}
+
+    missing = [t for t, quote in quotes.items() if quote is None]
+    if missing:
+        try:
+            downloaded = _download_quotes(missing)
+        except Exception as e:
+            print(f"Error fetching bulk quotes from yfinance: {e}")
+            downloaded = {}
+        for ticker, quote in downloaded.items():
+            _quote_cache.set(ticker, quote, ttl=MARKET_DATA_ERROR_TTL if "error" in quote else QUOTE_TTL)
+            quotes[ticker] = quote
+
+    fallbacks = {
+        t: _bulk_executor.submit(get_yfinance_quote, t)
+        for t, quote in quotes.items() if quote is None
+    }
+    profiles = {
+        t: _bulk_executor.submit(get_yfinance_profile, t)
+        for t, quote in quotes.items()
+        if quote is not None and "error" not in quote and _profile_cache.peek(t) is None
+    }
+    for ticker, future in fallbacks.items():
+        # A fallback's .info download usually caches the name as well.
+        quotes[ticker] = future.result()
+        if "error" not in quotes[ticker] and _profile_cache.peek(ticker) is None:
+            profiles[ticker] = _bulk_executor.submit(get_yfinance_profile, ticker)
+
+    results = {}
+    for ticker in tickers:
+        quote = dict(quotes[ticker])
+        if "error" not in quote:
+            profile = profiles[ticker].result() if ticker in profiles else _profile_cache.get(ticker, {})
+            quote["name"] = profile.get("name", ticker)
+        results[ticker] = quote
+    return results
+
+def get_market_data_cache_stats() -> dict:
+    """Hit/miss counters of the quote and profile caches and the number of upstream .info downloads."""
+    return {
+        "quotes": _quote_cache.stats(),
+        "profiles": _profile_cache.stats(),
+        "upstream_fetches": _upstream_fetches,
+    }
+
+def _market_now() -> pd.Timestamp:
+    """Wall-clock time in the exchange's timezone, as a naive timestamp."""
+    return pd.Timestamp.now(tz=MARKET_TIMEZONE).tz_localize(None)
+
+def last_completed_session() -> pd.Timestamp:
+    """
+    The most recent weekday whose daily bar is complete: today once the market
+    has closed, otherwise the weekday before (holidays are not considered).
+    """
+    now = _market_now()
+    today = now.normalize()
+    if today.dayofweek < 5 and now >= today + pd.Timedelta(f"{MARKET_CLOSE_TIME}:00"):
+        return today
+    return today - pd.offsets.BDay(1)
+
+def _history_window(days: int):
+    """
+    (start, end) of a `days`-long history request. yfinance and the history
+    store treat `end` as exclusive, so it is the day after the last completed
+    session; before the close that is today, and today's partial bar is left out.
+    """
+    end_date = last_completed_session().to_pydatetime() + timedelta(days=1)
+    return end_date - timedelta(days=days), end_date
 
 def get_historical_data(ticker: str, days: int = 90):
     """
-    Fetch historical OHLCV data for a ticker using yfinance.
+    Fetch historical OHLCV data for a ticker.
     Returns a DataFrame with columns: date, open, high, low, close, volume, tic.
+    Served from the local history store; only bars it doesn't have yet are
+    downloaded from yfinance.
     """
+    start_date, end_date = _history_window(days)
     try:
-        end_date = datetime.today()
-        start_date = end_date - timedelta(days=days)
+        return get_history_store().get_history(ticker, start_date, end_date, _download_history)
+    except Exception as e:
+        print(f"Error reading history store for {ticker}, downloading instead: {e}")
+        bars = _download_history(ticker, start_date, end_date)
+        return bars if bars is not None else pd.DataFrame()
 
+def get_bulk_historical_data(tickers: list[str], days: int = 90) -> dict:
+    """
+    get_historical_data for many tickers at once. Bars missing from the local
+    history store are downloaded with one multi-ticker yf.download; tickers it
+    fails for are retried individually. Returns {ticker: DataFrame}.
+    """
+    start_date, end_date = _history_window(days)
+    try:
+        return get_history_store().get_histories(tickers, start_date, end_date, _download_histories, _download_history)
+    except Exception as e:
+        print(f"Error reading history store for {len(tickers)} tickers, downloading instead: {e}")
+        histories = {t: _download_history(t, start_date, end_date) for t in tickers}
+        return {t: bars if bars is not None else pd.DataFrame() for t, bars in histories.items()}
+
+@instrumented("yfinance.download_histories")
+def _download_histories(tickers: list[str], start_date, end_date) -> dict:
+    """
+    Downloads daily bars for several tickers in one yf.download call and splits
+    the (ticker, field) column frame into one long OHLCV frame per ticker.
+    Tickers without data are left out.
+    """
+    df = yf.download(
+        tickers,
+        start=start_date.strftime("%Y-%m-%d"),
+        end=end_date.strftime("%Y-%m-%d"),
+        interval="1d",
+        group_by="ticker",
+        progress=False,
+        auto_adjust=False,
+        threads=True,
+    )
+    if df is None or df.empty:
+        return {}
+    if not isinstance(df.columns, pd.MultiIndex):
+        df = pd.concat({tickers[0]: df}, axis=1)
+
+    available = set(df.columns.get_level_values(0))
+    histories = {}
+    for ticker in tickers:
+        if ticker not in available:
+            continue
+        bars = df[ticker].rename(columns=lambda c: str(c).lower()).dropna(subset=["close"])
+        if bars.empty or not all(col in bars.columns for col in ["open", "high", "low", "close", "volume"]):
+            continue
+        bars = bars[["open", "high", "low", "close", "volume"]].rename_axis("date").reset_index()
+        bars["tic"] = ticker
+        histories[ticker] = bars
+    return histories
+
+@instrumented("yfinance.download_history")
+def _download_history(ticker: str, start_date, end_date):
+    """
+    Downloads daily bars for start_date <= date < end_date from yfinance.
+    Returns an empty frame if there are none, or None if the download failed.
+    """
+    try:
         df = yf.download(
             ticker,
             start=start_date.strftime("%Y-%m-%d"),
@@ -137,4 +374,4 @@ def get_historical_data(ticker: str, days: int = 90):
 
     except Exception as e:
         print(f"Error fetching yfinance data for {ticker}: {e}")
-        return pd.DataFrame()
\ No newline at end of file
+        return None
\ No newline at end of file
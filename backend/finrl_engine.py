@@ -1,136 +1,413 @@
 
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
 import pandas as pd
 import numpy as np
-import torch
-from stable_baselines3 import PPO
-from finrl.config import INDICATORS
-from data_utils import preprocess_for_finrl, get_historical_data
+from data_utils import get_bulk_historical_data, last_completed_session
+from indicator_state import IndicatorState, write_snapshot
+from cache_utils import LRUCache
+from inference_batcher import InferenceBatcher
+from instrumentation import instrumented
+from observation import LatestObservation
+from policy_backends import FINRL_INFERENCE_BACKEND, load_policy_backend
+from trade_store import load_trade_panel
+
+# The policy runtime (see policy_backends) and finrl are imported by
+# load_engine(), not at import time.
+PPO_MODEL_PATH = "inference_engine/agent_ppo_v1"
+
+# Rolling indicator state is snapshotted here so a restarted backend only needs
+# the bars it missed. A ticker without state is warmed up from this many days.
+INDICATOR_STATE_PATH = os.getenv("INDICATOR_STATE_PATH", "inference_engine/indicator_state.npz")
+INDICATOR_WARMUP_DAYS = 365
+
+def _load_indicator_state(tickers: list[str]) -> IndicatorState:
+    try:
+        state = IndicatorState.load(INDICATOR_STATE_PATH, tickers)
+        print("Backend: Indicator state restored from snapshot.")
+        return state
+    except FileNotFoundError:
+        return IndicatorState(tickers)
+    except Exception as e:
+        print(f"Backend: Could not restore indicator state, starting empty: {e}")
+        return IndicatorState(tickers)
+
+# Indicator state updates run in a worker thread, one at a time. Readers on the
+# event loop (observation patches, snapshots) hold this lock too, so they never
+# see a half-applied update.
+_indicator_state_lock = asyncio.Lock()
+
+# The snapshot writer: one write at a time, off the event loop. Updates made
+# while a snapshot is being written are saved by one more write after it.
+_snapshot_writer = {"task": None, "dirty": False}
+
+async def _write_indicator_snapshots():
+    while _snapshot_writer["dirty"]:
+        _snapshot_writer["dirty"] = False
+        try:
+            async with _indicator_state_lock:
+                arrays = indicator_state.snapshot()
+            await asyncio.to_thread(write_snapshot, INDICATOR_STATE_PATH, arrays)
+        except Exception as e:
+            print(f"Backend: Could not save indicator state: {e}")
+
+def _save_indicator_state():
+    _snapshot_writer["dirty"] = True
+    task = _snapshot_writer["task"]
+    if task is None or task.done():
+        _snapshot_writer["task"] = asyncio.get_running_loop().create_task(_write_indicator_snapshots())
+
+async def flush_indicator_state():
+    """Waits for pending indicator state snapshots to be written. Call before the event loop stops."""
+    task = _snapshot_writer["task"]
+    if task is not None and not task.done():
+        await task
+
+@instrumented("ppo.forward")
+def _predict_actions(observations: np.ndarray) -> np.ndarray:
+    """Deterministic PPO actions for a (rows, state_space) batch. Runs in a worker thread."""
+    return policy_backend.predict(observations)
 
 # --- FinRL Model and Data Loading ---
-try:
-    print("Backend: Loading FinRL PPO model...")
-    PPO_MODEL_PATH = "inference_engine/agent_ppo_v1"
-    model_ppo = PPO.load(PPO_MODEL_PATH)
-    print("Backend: FinRL PPO model loaded successfully.")
-
-    print("Backend: Loading trading data...")
-    trade_df = pd.read_csv("inference_engine/trade_data_sp500.csv", index_col=0)
-    trade_df['date'] = pd.to_datetime(trade_df['date'])
-    print("Backend: Trading data loaded successfully.")
-    
-    TICKER_LIST_FROM_DATA = trade_df.tic.unique().tolist()
-    
-    finrl_concept_available = True
-
-except Exception as e:
-    print(f"CRITICAL ERROR: Failed to load FinRL model or data: {e}")
-    finrl_concept_available = False
+# Everything below is filled in by load_engine(). The list and dicts are
+# updated in place, so modules that imported them by name see the loaded values.
+policy_backend = None
+inference_batcher = None
+trade_panel = None
+indicator_state = None
+INDICATORS = []
+TICKER_LIST_FROM_DATA = []
+# Position of each ticker in the model's action vector.
+ACTION_SLOTS = {}
+finrl_concept_available = False
 
 # Environment setup based on the training notebook
-stock_dimension = len(TICKER_LIST_FROM_DATA) if 'TICKER_LIST_FROM_DATA' in locals() else 0
-state_space = 1 + 2 * stock_dimension + len(INDICATORS) * stock_dimension
-buy_cost_list = sell_cost_list = [0.001] * stock_dimension
-num_stock_shares = [0] * stock_dimension
-
 env_kwargs = {
     "hmax": 100,
     "initial_amount": 1000000,
-    "num_stock_shares": num_stock_shares,
-    "buy_cost_pct": buy_cost_list,
-    "sell_cost_pct": sell_cost_list,
-    "state_space": state_space,
-    "stock_dim": stock_dimension,
+    "num_stock_shares": [],
+    "buy_cost_pct": [],
+    "sell_cost_pct": [],
+    "state_space": 0,
+    "stock_dim": 0,
     "tech_indicator_list": INDICATORS,
-    "action_space": stock_dimension,
+    "action_space": 0,
     "reward_scaling": 1e-4
 }
 
-async def get_batch_dynamic_finrl_predictions(tickers: list[str], days: int = 90):
+# "cold" until load_engine() starts, then "loading" and finally "ready" or "failed".
+_engine_state = {"status": "cold", "error": None, "load_seconds": None}
+_engine_lock = threading.Lock()
+_warm_up_task = None
+
+def _set_environment(stock_dimension: int):
+    env_kwargs.update({
+        "num_stock_shares": [0] * stock_dimension,
+        "buy_cost_pct": [0.001] * stock_dimension,
+        "sell_cost_pct": [0.001] * stock_dimension,
+        "state_space": 1 + 2 * stock_dimension + len(INDICATORS) * stock_dimension,
+        "stock_dim": stock_dimension,
+        "action_space": stock_dimension,
+    })
+
+def load_engine():
     """
-    Uses the loaded FinRL PPO model to get predictions for the given tickers.
-    Accepts a custom number of days for historical data.
+    Imports the model stack, loads the PPO model, the trade data and the
+    indicator state, then runs one dummy forward pass so the first request
+    doesn't pay for torch's lazy initialization. Blocking and idempotent: later
+    calls return at once, concurrent ones wait for the first. Failures are
+    logged and leave finrl_concept_available False.
+    """
+    global policy_backend, inference_batcher, trade_panel, indicator_state, finrl_concept_available
+    with _engine_lock:
+        if _engine_state["status"] in ("ready", "failed"):
+            return
+        _engine_state["status"] = "loading"
+        started = time.perf_counter()
+        try:
+            from finrl.config import INDICATORS as finrl_indicators
+            INDICATORS[:] = finrl_indicators
+
+            print("Backend: Loading FinRL PPO model...")
+            policy_backend = load_policy_backend(PPO_MODEL_PATH, FINRL_INFERENCE_BACKEND)
+            print(f"Backend: FinRL PPO model loaded successfully ({policy_backend.name}: {policy_backend.artifact}).")
+            inference_batcher = InferenceBatcher(_predict_actions)
+
+            print("Backend: Loading trading data...")
+            trade_panel = load_trade_panel()
+            print("Backend: Trading data loaded successfully.")
+
+            TICKER_LIST_FROM_DATA[:] = list(trade_panel.tickers)
+            ACTION_SLOTS.update({ticker: i for i, ticker in enumerate(TICKER_LIST_FROM_DATA)})
+            _set_environment(len(TICKER_LIST_FROM_DATA))
+            indicator_state = _load_indicator_state(TICKER_LIST_FROM_DATA)
+
+            _predict_actions(np.zeros((1, env_kwargs["state_space"]), dtype=np.float32))
+
+            finrl_concept_available = True
+            _engine_state["status"] = "ready"
+            print(f"Backend: FinRL engine ready in {time.perf_counter() - started:.1f}s.")
+
+        except Exception as e:
+            print(f"CRITICAL ERROR: Failed to load FinRL model or data: {e}")
+            _engine_state.update({"status": "failed", "error": str(e)})
+        _engine_state["load_seconds"] = round(time.perf_counter() - started, 3)
+
+def start_warm_up() -> asyncio.Task:
+    """Starts load_engine() in a worker thread if it isn't running yet on this event loop. Returns its task."""
+    global _warm_up_task
+    loop = asyncio.get_running_loop()
+    if _warm_up_task is None or _warm_up_task.get_loop() is not loop:
+        _warm_up_task = loop.create_task(asyncio.to_thread(load_engine))
+    return _warm_up_task
+
+async def wait_until_ready() -> bool:
+    """Waits for the engine to finish loading (starting it if needed). Returns finrl_concept_available."""
+    if _engine_state["status"] not in ("ready", "failed"):
+        await asyncio.shield(start_warm_up())
+    return finrl_concept_available
+
+def engine_status() -> dict:
+    """{"status": cold/loading/ready/failed, "error", "load_seconds", "tickers", "backend"} for the readiness probe."""
+    return {**_engine_state, "tickers": len(TICKER_LIST_FROM_DATA), "backend": policy_backend.name if policy_backend else None}
+
+# Portfolio actions are cached per (holdings fingerprint, observation state_key).
+PORTFOLIO_CACHE_SIZE = 4096
+
+# Columns reported under key_metrics next to the close price.
+KEY_METRIC_COLUMNS = ['volume', 'macd', 'rsi_30', 'cci_30', 'boll_ub', 'boll_lb', 'dx_30', 'close_30_sma', 'close_60_sma']
+
+_latest_observation = None
+_portfolio_actions_cache = LRUCache(PORTFOLIO_CACHE_SIZE)
+
+def _observation_for(tickers: list[str]) -> LatestObservation:
+    """
+    The observation a request scores: the trade data's latest date (the cached
+    base, rebuilt when the trade data moves to a newer date) with only
+    `tickers` patched from the indicator state, as a copy of its own. Every
+    other ticker keeps its trade data values whatever other requests refreshed.
     """
+    global _latest_observation
+    if _latest_observation is None or _latest_observation.source_date != trade_panel.latest_date:
+        _latest_observation = LatestObservation(trade_panel.latest_slice(), INDICATORS, env_kwargs['initial_amount'])
+    observation = _latest_observation.copy()
+    _patch_from_indicator_state(observation, tickers)
+    return observation
+
+def _patch_from_indicator_state(observation: LatestObservation, tickers: list[str]):
+    """Patches the slots of `tickers` whose indicator state has a bar the observation hasn't seen."""
+    for t in tickers:
+        last_date = indicator_state.last_date(t)
+        if last_date is not None and observation.overrides.get(t) != last_date:
+            observation.patch(t, indicator_state.latest(t))
+
+def get_inference_stats() -> dict:
+    """Throughput and latency metrics of the PPO inference batcher and the portfolio cache."""
     if not finrl_concept_available:
         return {"error": "FinRL model or data not available."}
+    return {**inference_batcher.stats(), "backend": policy_backend.name, "portfolio_cache": _portfolio_actions_cache.stats()}
+
+def normalize_holdings(holdings: dict) -> dict:
+    """
+    Canonical form of a portfolio: {"cash": float, "shares": {ticker: float}}
+    with zero positions and tickers outside the model's universe dropped.
+    Missing cash defaults to the training environment's initial amount.
+    """
+    holdings = holdings or {}
+    cash = holdings.get("cash")
+    shares = {
+        ticker.upper(): float(count)
+        for ticker, count in (holdings.get("shares") or {}).items()
+        if count and ticker.upper() in ACTION_SLOTS
+    }
+    return {
+        "cash": float(env_kwargs['initial_amount'] if cash is None else cash),
+        "shares": dict(sorted(shares.items())),
+    }
+
+def holdings_fingerprint(holdings: dict) -> str:
+    """Stable hash of normalized holdings; equal portfolios share predictions."""
+    return hashlib.sha1(json.dumps(holdings, sort_keys=True).encode()).hexdigest()
+
+@instrumented("finrl.refresh_indicators")
+async def _refresh_indicator_state(tickers: list[str], days: int, history: dict):
+    """
+    Brings the indicator state up to date for `tickers`. Only bars newer than the
+    state are needed: a full warm-up window for tickers never seen, the missed
+    days for everyone else.
+    """
+    history = dict(history or {})
+    session = last_completed_session()
+    fetch_days = {}
+    for t in tickers:
+        if t not in indicator_state.slots:
+            continue
+        last_date = indicator_state.last_date(t)
+        provided = history.get(t)
+        if last_date is None:
+            if provided is None or days < INDICATOR_WARMUP_DAYS:
+                fetch_days[t] = max(days, INDICATOR_WARMUP_DAYS)
+        elif last_date >= session:
+            history.pop(t, None)
+        elif provided is None or provided.empty or pd.Timestamp(provided['date'].min()) > last_date:
+            # The window ends with `session`; reaching back to last_date is enough.
+            fetch_days[t] = (session - last_date).days + 1
+
+    if fetch_days:
+        # One multi-ticker download over the longest window; the history store
+        # only goes upstream for bars it doesn't already have.
+        history.update(await asyncio.to_thread(get_bulk_historical_data, list(fetch_days), max(fetch_days.values())))
+
+    new_bars = [history[t] for t in tickers if t in history and not history[t].empty]
+    if not new_bars:
+        return
+    # Catching up a cold state replays up to a year of daily steps; keep that
+    # off the event loop.
+    async with _indicator_state_lock:
+        applied = await asyncio.to_thread(indicator_state.update, pd.concat(new_bars, ignore_index=True))
+    if applied:
+        _save_indicator_state()
+
+async def refresh_indicators(tickers: list[str], days: int = 90) -> list[str]:
+    """
+    Brings the indicator state up to date for `tickers` without scoring them.
+    Returns the tickers whose state now reaches the last completed session.
+    """
+    if not await wait_until_ready():
+        return []
+    await _refresh_indicator_state(tickers, days, None)
+    session = last_completed_session()
+    return [t for t in tickers if indicator_state.last_date(t) is not None and indicator_state.last_date(t) >= session]
+
+def _snapshot_metrics(observation: LatestObservation, tickers: list[str]) -> dict:
+    return {
+        ticker: {
+            "close_price": observation.value(ticker, 'close'),
+            **{column: observation.value(ticker, column) for column in KEY_METRIC_COLUMNS},
+        }
+        for ticker in tickers if ticker in observation.slots
+    }
+
+def _build_predictions(tickers: list[str], actions: np.ndarray, key_metrics: dict, prediction_date: str) -> dict:
+    predictions = {}
+    for ticker in tickers:
+        try:
+            ticker_action_value = actions[ACTION_SLOTS[ticker]]
+            
+            if ticker_action_value > 0.05:
+                recommended_action = "BUY"
+            elif ticker_action_value < -0.05:
+                recommended_action = "SELL"
+            else:
+                recommended_action = "HOLD"
+
+            predictions[ticker] = {
+                "ticker": ticker,
+                "prediction_date": prediction_date,
+                "recommended_action": recommended_action,
+                "action_value": float(ticker_action_value),
+                "key_metrics": key_metrics[ticker],
+                "reasoning_prompt": f"Inference engine analysis for {ticker} on {prediction_date}."
+            }
+        except Exception as e:
+            print(f"Backend: Error building prediction for ticker {ticker}: {e}")
+            predictions[ticker] = {"error": f"Could not get prediction for {ticker}."}
+    return predictions
+
+@instrumented("finrl.predictions")
+async def get_batch_dynamic_finrl_predictions(tickers: list[str], days: int = 90, history: dict = None, holdings: dict = None):
+    """
+    Uses the loaded FinRL PPO model to get predictions for the given tickers.
+    Indicators come from the incremental indicator state, so only bars newer
+    than its snapshot are downloaded. Callers that already fetched recent
+    history (`days` long) can pass it in as a {ticker: DataFrame} dict; it is
+    used whenever it covers the missing bars.
+
+    `holdings` ({"cash", "shares": {ticker: count}}) puts a user's portfolio in
+    the state; without it the model sees the training environment's starting
+    cash and no positions.
+    """
+    if not await wait_until_ready():
+        return {"error": "FinRL model or data not available."}
 
     try:
-        latest_trade_date = trade_df['date'].max()
-        latest_df = trade_df[trade_df['date'] == latest_trade_date].sort_values(by='tic').reset_index(drop=True)
-
-        for t in tickers:
-            hist_df = get_historical_data(t, days=days)
-            if not hist_df.empty:
-                processed_df = preprocess_for_finrl(hist_df)
-                latest_processed_df = processed_df[processed_df['date'] == processed_df['date'].max()]
-                
-                ticker_index = latest_df.index[latest_df['tic'] == t].tolist()
-                if ticker_index:
-                    for col in latest_processed_df.columns:
-                        if col in latest_df.columns:
-                            latest_df.loc[ticker_index[0], col] = latest_processed_df[col].values[0]
-
-        stock_dimension = len(TICKER_LIST_FROM_DATA)
-        
-        initial_amount = env_kwargs['initial_amount']
-        close_prices = latest_df['close'].values
-        shares_owned = np.zeros(stock_dimension)
-
-        indicator_values = []
-        for indicator in INDICATORS:
-            indicator_values.extend(latest_df[indicator].values)
-
-        obs = np.hstack([
-            np.array([initial_amount]), 
-            shares_owned, 
-            close_prices, 
-            np.array(indicator_values)
-        ]).astype(np.float32).reshape(1, -1)
-
-        obs_tensor = torch.as_tensor(obs).to(model_ppo.policy.device)
-
-        distribution = model_ppo.policy.get_distribution(obs_tensor)
-        actions = distribution.get_actions(deterministic=True).clamp(-1, 1)
-        actions = actions.detach().cpu().numpy()[0]
-
-        predictions = {}
-        for i, ticker in enumerate(tickers):
-            try:
-                ticker_idx_in_full_list = TICKER_LIST_FROM_DATA.index(ticker)
-                ticker_action_value = actions[ticker_idx_in_full_list]
-                
-                if ticker_action_value > 0.05:
-                    recommended_action = "BUY"
-                elif ticker_action_value < -0.05:
-                    recommended_action = "SELL"
-                else:
-                    recommended_action = "HOLD"
-
-                ticker_data = latest_df[latest_df['tic'] == ticker].iloc[0]
-
-                predictions[ticker] = {
-                    "ticker": ticker,
-                    "prediction_date": latest_df['date'].max().strftime('%Y-%m-%d'),
-                    "recommended_action": recommended_action,
-                    "action_value": float(ticker_action_value),
-                    "key_metrics": {
-                        "close_price": ticker_data['close'],
-                        "volume": ticker_data['volume'],
-                        "macd": ticker_data['macd'],
-                        "rsi_30": ticker_data['rsi_30'],
-                        "cci_30": ticker_data['cci_30'],
-                        "boll_ub": ticker_data['boll_ub'],
-                        "boll_lb": ticker_data['boll_lb'],
-                        "dx_30": ticker_data['dx_30'],
-                        "close_30_sma": ticker_data['close_30_sma'],
-                        "close_60_sma": ticker_data['close_60_sma']
-                    },
-                    "reasoning_prompt": f"Inference engine analysis for {ticker} on {latest_df['date'].max().strftime('%Y-%m-%d')}."
-                }
-            except Exception as e:
-                print(f"Backend: Error building prediction for ticker {ticker}: {e}")
-                predictions[ticker] = {"error": f"Could not get prediction for {ticker}."}
-        return predictions
+        await _refresh_indicator_state(tickers, days, history)
+        async with _indicator_state_lock:
+            observation = _observation_for(tickers)
+
+        prediction_date = observation.prediction_date.strftime('%Y-%m-%d')
+        key_metrics = _snapshot_metrics(observation, tickers)
+        if holdings is None:
+            actions = await inference_batcher.submit(observation.observation)
+        else:
+            holdings = normalize_holdings(holdings)
+            cache_key = (holdings_fingerprint(holdings), observation.state_key)
+            actions = _portfolio_actions_cache.get(cache_key)
+            if actions is None:
+                actions = await inference_batcher.submit(observation.with_holdings(holdings["cash"], holdings["shares"]))
+                _portfolio_actions_cache.set(cache_key, actions)
+
+        return _build_predictions(tickers, actions, key_metrics, prediction_date)
 
     except Exception as e:
         print(f"Backend: Error during batch dynamic FinRL prediction: {e}")
         return {"error": "Could not get batch dynamic FinRL predictions."}
+
+@instrumented("finrl.portfolio_predictions")
+async def get_portfolio_predictions(portfolios: dict, tickers: list[str] = None, days: int = 90) -> dict:
+    """
+    Scores many users' portfolios at once. `portfolios` maps user_id to holdings.
+    Each user gets predictions for `tickers`, or for the tickers they hold when
+    `tickers` is None. Portfolios not already cached are encoded into one
+    (rows, state_space) array and run as a single forward pass; users with
+    identical holdings share a row. Returns {user_id: predictions}.
+    """
+    if not await wait_until_ready():
+        return {"error": "FinRL model or data not available."}
+
+    try:
+        normalized = {user_id: normalize_holdings(holdings) for user_id, holdings in portfolios.items()}
+        user_tickers = {
+            user_id: list(tickers) if tickers is not None else list(holdings["shares"])
+            for user_id, holdings in normalized.items()
+        }
+        all_tickers = list(dict.fromkeys(t for ticker_list in user_tickers.values() for t in ticker_list))
+        await _refresh_indicator_state(all_tickers, days, None)
+        async with _indicator_state_lock:
+            observation = _observation_for(all_tickers)
+
+        prediction_date = observation.prediction_date.strftime('%Y-%m-%d')
+        key_metrics = _snapshot_metrics(observation, all_tickers)
+        state_key = observation.state_key
+
+        fingerprints = {user_id: holdings_fingerprint(holdings) for user_id, holdings in normalized.items()}
+        actions_by_fingerprint = {}
+        missing = {}
+        for user_id, fingerprint in fingerprints.items():
+            if fingerprint in actions_by_fingerprint or fingerprint in missing:
+                continue
+            cached = _portfolio_actions_cache.get((fingerprint, state_key))
+            if cached is not None:
+                actions_by_fingerprint[fingerprint] = cached
+            else:
+                holdings = normalized[user_id]
+                missing[fingerprint] = observation.with_holdings(holdings["cash"], holdings["shares"])
+
+        if missing:
+            outputs = await inference_batcher.submit_batch(np.stack(list(missing.values())))
+            for fingerprint, actions in zip(missing, outputs):
+                _portfolio_actions_cache.set((fingerprint, state_key), actions)
+                actions_by_fingerprint[fingerprint] = actions
+
+        return {
+            user_id: _build_predictions(user_tickers[user_id], actions_by_fingerprint[fingerprint], key_metrics, prediction_date)
+            for user_id, fingerprint in fingerprints.items()
+        }
+
+    except Exception as e:
+        print(f"Backend: Error during portfolio FinRL prediction: {e}")
+        return {"error": "Could not get portfolio FinRL predictions."}
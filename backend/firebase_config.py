@@ -1,17 +1,26 @@
-import firebase_admin
-from firebase_admin import credentials, firestore
 import os
+from lazy_imports import LazyModule, LazyObject
 
 # Path to your service account key file
 # Make sure this file is NOT committed to your Git repository!
 SERVICE_ACCOUNT_KEY_PATH = os.path.join(os.path.dirname(__file__), 'serviceAccountKey.json')
 
-# Initialize Firebase Admin SDK
-if not firebase_admin._apps:
-    cred = credentials.Certificate(SERVICE_ACCOUNT_KEY_PATH)
-    firebase_admin.initialize_app(cred)
-    print("Firebase Admin SDK initialized successfully.")
-else:
-    print("Firebase Admin SDK already initialized.")
+# The Firebase SDK is imported and initialized on first use (or by the startup
+# warm-up), not when this module is imported.
+firestore = LazyModule("firebase_admin.firestore")
 
-db = firestore.client()
+def _create_client():
+    import firebase_admin
+    from firebase_admin import credentials
+
+    # Initialize Firebase Admin SDK
+    if not firebase_admin._apps:
+        cred = credentials.Certificate(SERVICE_ACCOUNT_KEY_PATH)
+        firebase_admin.initialize_app(cred)
+        print("Firebase Admin SDK initialized successfully.")
+    else:
+        print("Firebase Admin SDK already initialized.")
+
+    return firestore.client()
+
+db = LazyObject(_create_client)
@@ -0,0 +1,258 @@
+# backend/history_store.py
+"""
+Local OHLCV history store.
+
+Daily bars are kept in an SQLite database (WAL mode, so any number of readers
+run alongside a writer). A request for a date range is served from disk; only
+the part of the range the store has never covered is downloaded, and the new
+bars are merged in. Repeat requests for a range already covered don't touch the
+network.
+
+Seed it from the trade data (from the backend directory):
+    python history_store.py
+"""
+import os
+import sqlite3
+import threading
+import time
+import pandas as pd
+from indicators import OHLCV_COLUMNS
+
+HISTORY_DB_PATH = os.getenv("HISTORY_DB_PATH", "inference_engine/history.sqlite3")
+
+# When an upstream fetch for missing trailing bars comes back without them (a
+# holiday, or the day's bar isn't published yet), the range is re-checked after
+# this long. Failed downloads aren't throttled; the next request retries them.
+HISTORY_RECHECK_SECONDS = 3600
+
+# Tickers are striped over this many locks, so the lock table doesn't grow with
+# every ticker ever requested; tickers sharing a stripe wait for each other.
+HISTORY_LOCK_STRIPES = 64
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS bars (
+    tic TEXT NOT NULL,
+    date TEXT NOT NULL,
+    open REAL, high REAL, low REAL, close REAL, volume REAL,
+    PRIMARY KEY (tic, date)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS coverage (
+    tic TEXT PRIMARY KEY,
+    start_date TEXT NOT NULL,
+    end_date TEXT NOT NULL,
+    checked_at REAL NOT NULL
+);
+"""
+
+class HistoryStore:
+    """
+    Per-ticker daily bars on disk. `coverage` records, for each ticker, the
+    [start_date, end_date) range already fetched from upstream, so gaps are
+    detected without scanning the bars, and `checked_at`, when a fetch for
+    the bars after end_date last came back without them (0 if it didn't).
+    """
+
+    def __init__(self, path: str = HISTORY_DB_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._locks = [threading.Lock() for _ in range(HISTORY_LOCK_STRIPES)]
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        connection = self._connection()
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.executescript(_SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite3 connections can't be shared between threads; keep one per thread.
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def _ticker_lock(self, ticker: str) -> threading.Lock:
+        return self._locks[hash(ticker) % HISTORY_LOCK_STRIPES]
+
+    def coverage(self, ticker: str):
+        """(start_date, end_date, checked_at) of the range fetched for `ticker`, or None."""
+        row = self._connection().execute(
+            "SELECT start_date, end_date, checked_at FROM coverage WHERE tic = ?", (ticker,)
+        ).fetchone()
+        if row is None:
+            return None
+        return pd.Timestamp(row[0]), pd.Timestamp(row[1]), row[2]
+
+    def read(self, ticker: str, start: pd.Timestamp, end: pd.Timestamp) -> pd.DataFrame:
+        """Stored bars for `ticker` with start <= date < end, oldest first."""
+        df = pd.read_sql_query(
+            "SELECT date, open, high, low, close, volume FROM bars WHERE tic = ? AND date >= ? AND date < ? ORDER BY date",
+            self._connection(),
+            params=(ticker, _day(start), _day(end)),
+        )
+        if df.empty:
+            return pd.DataFrame()
+        df['date'] = pd.to_datetime(df['date'])
+        df['tic'] = ticker
+        return df
+
+    def write(self, df: pd.DataFrame):
+        """Upserts bars from a long frame with date, tic and OHLCV columns."""
+        if df is None or df.empty:
+            return
+        rows = zip(
+            df['tic'],
+            pd.to_datetime(df['date']).dt.strftime('%Y-%m-%d'),
+            *(df[column].astype(float) for column in OHLCV_COLUMNS),
+        )
+        with self._connection() as connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO bars (tic, date, open, high, low, close, volume) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+
+    def _set_coverage(self, ticker: str, start: pd.Timestamp, end: pd.Timestamp, checked_at: float):
+        with self._connection() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO coverage (tic, start_date, end_date, checked_at) VALUES (?, ?, ?, ?)",
+                (ticker, _day(start), _day(end), checked_at),
+            )
+
+    def _plan(self, ticker: str, start: pd.Timestamp, end: pd.Timestamp):
+        """
+        Returns the (start, end) range to download so that [start, end) is
+        covered, or None if nothing needs fetching, plus the current coverage.
+        """
+        covered = self.coverage(ticker)
+        if covered is None:
+            return (start, end), None
+        covered_start, covered_end, checked_at = covered
+        if end > covered_end and not len(pd.bdate_range(covered_end, end - pd.Timedelta(days=1))):
+            # Only a weekend is missing; there are no bars to fetch.
+            covered_end = end
+            self._set_coverage(ticker, covered_start, covered_end, checked_at)
+            covered = (covered_start, covered_end, checked_at)
+
+        fetch_start = fetch_end = None
+        if start < covered_start:
+            fetch_start, fetch_end = start, covered_start
+        if end > covered_end and time.time() - checked_at >= HISTORY_RECHECK_SECONDS:
+            fetch_start = covered_end if fetch_start is None else fetch_start
+            fetch_end = end
+        return ((fetch_start, fetch_end) if fetch_start is not None else None), covered
+
+    def _record_fetch(self, ticker: str, covered, fetch_start: pd.Timestamp, fetch_end: pd.Timestamp, fetched: pd.DataFrame):
+        """
+        Stores downloaded bars and widens the ticker's coverage to what the
+        download settled. `fetched` is None when the download failed, which
+        settles nothing.
+        """
+        if fetched is None:
+            return
+        self.write(fetched)
+        got_bars = not fetched.empty
+        if covered is None:
+            if got_bars:
+                self._set_coverage(ticker, fetch_start, fetch_end, 0.0)
+            return
+        covered_start, covered_end, checked_at = covered
+        # Before a listing date upstream has nothing; the leading range counts as covered anyway.
+        covered_start = min(covered_start, fetch_start)
+        if fetch_end > covered_end:
+            if got_bars and pd.Timestamp(pd.to_datetime(fetched['date']).max()) >= covered_end:
+                covered_end, checked_at = fetch_end, 0.0
+            else:
+                checked_at = time.time()
+        self._set_coverage(ticker, covered_start, covered_end, checked_at)
+
+    def get_history(self, ticker: str, start: pd.Timestamp, end: pd.Timestamp, fetch) -> pd.DataFrame:
+        """
+        Bars for `ticker` with start <= date < end. Parts of the range never
+        covered before are downloaded with `fetch(ticker, start, end)` (returning
+        a long OHLCV frame, or None if the download failed) and stored first. Only one thread fills a ticker's
+        gaps at a time; the others wait and then read what it stored.
+        """
+        start, end = pd.Timestamp(start).normalize(), pd.Timestamp(end).normalize()
+        with self._ticker_lock(ticker):
+            fetch_range, covered = self._plan(ticker, start, end)
+            if fetch_range is not None:
+                self._record_fetch(ticker, covered, *fetch_range, fetch(ticker, *fetch_range))
+        return self.read(ticker, start, end)
+
+    def get_histories(self, tickers: list[str], start: pd.Timestamp, end: pd.Timestamp, fetch_many, fetch) -> dict:
+        """
+        Like get_history for many tickers. Every ticker with something missing
+        is downloaded in a single `fetch_many(tickers, start, end)` call over
+        the union of their missing ranges (returning {ticker: frame}); tickers
+        that call doesn't return fall back to `fetch` one by one.
+        Returns {ticker: DataFrame}.
+        """
+        start, end = pd.Timestamp(start).normalize(), pd.Timestamp(end).normalize()
+        tickers = list(dict.fromkeys(tickers))
+        # Each stripe once, in a fixed order, so overlapping bulk requests can't deadlock.
+        locks = [self._locks[stripe] for stripe in sorted({hash(t) % HISTORY_LOCK_STRIPES for t in tickers})]
+        failed = []
+        for lock in locks:
+            lock.acquire()
+        try:
+            plans = {t: self._plan(t, start, end) for t in tickers}
+            needed = {t: plan for t, plan in plans.items() if plan[0] is not None}
+            if needed:
+                fetch_start = min(fetch_range[0] for fetch_range, _ in needed.values())
+                fetch_end = max(fetch_range[1] for fetch_range, _ in needed.values())
+                try:
+                    fetched = fetch_many(list(needed), fetch_start, fetch_end)
+                except Exception as e:
+                    print(f"Error in bulk history download, falling back to per-ticker downloads: {e}")
+                    fetched = {}
+                for t, (_, covered) in needed.items():
+                    frame = fetched.get(t)
+                    if frame is None or frame.empty:
+                        failed.append(t)
+                    else:
+                        self._record_fetch(t, covered, fetch_start, fetch_end, frame)
+        finally:
+            for lock in locks:
+                lock.release()
+
+        for t in failed:
+            self.get_history(t, start, end, fetch)
+        return {t: self.read(t, start, end) for t in tickers}
+
+    def seed(self, df: pd.DataFrame):
+        """
+        Loads bars from a long OHLCV frame (e.g. the trade data) and marks each
+        ticker's span of dates as covered, keeping any wider coverage already stored.
+        """
+        df = df.dropna(subset=['close'])
+        self.write(df)
+        dates = pd.to_datetime(df['date'])
+        for ticker, span in dates.groupby(df['tic']).agg(['min', 'max']).iterrows():
+            start, end = span['min'].normalize(), span['max'].normalize() + pd.Timedelta(days=1)
+            covered = self.coverage(ticker)
+            if covered is not None:
+                start, end = min(start, covered[0]), max(end, covered[1])
+            self._set_coverage(ticker, start, end, covered[2] if covered is not None else 0.0)
+
+def _day(timestamp) -> str:
+    return pd.Timestamp(timestamp).strftime('%Y-%m-%d')
+
+_store = None
+_store_guard = threading.Lock()
+
+def get_history_store() -> HistoryStore:
+    """The process-wide store, opened on first use."""
+    global _store
+    with _store_guard:
+        if _store is None:
+            _store = HistoryStore()
+        return _store
+
+if __name__ == "__main__":
+    from trade_store import load_trade_panel
+    panel = load_trade_panel()
+    frame = panel.to_long_frame(['tic', *OHLCV_COLUMNS])
+    print(f"Seeding {HISTORY_DB_PATH} with {len(frame)} bars for {len(panel.tickers)} tickers...")
+    get_history_store().seed(frame)
+    print("Done.")
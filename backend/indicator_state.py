@@ -0,0 +1,219 @@
+# backend/indicator_state.py
+import os
+import numpy as np
+import pandas as pd
+from indicators import (
+    BOLL_STD_TIMES,
+    BOLL_WINDOW,
+    CCI_WINDOW,
+    DX_WINDOW,
+    INDICATOR_COLUMNS,
+    MACD_LONG_WINDOW,
+    MACD_SHORT_WINDOW,
+    OHLCV_COLUMNS,
+    RSI_WINDOW,
+    SMA_WINDOWS,
+)
+
+# Exponentially weighted running averages kept per ticker, with their alpha.
+_EWM_ALPHAS = {
+    'ema_short': 2.0 / (MACD_SHORT_WINDOW + 1.0),
+    'ema_long': 2.0 / (MACD_LONG_WINDOW + 1.0),
+    'rsi_up': 1.0 / RSI_WINDOW,
+    'rsi_down': 1.0 / RSI_WINDOW,
+    'pdm': 1.0 / DX_WINDOW,
+    'ndm': 1.0 / DX_WINDOW,
+    'tr': 1.0 / DX_WINDOW,
+}
+_CLOSE_BUFFER = max(BOLL_WINDOW, *SMA_WINDOWS)
+_TP_BUFFER = CCI_WINDOW
+
+class IndicatorState:
+    """
+    Rolling indicator state for a fixed ticker universe.
+
+    Each new daily bar updates a ticker in constant time: the EMA-based MACD and
+    the Wilder-smoothed RSI/DX keep adjusted running sums, and the SMA, Bollinger
+    and CCI windows keep the last few closes / typical prices. Values match
+    indicators.compute_indicator_panel over the ticker's whole ingested history.
+    """
+
+    def __init__(self, tickers: list[str]):
+        self.tickers = list(tickers)
+        self.slots = {ticker: i for i, ticker in enumerate(self.tickers)}
+        n = len(self.tickers)
+        self.count = np.zeros(n, dtype=np.int64)
+        self.last_dates = np.full(n, np.datetime64('NaT'), dtype='datetime64[D]')
+        self.prev = {column: np.full(n, np.nan) for column in ('high', 'low', 'close')}
+        self.ewm_sum = {name: np.zeros(n) for name in _EWM_ALPHAS}
+        self.ewm_total = {name: np.zeros(n) for name in _EWM_ALPHAS}
+        self.close_buffer = np.full((n, _CLOSE_BUFFER), np.nan)
+        self.tp_buffer = np.full((n, _TP_BUFFER), np.nan)
+        self.values = {column: np.full(n, np.nan) for column in OHLCV_COLUMNS + INDICATOR_COLUMNS}
+
+    def last_date(self, ticker: str):
+        """Date of the newest bar ingested for `ticker`, or None."""
+        slot = self.slots.get(ticker)
+        if slot is None or np.isnat(self.last_dates[slot]):
+            return None
+        return pd.Timestamp(self.last_dates[slot])
+
+    def latest(self, ticker: str) -> dict:
+        """Latest OHLCV values and indicators for `ticker` (empty if never updated)."""
+        slot = self.slots.get(ticker)
+        if slot is None or self.count[slot] == 0:
+            return {}
+        row = {column: self.values[column][slot] for column in self.values}
+        row['date'] = pd.Timestamp(self.last_dates[slot])
+        row['tic'] = ticker
+        return row
+
+    def _ewm(self, name: str, slots: np.ndarray, value: np.ndarray) -> np.ndarray:
+        decay = 1.0 - _EWM_ALPHAS[name]
+        self.ewm_sum[name][slots] = value + decay * self.ewm_sum[name][slots]
+        self.ewm_total[name][slots] = 1.0 + decay * self.ewm_total[name][slots]
+        return self.ewm_sum[name][slots] / self.ewm_total[name][slots]
+
+    def _update_slots(self, slots: np.ndarray, date, bars: dict):
+        """Applies one bar per slot. `bars` maps OHLCV columns to arrays aligned with `slots`."""
+        high, low, close = bars['high'], bars['low'], bars['close']
+        first_bar = self.count[slots] == 0
+        prev_close = np.where(first_bar, close, self.prev['close'][slots])
+        prev_high = np.where(first_bar, high, self.prev['high'][slots])
+        prev_low = np.where(first_bar, low, self.prev['low'][slots])
+        self.count[slots] += 1
+        count = self.count[slots]
+
+        macd = self._ewm('ema_short', slots, close) - self._ewm('ema_long', slots, close)
+
+        change = close - prev_close
+        up = self._ewm('rsi_up', slots, np.where(change > 0, change, 0.0))
+        down = self._ewm('rsi_down', slots, np.where(change < 0, -change, 0.0))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            rsi = np.where(up + down != 0, 100 * (up / (up + down)), 50.0)
+
+        self.close_buffer[slots, :-1] = self.close_buffer[slots, 1:]
+        self.close_buffer[slots, -1] = close
+        self.tp_buffer[slots, :-1] = self.tp_buffer[slots, 1:]
+        typical_price = (close + high + low) / 3.0
+        self.tp_buffer[slots, -1] = typical_price
+
+        tp_window = self.tp_buffer[slots]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            tp_sma = np.nanmean(tp_window, axis=1)
+            mad = np.mean(np.abs(tp_window - tp_window.mean(axis=1, keepdims=True)), axis=1)
+        # Like stockstats, the mean deviation is 0 until a full window exists.
+        divisor = 0.015 * np.where(count >= CCI_WINDOW, mad, 0.0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            cci = np.where(divisor != 0, (typical_price - tp_sma) / divisor, 0.0)
+
+        boll_window = self.close_buffer[slots, -BOLL_WINDOW:]
+        boll_count = np.sum(~np.isnan(boll_window), axis=1)
+        boll_mid = np.nanmean(boll_window, axis=1)
+        squared_deviation = np.nansum((boll_window - boll_mid[:, None]) ** 2, axis=1)
+        # A single bar has no deviation yet; use a zero-width band.
+        boll_std = np.sqrt(squared_deviation / np.maximum(boll_count - 1, 1))
+
+        high_diff = high - prev_high
+        low_diff = -(low - prev_low)
+        pdm = self._ewm('pdm', slots, np.where((high_diff > 0) & (high_diff > low_diff), high_diff, 0.0))
+        ndm = self._ewm('ndm', slots, np.where((low_diff > 0) & (low_diff > high_diff), low_diff, 0.0))
+        true_range = np.maximum(high - low, np.maximum(np.abs(high - prev_close), np.abs(low - prev_close)))
+        atr = self._ewm('tr', slots, true_range)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            pdi = pdm / atr * 100
+            ndi = ndm / atr * 100
+            dx = np.where(pdi + ndi != 0, np.abs(pdi - ndi) / (pdi + ndi), 0.0) * 100
+
+        for column in OHLCV_COLUMNS:
+            self.values[column][slots] = bars[column]
+        self.values['macd'][slots] = macd
+        self.values['rsi_30'][slots] = rsi
+        self.values['cci_30'][slots] = cci
+        self.values['boll_ub'][slots] = boll_mid + BOLL_STD_TIMES * boll_std
+        self.values['boll_lb'][slots] = boll_mid - BOLL_STD_TIMES * boll_std
+        self.values['dx_30'][slots] = dx
+        for window in SMA_WINDOWS:
+            with np.errstate(invalid='ignore'):
+                self.values[f'close_{window}_sma'][slots] = np.nanmean(self.close_buffer[slots, -window:], axis=1)
+
+        self.prev['high'][slots] = high
+        self.prev['low'][slots] = low
+        self.prev['close'][slots] = close
+        self.last_dates[slots] = np.datetime64(pd.Timestamp(date).date(), 'D')
+
+    def update(self, df: pd.DataFrame) -> int:
+        """
+        Ingests daily bars from a long OHLCV frame (date, tic, open, high, low,
+        close, volume). Bars for unknown tickers, or not newer than a ticker's
+        last ingested bar, are skipped. Bars are applied date by date, every
+        ticker with a bar on that date in one vectorized step. Returns the
+        number of bars applied.
+        """
+        if df.empty:
+            return 0
+        bars = df[df['tic'].isin(self.slots)].copy()
+        bars['date'] = pd.to_datetime(bars['date']).dt.normalize()
+        bars['slot'] = bars['tic'].map(self.slots)
+        last_dates = pd.to_datetime(self.last_dates[bars['slot'].to_numpy()])
+        bars = bars[last_dates.isna() | (bars['date'].to_numpy() > last_dates)]
+        bars = bars.drop_duplicates(['date', 'slot'], keep='last').sort_values(['date', 'slot'])
+
+        for date, day in bars.groupby('date', sort=True):
+            slots = day['slot'].to_numpy()
+            self._update_slots(slots, date, {column: day[column].to_numpy(dtype=np.float64) for column in OHLCV_COLUMNS})
+        return len(bars)
+
+    def snapshot(self) -> dict:
+        """Copies of the state's arrays, for write_snapshot() while updates continue."""
+        arrays = {
+            'tickers': np.asarray(self.tickers),
+            'count': self.count.copy(),
+            'last_dates': self.last_dates.copy(),
+            'close_buffer': self.close_buffer.copy(),
+            'tp_buffer': self.tp_buffer.copy(),
+        }
+        for column, values in self.prev.items():
+            arrays[f'prev_{column}'] = values.copy()
+        for name in _EWM_ALPHAS:
+            arrays[f'ewm_sum_{name}'] = self.ewm_sum[name].copy()
+            arrays[f'ewm_total_{name}'] = self.ewm_total[name].copy()
+        for column, values in self.values.items():
+            arrays[f'value_{column}'] = values.copy()
+        return arrays
+
+    def save(self, path: str):
+        """Writes a snapshot of the state to `path` (.npz), replacing it atomically."""
+        write_snapshot(path, self.snapshot())
+
+    @classmethod
+    def load(cls, path: str, tickers: list[str] = None):
+        """
+        Restores a snapshot written by save(). If `tickers` is given, the state is
+        re-slotted to that universe; tickers missing from the snapshot start empty.
+        """
+        with np.load(path, allow_pickle=False) as data:
+            saved_tickers = data['tickers'].tolist()
+            state = cls(tickers if tickers is not None else saved_tickers)
+            saved_slots = {ticker: i for i, ticker in enumerate(saved_tickers)}
+            target = np.array([i for i, t in enumerate(state.tickers) if t in saved_slots], dtype=np.int64)
+            source = np.array([saved_slots[t] for t in state.tickers if t in saved_slots], dtype=np.int64)
+
+            state.count[target] = data['count'][source]
+            state.last_dates[target] = data['last_dates'][source]
+            state.close_buffer[target] = data['close_buffer'][source]
+            state.tp_buffer[target] = data['tp_buffer'][source]
+            for column in state.prev:
+                state.prev[column][target] = data[f'prev_{column}'][source]
+            for name in _EWM_ALPHAS:
+                state.ewm_sum[name][target] = data[f'ewm_sum_{name}'][source]
+                state.ewm_total[name][target] = data[f'ewm_total_{name}'][source]
+            for column in state.values:
+                state.values[column][target] = data[f'value_{column}'][source]
+        return state
+
+def write_snapshot(path: str, arrays: dict):
+    """Writes arrays from IndicatorState.snapshot() to `path` (.npz), replacing it atomically."""
+    tmp_path = f"{path}.tmp.npz"
+    np.savez(tmp_path, **arrays)
+    os.replace(tmp_path, path)
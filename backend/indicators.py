@@ -0,0 +1,214 @@
+# backend/indicators.py
+import numpy as np
+import pandas as pd
+
+# The technical indicators the FinRL model was trained on (same names as
+# finrl.config.INDICATORS).
+INDICATOR_COLUMNS = ['macd', 'rsi_30', 'cci_30', 'boll_ub', 'boll_lb', 'dx_30', 'close_30_sma', 'close_60_sma']
+OHLCV_COLUMNS = ['open', 'high', 'low', 'close', 'volume']
+
+MACD_SHORT_WINDOW = 12
+MACD_LONG_WINDOW = 26
+RSI_WINDOW = 30
+CCI_WINDOW = 30
+DX_WINDOW = 30
+BOLL_WINDOW = 20
+BOLL_STD_TIMES = 2
+SMA_WINDOWS = (30, 60)
+
+# The panel engine reproduces stockstats (0.6.x) to within this tolerance on
+# dense daily data; see benchmarks/indicator_parity.py.
+PARITY_RTOL = 1e-6
+PARITY_ATOL = 1e-6
+
+# Rows processed at once for the windowed mean absolute deviation, which
+# needs a (rows, tickers, window) temporary.
+_MAD_CHUNK_ROWS = 256
+
+# All functions below take (dates x tickers) float arrays. A ticker may start
+# later than the panel (leading NaN rows, e.g. a recent listing); gaps inside
+# a ticker's history are expected to be forward-filled by the caller.
+
+def ewm_mean(values: np.ndarray, alpha: float) -> np.ndarray:
+    """
+    Adjusted exponentially weighted mean down the date axis, matching
+    pandas' ewm(alpha=alpha, adjust=True).mean() for each column.
+    """
+    decay = 1.0 - alpha
+    valid = ~np.isnan(values)
+    filled = np.where(valid, values, 0.0)
+    weighted_sum = np.empty(values.shape)
+    weight_total = np.empty(values.shape)
+    running_sum = np.zeros(values.shape[1:])
+    running_total = np.zeros(values.shape[1:])
+    # Leading NaN rows contribute nothing, so each ticker's average starts at
+    # its first bar exactly as it would on that ticker's own series.
+    for t in range(values.shape[0]):
+        running_sum = filled[t] + decay * running_sum
+        running_total = valid[t] + decay * running_total
+        weighted_sum[t] = running_sum
+        weight_total[t] = running_total
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(valid, weighted_sum / weight_total, np.nan)
+
+def ema(values: np.ndarray, window: int) -> np.ndarray:
+    return ewm_mean(values, 2.0 / (window + 1.0))
+
+def smma(values: np.ndarray, window: int) -> np.ndarray:
+    return ewm_mean(values, 1.0 / window)
+
+def _rolling_sums(values: np.ndarray, window: int):
+    valid = ~np.isnan(values)
+    filled = np.where(valid, values, 0.0)
+    zeros = np.zeros((1,) + values.shape[1:])
+    cum_sum = np.concatenate([zeros, np.cumsum(filled, axis=0)])
+    cum_count = np.concatenate([zeros, np.cumsum(valid, axis=0)])
+    cum_sq = np.concatenate([zeros, np.cumsum(filled * filled, axis=0)])
+    start = np.maximum(np.arange(values.shape[0]) + 1 - window, 0)
+    end = np.arange(values.shape[0]) + 1
+    return (
+        cum_sum[end] - cum_sum[start],
+        cum_sq[end] - cum_sq[start],
+        cum_count[end] - cum_count[start],
+        valid,
+    )
+
+def rolling_mean(values: np.ndarray, window: int) -> np.ndarray:
+    """Rolling mean with min_periods=1, like stockstats' sma."""
+    total, _, count, valid = _rolling_sums(values, window)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(valid & (count > 0), total / count, np.nan)
+
+def rolling_std(values: np.ndarray, window: int) -> np.ndarray:
+    """Rolling sample standard deviation with min_periods=1, like stockstats' mov_std."""
+    # Centering each column first keeps the sum-of-squares formula accurate.
+    center = np.nanmean(values, axis=0) if values.shape[0] else 0.0
+    total, total_sq, count, valid = _rolling_sums(values - center, window)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        variance = (total_sq - total * total / count) / (count - 1)
+    variance = np.maximum(variance, 0.0)
+    return np.where(valid & (count > 1), np.sqrt(variance), np.nan)
+
+def rolling_mad(values: np.ndarray, window: int) -> np.ndarray:
+    """
+    Rolling mean absolute deviation over full windows only; rows without a
+    full window are 0, like stockstats' _mad.
+    """
+    out = np.where(np.isnan(values), np.nan, 0.0)
+    rows = values.shape[0]
+    if rows < window:
+        return out
+    windows = np.lib.stride_tricks.sliding_window_view(values, window, axis=0)
+    for start in range(0, windows.shape[0], _MAD_CHUNK_ROWS):
+        chunk = windows[start:start + _MAD_CHUNK_ROWS]
+        means = chunk.mean(axis=-1, keepdims=True)
+        mad = np.abs(chunk - means).mean(axis=-1)
+        target = out[window - 1 + start:window - 1 + start + chunk.shape[0]]
+        np.copyto(target, mad, where=~np.isnan(mad))
+    return out
+
+def _previous(values: np.ndarray) -> np.ndarray:
+    """Previous row, with each ticker's first row paired with itself."""
+    previous = np.empty_like(values)
+    previous[0] = values[0]
+    previous[1:] = values[:-1]
+    return np.where(np.isnan(previous), values, previous)
+
+def compute_indicator_panel(high: np.ndarray, low: np.ndarray, close: np.ndarray) -> dict:
+    """
+    Computes every INDICATOR_COLUMNS entry for all tickers at once.
+    Inputs are (dates x tickers) arrays; returns a dict of arrays of the same shape.
+    """
+    high = np.asarray(high, dtype=np.float64)
+    low = np.asarray(low, dtype=np.float64)
+    close = np.asarray(close, dtype=np.float64)
+    result = {}
+
+    result['macd'] = ema(close, MACD_SHORT_WINDOW) - ema(close, MACD_LONG_WINDOW)
+
+    change = close - _previous(close)
+    up_smma = smma(np.where(change > 0, change, np.where(np.isnan(change), np.nan, 0.0)), RSI_WINDOW)
+    down_smma = smma(np.where(change < 0, -change, np.where(np.isnan(change), np.nan, 0.0)), RSI_WINDOW)
+    total_change = up_smma + down_smma
+    with np.errstate(invalid='ignore', divide='ignore'):
+        rsi = np.where(total_change != 0, 100 * (up_smma / total_change), 50.0)
+    result['rsi_30'] = np.where(np.isnan(close), np.nan, rsi)
+
+    typical_price = (close + high + low) / 3.0
+    tp_sma = rolling_mean(typical_price, CCI_WINDOW)
+    divisor = 0.015 * rolling_mad(typical_price, CCI_WINDOW)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        cci = np.where(divisor != 0, (typical_price - tp_sma) / divisor, 0.0)
+    result['cci_30'] = np.where(np.isnan(close), np.nan, cci)
+
+    boll_mid = rolling_mean(close, BOLL_WINDOW)
+    boll_width = BOLL_STD_TIMES * rolling_std(close, BOLL_WINDOW)
+    result['boll_ub'] = boll_mid + boll_width
+    result['boll_lb'] = boll_mid - boll_width
+
+    high_diff = high - _previous(high)
+    low_diff = -(low - _previous(low))
+    nan_mask = np.isnan(close)
+    pdm = np.where(nan_mask, np.nan, np.where((high_diff > 0) & (high_diff > low_diff), high_diff, 0.0))
+    ndm = np.where(nan_mask, np.nan, np.where((low_diff > 0) & (low_diff > high_diff), low_diff, 0.0))
+    prev_close = _previous(close)
+    true_range = np.maximum(high - low, np.maximum(np.abs(high - prev_close), np.abs(low - prev_close)))
+    atr = smma(true_range, DX_WINDOW)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        pdi = smma(pdm, DX_WINDOW) / atr * 100
+        ndi = smma(ndm, DX_WINDOW) / atr * 100
+        di_total = pdi + ndi
+        dx = np.where(di_total != 0, np.abs(pdi - ndi) / di_total, 0.0) * 100
+    result['dx_30'] = np.where(nan_mask, np.nan, dx)
+
+    for window in SMA_WINDOWS:
+        result[f'close_{window}_sma'] = rolling_mean(close, window)
+
+    return result
+
+def _fill_along_dates(values: np.ndarray, backward: bool = False) -> np.ndarray:
+    """Forward-fills (or back-fills) NaNs down the date axis of a panel."""
+    if backward:
+        return _fill_along_dates(values[::-1])[::-1]
+    rows = np.arange(values.shape[0])[:, None]
+    source = np.maximum.accumulate(np.where(np.isnan(values), 0, rows), axis=0)
+    return values[source, np.arange(values.shape[1])]
+
+def build_panel(df: pd.DataFrame):
+    """
+    Pivots a long OHLCV frame (date, tic, open, high, low, close, volume) into
+    a dates x tickers panel. Returns (dates, tickers, {column: array}). Gaps
+    inside a ticker's history are forward-filled; dates before its first bar
+    and after its last one stay NaN.
+    """
+    date_codes, dates = pd.factorize(pd.to_datetime(df['date']), sort=True)
+    ticker_codes, tickers = pd.factorize(df['tic'], sort=True)
+    last_row = np.full(len(tickers), -1)
+    np.maximum.at(last_row, ticker_codes, date_codes)
+    after_last = np.arange(len(dates))[:, None] > last_row[None, :]
+    panel = {}
+    for column in OHLCV_COLUMNS:
+        values = np.full((len(dates), len(tickers)), np.nan)
+        values[date_codes, ticker_codes] = df[column].to_numpy(dtype=np.float64)
+        panel[column] = np.where(after_last, np.nan, _fill_along_dates(values))
+    return pd.DatetimeIndex(dates), list(tickers), panel
+
+def preprocess_panel(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Computes the FinRL indicator columns for a long OHLCV frame holding any
+    number of tickers. Returns the same columns as data_utils.preprocess_for_finrl,
+    ordered by ticker then date, with each ticker's leading NaNs back-filled.
+    """
+    dates, tickers, panel = build_panel(df)
+    indicators = compute_indicator_panel(panel['high'], panel['low'], panel['close'])
+
+    ticker_index, date_index = np.nonzero(~np.isnan(panel['close'].T))
+    processed = pd.DataFrame({'date': dates[date_index]})
+    for column in OHLCV_COLUMNS:
+        processed[column] = panel[column][date_index, ticker_index]
+    processed['tic'] = np.asarray(tickers, dtype=object)[ticker_index]
+    for column in INDICATOR_COLUMNS:
+        # Rows before a ticker's first bar are dropped, so back-filling along the
+        # whole panel only fills that ticker's own leading NaNs.
+        processed[column] = _fill_along_dates(indicators[column], backward=True)[date_index, ticker_index]
+    return processed
@@ -0,0 +1,146 @@
+# backend/inference_batcher.py
+import asyncio
+import os
+import time
+from collections import deque
+import numpy as np
+
+# How long the first observation of a batch waits for others to join it, and
+# the most rows a single forward pass takes.
+INFERENCE_BATCH_WINDOW_MS = float(os.getenv("INFERENCE_BATCH_WINDOW_MS", "5"))
+INFERENCE_MAX_BATCH_SIZE = int(os.getenv("INFERENCE_MAX_BATCH_SIZE", "64"))
+
+# Latency samples kept for the percentile metrics.
+_LATENCY_SAMPLES = 1000
+
+class InferenceBatcher:
+    """
+    Micro-batches policy forward passes.
+
+    Concurrent submit() calls made within the batch window are stacked into one
+    (rows, state_space) array and sent through `predict_fn` in a worker thread,
+    so the event loop never runs the model. Identical observations, whether
+    waiting in the same batch or already in flight, share one row and one
+    result. Forward passes run one at a time; requests arriving meanwhile
+    collect into the next batch.
+    """
+
+    def __init__(self, predict_fn, window_ms: float = INFERENCE_BATCH_WINDOW_MS, max_batch_size: int = INFERENCE_MAX_BATCH_SIZE):
+        self.predict_fn = predict_fn
+        self.window = window_ms / 1000.0
+        self.max_batch_size = max_batch_size
+        self._pending = {}
+        self._inflight = {}
+        self._flush_handle = None
+        self._forward_lock = None
+
+        self._started = time.monotonic()
+        self.requests = 0
+        self.deduplicated = 0
+        self.batches = 0
+        self.rows = 0
+        self.largest_batch = 0
+        self.forward_seconds = 0.0
+        self._latencies = deque(maxlen=_LATENCY_SAMPLES)
+
+    async def submit(self, observation: np.ndarray) -> np.ndarray:
+        """Returns the policy output (one row) for a single observation vector."""
+        started = time.perf_counter()
+        # Copied so the caller may keep mutating its buffer while this waits.
+        observation = np.array(observation, dtype=np.float32).reshape(-1)
+        key = observation.tobytes()
+        self.requests += 1
+
+        future = self._inflight.get(key) or self._pending.get(key, (None, None))[1]
+        if future is not None:
+            self.deduplicated += 1
+        else:
+            future = asyncio.get_running_loop().create_future()
+            self._pending[key] = (observation, future)
+            if len(self._pending) >= self.max_batch_size:
+                self._schedule_flush(0)
+            elif self._flush_handle is None:
+                self._schedule_flush(self.window)
+
+        try:
+            return await asyncio.shield(future)
+        finally:
+            self._latencies.append(time.perf_counter() - started)
+
+    async def submit_batch(self, observations: np.ndarray) -> np.ndarray:
+        """
+        Runs a (rows, state_space) array as one forward pass of its unique rows,
+        bypassing the batch window. Returns one output row per input row.
+        """
+        started = time.perf_counter()
+        observations = np.asarray(observations, dtype=np.float32)
+        unique, inverse = np.unique(observations, axis=0, return_inverse=True)
+        self.requests += len(observations)
+        self.deduplicated += len(observations) - len(unique)
+        if self._forward_lock is None:
+            self._forward_lock = asyncio.Lock()
+        async with self._forward_lock:
+            forward_started = time.perf_counter()
+            outputs = await asyncio.to_thread(self.predict_fn, unique)
+            self.forward_seconds += time.perf_counter() - forward_started
+        self.batches += 1
+        self.rows += len(unique)
+        self.largest_batch = max(self.largest_batch, len(unique))
+        self._latencies.append(time.perf_counter() - started)
+        return np.asarray(outputs)[inverse.reshape(-1)]
+
+    def _schedule_flush(self, delay: float):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+        self._flush_handle = asyncio.get_running_loop().call_later(delay, self._start_flush)
+
+    def _start_flush(self):
+        self._flush_handle = None
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, {}
+        futures = {key: future for key, (_, future) in batch.items()}
+        self._inflight.update(futures)
+        asyncio.ensure_future(self._run_batch([observation for observation, _ in batch.values()], futures))
+
+    async def _run_batch(self, observations: list, futures: dict):
+        if self._forward_lock is None:
+            self._forward_lock = asyncio.Lock()
+        keys = list(futures)
+        try:
+            async with self._forward_lock:
+                stacked = np.stack(observations)
+                started = time.perf_counter()
+                outputs = await asyncio.to_thread(self.predict_fn, stacked)
+                self.forward_seconds += time.perf_counter() - started
+            self.batches += 1
+            self.rows += len(keys)
+            self.largest_batch = max(self.largest_batch, len(keys))
+            for key, output in zip(keys, outputs):
+                if not futures[key].done():
+                    futures[key].set_result(output)
+        except Exception as e:
+            for key in keys:
+                if not futures[key].done():
+                    futures[key].set_exception(e)
+        finally:
+            for key in keys:
+                self._inflight.pop(key, None)
+
+    def stats(self) -> dict:
+        """Throughput and latency counters since the batcher was created."""
+        elapsed = time.monotonic() - self._started
+        latencies = np.array(self._latencies) * 1000.0
+        return {
+            "requests": self.requests,
+            "deduplicated": self.deduplicated,
+            "batches": self.batches,
+            "rows": self.rows,
+            "largest_batch": self.largest_batch,
+            "mean_batch_size": self.rows / self.batches if self.batches else 0.0,
+            "requests_per_second": self.requests / elapsed if elapsed else 0.0,
+            "forward_ms_per_batch": self.forward_seconds * 1000.0 / self.batches if self.batches else 0.0,
+            "latency_ms_p50": float(np.percentile(latencies, 50)) if len(latencies) else 0.0,
+            "latency_ms_p95": float(np.percentile(latencies, 95)) if len(latencies) else 0.0,
+            "latency_ms_p99": float(np.percentile(latencies, 99)) if len(latencies) else 0.0,
+        }
@@ -0,0 +1,229 @@
+# backend/instrumentation.py
+"""
+Lightweight stage timing for the request path.
+
+Stages (LLM helpers, yfinance calls, indicator preprocessing, the PPO forward
+pass, Firestore operations, term annotation) are wrapped with `instrumented`
+or `timed`. Each observation lands in a fixed-bucket histogram per stage and,
+when a request trace is active, in that request's span list. HTTP requests
+are timed per route by MetricsMiddleware, which also assigns the trace ID.
+`render_prometheus()` exposes everything in the Prometheus text format.
+
+Recording an observation costs a perf_counter pair, a bisect and a lock,
+so it is left on in production.
+"""
+import asyncio
+import contextvars
+import functools
+import inspect
+import os
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# Upper bounds (seconds) of the latency histogram buckets.
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Requests slower than this are logged with their per-stage breakdown.
+TRACE_SLOW_REQUEST_SECONDS = float(os.getenv("TRACE_SLOW_REQUEST_SECONDS", "5"))
+
+# Spans kept per request trace. Background tasks started inside a request
+# inherit its trace, so the list is capped rather than left to grow.
+MAX_TRACE_SPANS = 256
+
+# Header a caller can set to supply its own trace ID; echoed on every response.
+TRACE_HEADER = "x-trace-id"
+
+_trace_id = contextvars.ContextVar("trace_id", default=None)
+_trace_spans = contextvars.ContextVar("trace_spans", default=None)
+
+class Histogram:
+    """Cumulative-bucket latency histogram, safe to observe from any thread."""
+
+    def __init__(self, buckets: tuple = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def snapshot(self):
+        with self._lock:
+            return list(self.counts), self.sum, self.count
+
+class _Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.histograms = {}
+        self.counters = {}
+
+    def histogram(self, name: str, labels: tuple) -> Histogram:
+        key = (name, labels)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self.histograms.setdefault(key, Histogram())
+        return histogram
+
+    def increment(self, name: str, labels: tuple, amount: float = 1):
+        key = (name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+registry = _Registry()
+
+_HELP = {
+    "stage_duration_seconds": ("histogram", "Time spent in an instrumented stage."),
+    "stage_errors_total": ("counter", "Instrumented stage calls that raised."),
+    "http_request_duration_seconds": ("histogram", "HTTP request latency by route, until the last body byte is sent."),
+    "http_requests_total": ("counter", "HTTP requests by route and status."),
+}
+
+def current_trace_id():
+    """The trace ID of the request being handled, or None outside a request."""
+    return _trace_id.get()
+
+def observe(stage: str, seconds: float, failed: bool = False):
+    """Records one `stage` call that took `seconds`."""
+    registry.histogram("stage_duration_seconds", (("stage", stage),)).observe(seconds)
+    if failed:
+        registry.increment("stage_errors_total", (("stage", stage),))
+    spans = _trace_spans.get()
+    if spans is not None and len(spans) < MAX_TRACE_SPANS:
+        spans.append((stage, seconds))
+
+@contextmanager
+def timed(stage: str):
+    """Times the enclosed block as `stage`. Works in sync and async code."""
+    start = time.perf_counter()
+    failed = False
+    try:
+        yield
+    except Exception:
+        failed = True
+        raise
+    finally:
+        observe(stage, time.perf_counter() - start, failed)
+
+def instrumented(stage: str):
+    """Decorator timing every call of a function, coroutine function or async generator as `stage`."""
+    def decorate(fn):
+        if inspect.isasyncgenfunction(fn):
+            @functools.wraps(fn)
+            async def wrapper(*args, **kwargs):
+                with timed(stage):
+                    async for item in fn(*args, **kwargs):
+                        yield item
+        elif inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def wrapper(*args, **kwargs):
+                with timed(stage):
+                    return await fn(*args, **kwargs)
+        else:
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with timed(stage):
+                    return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+async def timed_thread(stage: str, fn, *args):
+    """`await asyncio.to_thread(fn, *args)`, timed as `stage` (including the wait for a worker thread)."""
+    with timed(stage):
+        return await asyncio.to_thread(fn, *args)
+
+class MetricsMiddleware:
+    """
+    ASGI middleware that starts a trace per HTTP request and records its
+    latency by route template. The trace ID comes from the X-Trace-ID request
+    header when present and is returned in the X-Trace-ID response header.
+    Timing runs until the last body chunk is sent, so streamed responses are
+    measured in full.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        trace_id = headers.get(TRACE_HEADER.encode(), b"").decode("latin-1")[:64] or uuid.uuid4().hex
+        spans = []
+        trace_token = _trace_id.set(trace_id)
+        spans_token = _trace_spans.set(spans)
+        start = time.perf_counter()
+        status = {"code": 500}
+
+        async def send_with_trace(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                message["headers"] = [*message.get("headers", []), (TRACE_HEADER.encode(), trace_id.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_trace)
+        finally:
+            elapsed = time.perf_counter() - start
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "unmatched"
+            labels = (("method", scope["method"]), ("route", path))
+            registry.histogram("http_request_duration_seconds", labels).observe(elapsed)
+            registry.increment("http_requests_total", labels + (("status", str(status["code"])),))
+            if elapsed >= TRACE_SLOW_REQUEST_SECONDS:
+                print(f"Backend: Slow request {trace_id} {scope['method']} {path} {elapsed:.2f}s: {_summarize_spans(spans)}")
+            _trace_spans.reset(spans_token)
+            _trace_id.reset(trace_token)
+
+def _summarize_spans(spans: list) -> str:
+    totals = {}
+    for stage, seconds in spans:
+        count, total = totals.get(stage, (0, 0.0))
+        totals[stage] = (count + 1, total + seconds)
+    ordered = sorted(totals.items(), key=lambda item: item[1][1], reverse=True)
+    return ", ".join(f"{stage} {total:.3f}s x{count}" for stage, (count, total) in ordered) or "no instrumented stages"
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _labels(labels: tuple, extra: tuple = ()) -> str:
+    pairs = [*labels, *extra]
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in pairs) + "}"
+
+def render_prometheus() -> str:
+    """All recorded metrics in the Prometheus text exposition format."""
+    lines = []
+    for name, (kind, help_text) in _HELP.items():
+        if kind == "histogram":
+            series = sorted((labels, h) for (metric, labels), h in list(registry.histograms.items()) if metric == name)
+        else:
+            series = sorted((labels, v) for (metric, labels), v in list(registry.counters.items()) if metric == name)
+        if not series:
+            continue
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in series:
+            if kind == "counter":
+                lines.append(f"{name}{_labels(labels)} {value}")
+                continue
+            counts, total, count = value.snapshot()
+            cumulative = 0
+            for bound, bucket_count in zip((*value.buckets, "+Inf"), counts):
+                cumulative += bucket_count
+                lines.append(f"{name}_bucket{_labels(labels, (('le', bound),))} {cumulative}")
+            lines.append(f"{name}_sum{_labels(labels)} {total}")
+            lines.append(f"{name}_count{_labels(labels)} {count}")
+    return "\n".join(lines) + "\n"
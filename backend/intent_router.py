@@ -0,0 +1,208 @@
+import re
+from llm import parse_chat_intent_with_llm
+
+# Common company names mapped to their tickers. Only used by the fast path;
+# anything not listed here is left to the LLM.
+TICKER_ALIASES = {
+    "apple": "AAPL",
+    "microsoft": "MSFT",
+    "nvidia": "NVDA",
+    "amazon": "AMZN",
+    "google": "GOOGL",
+    "alphabet": "GOOGL",
+    "meta": "META",
+    "facebook": "META",
+    "tesla": "TSLA",
+    "netflix": "NFLX",
+    "intel": "INTC",
+    "amd": "AMD",
+    "oracle": "ORCL",
+    "salesforce": "CRM",
+    "adobe": "ADBE",
+    "cisco": "CSCO",
+    "qualcomm": "QCOM",
+    "broadcom": "AVGO",
+    "paypal": "PYPL",
+    "boeing": "BA",
+    "disney": "DIS",
+    "nike": "NKE",
+    "walmart": "WMT",
+    "costco": "COST",
+    "starbucks": "SBUX",
+    "mcdonald's": "MCD",
+    "mcdonalds": "MCD",
+    "coca-cola": "KO",
+    "coca cola": "KO",
+    "pepsi": "PEP",
+    "pepsico": "PEP",
+    "exxon": "XOM",
+    "exxonmobil": "XOM",
+    "chevron": "CVX",
+    "pfizer": "PFE",
+    "johnson & johnson": "JNJ",
+    "jpmorgan": "JPM",
+    "jp morgan": "JPM",
+    "goldman sachs": "GS",
+    "bank of america": "BAC",
+    "verizon": "VZ",
+    "mastercard": "MA",
+    "home depot": "HD",
+    "uber": "UBER",
+}
+
+# Aliases that are also ordinary words. They only name the company when written
+# in upper case or next to a ticker cue ("$META", "meta stock").
+AMBIGUOUS_ALIASES = {"meta"}
+
+# Upper-case words that show up in questions but are not tickers.
+NON_TICKER_UPPERCASE_WORDS = {
+    "I", "A", "AI", "CEO", "CFO", "ETF", "ETFS", "IPO", "EPS", "PE", "P/E", "USD", "US", "USA",
+    "UK", "EU", "OK", "RSI", "MACD", "CCI", "DX", "SMA", "EMA", "GDP", "IRA", "ROI", "FAQ",
+}
+
+UNIT_DAYS = {"day": 1, "week": 7, "month": 30, "quarter": 90, "year": 365}
+
+NUMBER_WORDS = {
+    "a": 1, "an": 1, "one": 1, "next": 1, "this": 1, "last": 1, "past": 1,
+    "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7,
+    "eight": 8, "nine": 9, "ten": 10, "eleven": 11, "twelve": 12,
+}
+
+DEFAULT_DAYS = 90
+
+_ALIAS_PATTERN = re.compile(
+    r"\b(" + "|".join(re.escape(alias) for alias in sorted(TICKER_ALIASES, key=len, reverse=True)) + r")(?![\w&'-])",
+    re.IGNORECASE,
+)
+_TICKER_CUE_PATTERN = re.compile(r"\s+(?:stocks?|shares?|ticker|platforms|inc|corp)\b", re.IGNORECASE)
+_TICKER_TOKEN_PATTERN = re.compile(r"(?<![\w$])\$?([A-Za-z]{1,5}(?:[.-][A-Za-z])?)(?![\w])")
+_WORD_PATTERN = re.compile(r"[A-Za-z][A-Za-z.&'/-]*")
+_TIME_WORD_PATTERN = re.compile(r"\b(days?|weeks?|months?|quarters?|years?|today|tomorrow|yesterday|ytd)\b", re.IGNORECASE)
+_TIME_WINDOW_PATTERN = re.compile(
+    r"\b(\d+|" + "|".join(NUMBER_WORDS) + r")[\s-]*(day|week|month|quarter|year)s?\b",
+    re.IGNORECASE,
+)
+_WATCHLIST_PATTERN = re.compile(r"\bwatch[\s-]?list\b", re.IGNORECASE)
+
+def _extract_time_window(user_message: str):
+    """
+    Returns the number of days for an explicit "N days/weeks/months/years" phrase,
+    DEFAULT_DAYS when the message has no time words at all, or None when it talks
+    about time in a way the fast path cannot resolve.
+    """
+    matches = list(_TIME_WINDOW_PATTERN.finditer(user_message))
+    if not matches:
+        return None if _TIME_WORD_PATTERN.search(user_message) else DEFAULT_DAYS
+    if len(matches) > 1:
+        return None
+
+    amount, unit = matches[0].group(1).lower(), matches[0].group(2).lower()
+    count = int(amount) if amount.isdigit() else NUMBER_WORDS[amount]
+    days = count * UNIT_DAYS[unit]
+    return days if days > 0 else None
+
+def _sentence_starts(user_message: str) -> set[int]:
+    starts = {0}
+    for match in re.finditer(r"[.!?]\s+", user_message):
+        starts.add(match.end())
+    return starts
+
+def _alias_names_company(user_message: str, match: re.Match) -> bool:
+    alias = match.group(1)
+    if alias.lower() not in AMBIGUOUS_ALIASES or alias.isupper():
+        return True
+    return user_message[:match.start()].endswith("$") or bool(_TICKER_CUE_PATTERN.match(user_message, match.end()))
+
+def parse_intent_fast_path(user_message: str, known_tickers: list[str]):
+    """
+    Resolves the chat intent deterministically when the message is unambiguous:
+    every company reference is an explicit known ticker or a known alias, no other
+    capitalized word could be a company name, and any timeframe is an explicit
+    "N days/weeks/months/years" phrase. Returns None when the LLM is needed.
+    """
+    if not user_message or not re.search(r"[a-z]", user_message):
+        return None
+
+    known = set(known_tickers)
+    mentions = []
+    claimed = []
+
+    for match in _ALIAS_PATTERN.finditer(user_message):
+        if not _alias_names_company(user_message, match):
+            continue
+        mentions.append((match.start(), TICKER_ALIASES[match.group(1).lower()]))
+        claimed.append(match.span())
+
+    for match in _TICKER_TOKEN_PATTERN.finditer(user_message):
+        token = match.group(0)
+        symbol = match.group(1).upper()
+        explicit = token.startswith("$")
+        if not explicit and (match.group(1) != symbol or symbol in NON_TICKER_UPPERCASE_WORDS):
+            continue
+        if any(start <= match.start() < end for start, end in claimed):
+            continue
+        if symbol not in known:
+            # An upper-case token we don't recognize may be an unsupported ticker.
+            return None
+        mentions.append((match.start(), symbol))
+        claimed.append(match.span())
+
+    tickers = []
+    for _, ticker in sorted(mentions):
+        if ticker not in tickers:
+            tickers.append(ticker)
+
+    sentence_starts = _sentence_starts(user_message)
+    for match in _WORD_PATTERN.finditer(user_message):
+        if any(start <= match.start() < end for start, end in claimed):
+            continue
+        word = match.group(0)
+        if word.upper() in NON_TICKER_UPPERCASE_WORDS:
+            continue
+        if word[0].isupper() and match.start() not in sentence_starts:
+            # Capitalized words mid-sentence are usually company or product names.
+            return None
+
+    days = _extract_time_window(user_message)
+    if days is None:
+        return None
+
+    analyze_watchlist = bool(_WATCHLIST_PATTERN.search(user_message)) and not tickers
+    if not tickers and not analyze_watchlist:
+        # Nothing recognizable; the LLM may still find a lower-case company name.
+        return None
+
+    return {
+        "analyze_watchlist": analyze_watchlist,
+        "tickers": tickers,
+        "days": days,
+    }
+
+def _fast_path_title(intent: dict) -> str:
+    if intent["analyze_watchlist"]:
+        return "Watchlist Analysis"
+    tickers = intent["tickers"]
+    title = " & ".join(tickers[:3]) + (" & More" if len(tickers) > 3 else "")
+    if intent["days"] != DEFAULT_DAYS:
+        return f"{title} {intent['days']}-Day Outlook"
+    return f"{title} Analysis"
+
+async def route_chat_intent(user_message: str, known_tickers: list[str], include_title: bool = False) -> dict:
+    """
+    Returns the chat intent for a user message as a dict with `analyze_watchlist`,
+    `tickers`, `days` and `title` (None unless `include_title` is set). Uses the
+    deterministic fast path when possible and a single LLM call otherwise.
+    """
+    intent = parse_intent_fast_path(user_message, known_tickers)
+    if intent is not None:
+        print(f"Backend: Intent resolved without LLM: {intent}") # DEBUG
+        intent["title"] = _fast_path_title(intent) if include_title else None
+        return intent
+
+    intent = await parse_chat_intent_with_llm(user_message, include_title=include_title)
+
+    explicit_days = _extract_time_window(user_message)
+    if explicit_days is not None and explicit_days != DEFAULT_DAYS:
+        intent["days"] = explicit_days
+
+    return intent
@@ -0,0 +1,47 @@
+# backend/lazy_imports.py
+"""
+Deferred imports for heavy dependencies.
+
+`LazyModule("torch")` and `LazyObject(factory)` can be bound at module level
+like the real thing but cost nothing until an attribute is first read, so
+importing the app stays fast and uvicorn can accept connections while the
+model, the trade data and the Firestore client load in the background.
+"""
+import importlib
+import threading
+
+class LazyObject:
+    """Proxy that builds its target with `factory()` on first attribute access (once, thread-safe)."""
+
+    def __init__(self, factory):
+        object.__setattr__(self, "_factory", factory)
+        object.__setattr__(self, "_target", None)
+        object.__setattr__(self, "_lock", threading.Lock())
+
+    def resolve(self):
+        """The underlying object, built now if it wasn't yet."""
+        if self._target is None:
+            with self._lock:
+                if self._target is None:
+                    object.__setattr__(self, "_target", self._factory())
+        return self._target
+
+    @property
+    def loaded(self) -> bool:
+        return self._target is not None
+
+    def __getattr__(self, name):
+        return getattr(self.resolve(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self.resolve(), name, value)
+
+class LazyModule(LazyObject):
+    """A module imported on first attribute access."""
+
+    def __init__(self, name: str):
+        super().__init__(lambda: importlib.import_module(name))
+        object.__setattr__(self, "_name", name)
+
+    def __repr__(self):
+        return f"<lazy module {self._name!r}{'' if self.loaded else ' (not imported)'}>"
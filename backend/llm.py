@@ -1,21 +1,16 @@
 
-import requests
+import httpx
 import json
 import re
+from card_cache import get_card_cache
+from instrumentation import instrumented
+from term_annotator import term_annotator
+from ollama_client import ollama_chat, ollama_chat_stream
 
 # Configuration for Ollama
-OLLAMA_API_URL = "http://localhost:11434/api/chat" 
 OLLAMA_MODEL_NAME = "gemma3"
 
-# Load financial terms dictionary
-try:
-    with open('../frontend/lib/financial-terms.json', 'r') as f:
-        financial_terms_db = json.load(f)
-except FileNotFoundError:
-    financial_terms_db = {}
-except json.JSONDecodeError:
-    financial_terms_db = {}
-
+@instrumented("llm.extract_tickers")
 async def extract_tickers_from_llm(user_message: str) -> list[str]:
     """
     Uses the Ollama LLM to extract a list of stock tickers from the user message.
@@ -34,9 +29,7 @@ async def extract_tickers_from_llm(user_message: str) -> list[str]:
     }
     try:
         print("Backend: Calling Ollama for ticker extraction...") # DEBUG
-        response = requests.post(OLLAMA_API_URL, json=payload, timeout=20)
-        response.raise_for_status()
-        response_json = response.json()
+        response_json = await ollama_chat(payload, timeout=20)
         content = response_json.get("message", {}).get("content", "{}").strip()
         
         print(f"Backend: Ollama response content: '{content}'") # DEBUG
@@ -64,6 +57,7 @@ async def process_natural_language_prompt(user_message: str) -> list[str]:
     """
     return await extract_tickers_from_llm(user_message)
 
+@instrumented("llm.extract_time_window")
 async def extract_time_window_from_llm(user_message: str) -> int:
     """
     Uses the Ollama LLM to extract the timeframe (in days) from the user message.
@@ -85,9 +79,7 @@ async def extract_time_window_from_llm(user_message: str) -> int:
         "stream": False
     }
     try:
-        response = requests.post(OLLAMA_API_URL, json=payload, timeout=20)
-        response.raise_for_status()
-        response_json = response.json()
+        response_json = await ollama_chat(payload, timeout=20)
         content = response_json.get("message", {}).get("content", "").strip()
         match = re.search(r"\d+", content)
         if match:
@@ -99,10 +91,17 @@ async def extract_time_window_from_llm(user_message: str) -> int:
         print(f"Error extracting time window from LLM: {e}")
         return 90
 
+@instrumented("llm.card")
 async def get_ollama_llm_response(finrl_data: dict) -> dict:
     """
     Gets a detailed, structured response from the Ollama LLM based on FinRL data.
+    Analyses are cached by content (see card_cache), so a card already
+    generated for the same prediction is served without calling the model.
     """
+    return await get_card_cache().get_or_generate(finrl_data, _generate_llm_response, namespace=OLLAMA_MODEL_NAME)
+
+@instrumented("llm.card_generation")
+async def _generate_llm_response(finrl_data: dict) -> dict:
     system_prompt = '''
 You are an expert financial analyst AI. Your task is to interpret the provided FinRL model data and generate a comprehensive, structured financial analysis.
 
@@ -148,9 +147,7 @@ Please generate the structured financial analysis in the specified JSON format.
     }
 
     try:
-        response = requests.post(OLLAMA_API_URL, json=payload, timeout=60)
-        response.raise_for_status()
-        response_json = response.json()
+        response_json = await ollama_chat(payload, timeout=60)
         
         bot_content_str = response_json.get("message", {}).get("content", "{}")
         bot_content_dict = json.loads(bot_content_str)
@@ -161,13 +158,14 @@ Please generate the structured financial analysis in the specified JSON format.
 
         return bot_content_dict
 
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         return {"error": f"Could not connect to Ollama: {e}"}
     except json.JSONDecodeError:
         return {"error": "Failed to parse LLM response."}
     except Exception as e:
         return {"error": "An unexpected error occurred."}
 
+@instrumented("llm.title")
 async def get_summarized_title(user_message: str) -> str:
     """
     Uses the Ollama LLM to generate a concise title for a new chat conversation.
@@ -186,9 +184,7 @@ async def get_summarized_title(user_message: str) -> str:
     }
 
     try:
-        response = requests.post(OLLAMA_API_URL, json=payload, timeout=30)
-        response.raise_for_status()
-        response_json = response.json()
+        response_json = await ollama_chat(payload, timeout=30)
         
         title = response_json.get("message", {}).get("content", "").strip()
         
@@ -197,12 +193,13 @@ async def get_summarized_title(user_message: str) -> str:
             
         return title
 
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         return user_message[:50]
     except Exception as e:
         return user_message[:50]
 
 
+@instrumented("llm.summary")
 async def get_generic_llm_summary(prompt: str) -> str:
     """
     Uses the Ollama LLM to generate a generic summary based on a prompt.
@@ -216,41 +213,47 @@ async def get_generic_llm_summary(prompt: str) -> str:
         "stream": False
     }
     try:
-        response = requests.post(OLLAMA_API_URL, json=payload, timeout=60)
-        response.raise_for_status()
-        response_json = response.json()
+        response_json = await ollama_chat(payload, timeout=60)
         summary = response_json.get("message", {}).get("content", "I couldn't retrieve a summary at this time.")
         return summary
     except Exception as e:
         return "I had trouble generating a summary."
 
 
-def add_tooltips(text: str) -> list:
-    if not financial_terms_db or not text:
-        return [{"text": text, "isTerm": False}]
-
-    sorted_terms = sorted(financial_terms_db.keys(), key=len, reverse=True)
-    pattern = re.compile(r'(\b' + '|\b'.join(re.escape(term) for term in sorted_terms) + r'\b)', re.IGNORECASE)
-    
-    parts = []
-    last_idx = 0
+@instrumented("llm.summary_stream")
+async def stream_generic_llm_summary(prompt: str):
+    """
+    Streaming variant of get_generic_llm_summary. Yields the summary token by token
+    using Ollama's streaming mode.
+    """
+    payload = {
+        "model": OLLAMA_MODEL_NAME,
+        "messages": [
+            {"role": "system", "content": "You are a helpful financial bot. Summarize the provided information concisely and conversationally in one or two sentences."},
+            {"role": "user", "content": prompt}
+        ],
+    }
+    produced = False
+    try:
+        async for delta in ollama_chat_stream(payload, timeout=60):
+            produced = True
+            yield delta
+    except Exception as e:
+        print(f"Error streaming summary from LLM: {e}")
+        if not produced:
+            yield "I had trouble generating a summary."
 
-    for match in pattern.finditer(text):
-        start, end = match.span()
-        if start > last_idx:
-            parts.append({"text": text[last_idx:start], "isTerm": False})
-        
-        term = match.group(0)
-        definition = financial_terms_db.get(term.lower(), {}).get("definition", "")
-        parts.append({"text": term, "isTerm": True, "definition": definition})
-        
-        last_idx = end
 
-    if last_idx < len(text):
-        parts.append({"text": text[last_idx:], "isTerm": False})
+@instrumented("add_tooltips")
+def add_tooltips(text: str) -> list:
+    return term_annotator.annotate(text)
 
-    return parts
+@instrumented("add_tooltips_batch")
+def add_tooltips_batch(texts: list) -> list:
+    """add_tooltips for many strings at once."""
+    return term_annotator.annotate_many(texts)
 
+@instrumented("llm.watchlist_summary")
 async def get_watchlist_analysis_summary(buy_tickers: list, sell_tickers: list, hold_tickers: list) -> dict:
     """
     Uses the LLM to generate a summary and confidence score for the watchlist analysis.
@@ -291,9 +294,7 @@ Please generate the structured financial analysis in the specified JSON format.
     }
 
     try:
-        response = requests.post(OLLAMA_API_URL, json=payload, timeout=60)
-        response.raise_for_status()
-        response_json = response.json()
+        response_json = await ollama_chat(payload, timeout=60)
         
         bot_content_str = response_json.get("message", {}).get("content", "{}")
         bot_content_dict = json.loads(bot_content_str)
@@ -307,6 +308,7 @@ Please generate the structured financial analysis in the specified JSON format.
     except Exception as e:
         return {"error": "An unexpected error occurred.", "summary_text": ""}
 
+@instrumented("llm.should_analyze_watchlist")
 async def should_analyze_watchlist(user_message: str) -> bool:
     """
     Uses the LLM to determine if the user wants to analyze their watchlist.
@@ -325,12 +327,76 @@ async def should_analyze_watchlist(user_message: str) -> bool:
     }
 
     try:
-        response = requests.post(OLLAMA_API_URL, json=payload, timeout=30)
-        response.raise_for_status()
-        response_json = response.json()
+        response_json = await ollama_chat(payload, timeout=30)
         
         content = response_json.get("message", {}).get("content", "").strip().lower()
         return content == "true"
 
     except Exception as e:
         return False
+
+@instrumented("llm.chat_intent")
+async def parse_chat_intent_with_llm(user_message: str, include_title: bool = False) -> dict:
+    """
+    Uses a single Ollama call to classify the user message. Returns a dict with
+    the watchlist intent, the mentioned tickers, the time window in days and,
+    when `include_title` is set, a short conversation title.
+    """
+    title_instruction = (
+        '- "title": a short but descriptive title (up to 5 words) for a new chat conversation that starts with this message, without bold text.\n'
+        if include_title else ""
+    )
+    system_prompt = (
+        "You are a financial assistant AI. Analyze the user's message and return a single JSON object with these keys:\n"
+        '- "analyze_watchlist": true if the user wants to analyze their stock watchlist as a whole (e.g. "analyze my watchlist", '
+        '"should I buy or sell the stocks in my watchlist?"), false otherwise. If the user asks about a specific stock, even one on their watchlist, use false.\n'
+        '- "tickers": a list of the official stock ticker symbols for every company name or ticker mentioned, e.g. ["AAPL", "MSFT"] for "show me apple and msft". Use [] if none are mentioned.\n'
+        '- "days": the time window in days the user refers to as an integer (e.g. "next week" is 7, "next 3 months" is 90). Use 90 if no timeframe is given.\n'
+        f"{title_instruction}"
+        "Return only the JSON object."
+    )
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_message}
+    ]
+    payload = {
+        "model": OLLAMA_MODEL_NAME,
+        "messages": messages,
+        "stream": False,
+        "format": "json"
+    }
+    intent = {
+        "analyze_watchlist": False,
+        "tickers": [],
+        "days": 90,
+        "title": user_message[:50] if include_title else None,
+    }
+    try:
+        response_json = await ollama_chat(payload, timeout=30)
+        content = response_json.get("message", {}).get("content", "{}").strip()
+        print(f"Backend: Ollama intent response content: '{content}'") # DEBUG
+        parsed = json.loads(content)
+        if not isinstance(parsed, dict):
+            return intent
+
+        analyze_watchlist = parsed.get("analyze_watchlist")
+        if isinstance(analyze_watchlist, str):
+            analyze_watchlist = analyze_watchlist.strip().lower() == "true"
+        intent["analyze_watchlist"] = bool(analyze_watchlist)
+
+        tickers = parsed.get("tickers", [])
+        if isinstance(tickers, list):
+            intent["tickers"] = [str(t).upper() for t in tickers if isinstance(t, str)]
+
+        match = re.search(r"\d+", str(parsed.get("days", "")))
+        if match and int(match.group(0)) > 0:
+            intent["days"] = int(match.group(0))
+
+        title = parsed.get("title")
+        if include_title and isinstance(title, str) and title.strip():
+            intent["title"] = title.strip()
+
+        return intent
+    except Exception as e:
+        print(f"Error parsing chat intent from LLM: {e}")
+        return intent
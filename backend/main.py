@@ -1,7 +1,14 @@
 
+import asyncio
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
 from api_routes import router as api_router
+from finrl_engine import engine_status, flush_indicator_state
+from ollama_client import close_client as close_ollama_client
+from instrumentation import MetricsMiddleware, render_prometheus
+from persistence import persistence_queue
+from services import warm_up
 
 app = FastAPI(
     title="Financial Advisor Bot Backend (Prototype)",
@@ -28,4 +35,34 @@ app.add_middleware(
     allow_headers=["*"], 
 )
 
+# Added last so it wraps everything else, CORS included.
+app.add_middleware(MetricsMiddleware)
+
 app.include_router(api_router)
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Per-stage and per-route latency histograms in the Prometheus text format."""
+    return PlainTextResponse(render_prometheus(), media_type="text/plain; version=0.0.4")
+
+@app.get("/healthz", include_in_schema=False)
+async def healthz():
+    """Liveness: the process is up and serving requests."""
+    return {"status": "ok"}
+
+@app.get("/readyz", include_in_schema=False)
+async def readyz():
+    """Readiness: 200 once the model and trade data are loaded and warmed up, 503 until then (or if loading failed)."""
+    status = engine_status()
+    return JSONResponse(status, status_code=200 if status["status"] == "ready" else 503)
+
+@app.on_event("startup")
+async def startup_event():
+    # Heavy loading runs in the background so uvicorn binds right away.
+    app.state.warm_up_task = asyncio.create_task(warm_up())
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await persistence_queue.drain()
+    await flush_indicator_state()
+    await close_ollama_client()
@@ -0,0 +1,97 @@
+# backend/observation.py
+import copy
+import numpy as np
+import pandas as pd
+
+class LatestObservation:
+    """
+    The PPO observation for the latest trade date, kept as one preallocated
+    float32 vector laid out like the training environment's state:
+    [cash, shares (n), close (n), indicator_1 (n), ..., indicator_k (n)],
+    with tickers in slot order (sorted, as in the latest trade slice).
+
+    Per-ticker column values are kept alongside in (columns x tickers) arrays,
+    so key metrics and overrides are O(1) lookups by ticker slot instead of
+    DataFrame scans.
+
+    An observation built from the trade data is meant to be shared and left
+    as is; a request patches its own copy(), so what it scores doesn't depend
+    on which tickers other requests refreshed.
+    """
+
+    def __init__(self, latest_df: pd.DataFrame, indicators: list[str], initial_amount: float):
+        self.tickers = latest_df['tic'].tolist()
+        self.slots = {ticker: i for i, ticker in enumerate(self.tickers)}
+        self.indicators = list(indicators)
+        self.columns = [c for c in latest_df.columns if c not in ('date', 'tic')]
+        self.column_index = {column: i for i, column in enumerate(self.columns)}
+        self.values = latest_df[self.columns].to_numpy(dtype=np.float64).T.copy()
+        self.dates = pd.to_datetime(latest_df['date']).to_numpy(dtype='datetime64[ns]').copy()
+        self.source_date = pd.Timestamp(self.dates.max()) if len(self.dates) else None
+        # Date of the bar each patched ticker was last overridden with.
+        self.overrides = {}
+
+        n = len(self.tickers)
+        self._offsets = {'close': 1 + n}
+        for k, indicator in enumerate(self.indicators):
+            self._offsets[indicator] = 1 + (2 + k) * n
+        self.observation = np.zeros(1 + (2 + len(self.indicators)) * n, dtype=np.float32)
+        self.observation[0] = initial_amount
+        for column, offset in self._offsets.items():
+            self.observation[offset:offset + n] = self.values[self.column_index[column]]
+
+    @property
+    def prediction_date(self) -> pd.Timestamp:
+        return pd.Timestamp(self.dates.max())
+
+    @property
+    def state_key(self) -> tuple:
+        """Identifies the vector's contents: the source date and the bar each patched ticker holds."""
+        return self.source_date, tuple(sorted(self.overrides.items()))
+
+    def copy(self) -> "LatestObservation":
+        """A copy whose values can be patched without touching this one."""
+        clone = copy.copy(self)
+        clone.values = self.values.copy()
+        clone.dates = self.dates.copy()
+        clone.observation = self.observation.copy()
+        clone.overrides = dict(self.overrides)
+        return clone
+
+    def patch(self, ticker: str, row: dict) -> bool:
+        """
+        Overwrites a ticker's values (and its observation slots) with `row`,
+        e.g. the latest bar from the indicator state. Returns False if the
+        ticker has no slot.
+        """
+        slot = self.slots.get(ticker)
+        if slot is None or not row:
+            return False
+        for column, value in row.items():
+            index = self.column_index.get(column)
+            if index is None:
+                continue
+            self.values[index, slot] = value
+            offset = self._offsets.get(column)
+            if offset is not None:
+                self.observation[offset + slot] = value
+        if row.get('date') is not None:
+            self.dates[slot] = np.datetime64(pd.Timestamp(row['date']), 'ns')
+            self.overrides[ticker] = pd.Timestamp(row['date'])
+        return True
+
+    def with_holdings(self, cash: float, shares: dict) -> np.ndarray:
+        """
+        A copy of the observation with the cash and share slots set from a
+        portfolio. Tickers outside the universe are ignored.
+        """
+        observation = self.observation.copy()
+        observation[0] = cash
+        for ticker, count in shares.items():
+            slot = self.slots.get(ticker)
+            if slot is not None:
+                observation[1 + slot] = count
+        return observation
+
+    def value(self, ticker: str, column: str) -> float:
+        return float(self.values[self.column_index[column], self.slots[ticker]])
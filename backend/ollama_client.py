@@ -0,0 +1,81 @@
+import json
+import os
+import httpx
+
+# Configuration for Ollama
+OLLAMA_API_URL = os.getenv("OLLAMA_API_URL", "http://localhost:11434/api/chat")
+
+# Connection pool limits shared by every LLM helper. Ollama serializes
+# generations per model anyway, so a small pool of keep-alive connections
+# is enough to keep many concurrent chats from opening new sockets.
+OLLAMA_MAX_CONNECTIONS = int(os.getenv("OLLAMA_MAX_CONNECTIONS", "16"))
+OLLAMA_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("OLLAMA_MAX_KEEPALIVE_CONNECTIONS", "8"))
+OLLAMA_KEEPALIVE_EXPIRY = 30.0
+OLLAMA_CONNECT_TIMEOUT = 5.0
+
+_client: httpx.AsyncClient | None = None
+
+def get_client() -> httpx.AsyncClient:
+    """
+    Returns the process-wide async HTTP client used to talk to Ollama,
+    creating it on first use.
+    """
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=OLLAMA_MAX_CONNECTIONS,
+                max_keepalive_connections=OLLAMA_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=OLLAMA_KEEPALIVE_EXPIRY,
+            ),
+            timeout=httpx.Timeout(60.0, connect=OLLAMA_CONNECT_TIMEOUT),
+        )
+    return _client
+
+async def close_client():
+    """
+    Closes the shared client and its pooled connections. Called on app shutdown.
+    """
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+async def ollama_chat(payload: dict, timeout: float) -> dict:
+    """
+    Sends a chat payload to Ollama without blocking the event loop and returns
+    the decoded JSON response. `timeout` bounds the whole call (read/write/pool);
+    connecting is bounded separately by OLLAMA_CONNECT_TIMEOUT.
+
+    If the awaiting task is cancelled (e.g. the HTTP client disconnected), the
+    in-flight request is aborted and its connection released back to the pool.
+    """
+    response = await get_client().post(
+        OLLAMA_API_URL,
+        json=payload,
+        timeout=httpx.Timeout(timeout, connect=OLLAMA_CONNECT_TIMEOUT),
+    )
+    response.raise_for_status()
+    return response.json()
+
+async def ollama_chat_stream(payload: dict, timeout: float):
+    """
+    Sends a chat payload to Ollama with `stream: true` and yields the content
+    delta of each chunk as it arrives. `timeout` bounds the wait between chunks.
+    """
+    async with get_client().stream(
+        "POST",
+        OLLAMA_API_URL,
+        json={**payload, "stream": True},
+        timeout=httpx.Timeout(timeout, connect=OLLAMA_CONNECT_TIMEOUT),
+    ) as response:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            if not line.strip():
+                continue
+            chunk = json.loads(line)
+            delta = chunk.get("message", {}).get("content", "")
+            if delta:
+                yield delta
+            if chunk.get("done"):
+                break
@@ -0,0 +1,264 @@
+# backend/persistence.py
+import asyncio
+import itertools
+import os
+from datetime import datetime, timezone
+from firebase_config import db
+from instrumentation import instrumented, timed_thread
+
+# Pending writes are flushed when this many are queued, or after this long.
+PERSISTENCE_FLUSH_SIZE = int(os.getenv("PERSISTENCE_FLUSH_SIZE", "100"))
+PERSISTENCE_FLUSH_INTERVAL = float(os.getenv("PERSISTENCE_FLUSH_INTERVAL", "0.5"))
+PERSISTENCE_MAX_RETRIES = 5
+PERSISTENCE_RETRY_BASE_DELAY = 0.2
+
+# Firestore's limit on operations in one batched write.
+FIRESTORE_BATCH_LIMIT = 500
+
+# Batched deletes a bulk deletion keeps in flight at once.
+DELETE_PARALLEL_BATCHES = int(os.getenv("DELETE_PARALLEL_BATCHES", "4"))
+
+def client_timestamp() -> datetime:
+    """
+    Timestamp for a queued write. Taken when the write is queued rather than
+    left to the server, so messages committed in one batch keep their order.
+    """
+    return datetime.now(timezone.utc)
+
+class WriteBehindQueue:
+    """
+    Collects Firestore document writes off the request path and commits them
+    as batched writes. Writes are grouped per (user, conversation) and keep
+    their queue order; a conversation's writes are never split across batches
+    unless it alone exceeds FIRESTORE_BATCH_LIMIT. Failed batches are retried
+    with exponential backoff.
+    """
+
+    def __init__(self, flush_size: int = PERSISTENCE_FLUSH_SIZE, flush_interval: float = PERSISTENCE_FLUSH_INTERVAL):
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self._pending = {}
+        self._pending_count = 0
+        # (user, conversation) -> events of the flushes committing its writes.
+        self._in_flight = {}
+        self._wakeup = None
+        self._flush_lock = None
+        self._flusher = None
+        self._stopping = False
+        self.committed = 0
+        self.failed = 0
+
+    def _ensure_flusher(self):
+        if self._flusher is None or self._flusher.done():
+            self._wakeup = asyncio.Event()
+            self._flush_lock = self._flush_lock or asyncio.Lock()
+            self._flusher = asyncio.get_running_loop().create_task(self._run())
+
+    def set(self, user_id: str, conversation_id: str, ref, data: dict, merge: bool = False):
+        """Queues `ref.set(data)`. Must be called from the event loop."""
+        self._ensure_flusher()
+        self._pending.setdefault((user_id, conversation_id), []).append((ref, data, merge))
+        self._pending_count += 1
+        if self._pending_count >= self.flush_size:
+            self._wakeup.set()
+
+    def add(self, user_id: str, conversation_id: str, collection_ref, data: dict):
+        """Queues the equivalent of `collection_ref.add(data)` (a new auto-id document)."""
+        self.set(user_id, conversation_id, collection_ref.document(), data)
+
+    async def discard(self, user_id: str, conversation_id: str = None):
+        """
+        Drops queued writes for a user (or one of their conversations) that is
+        being deleted, then waits for flushes already committing some of their
+        writes, so nothing is written back after the deletion.
+        """
+        def matches(key):
+            return key[0] == user_id and conversation_id in (None, key[1])
+
+        for key in [key for key in self._pending if matches(key)]:
+            self._pending_count -= len(self._pending.pop(key))
+        in_flight = {event for key, events in self._in_flight.items() if matches(key) for event in events}
+        await asyncio.gather(*(event.wait() for event in in_flight))
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            if self._pending:
+                await self.flush()
+
+    async def flush(self, user_id: str = None):
+        """Commits the queued writes (only `user_id`'s, if given) and waits for them."""
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        async with self._flush_lock:
+            keys = [key for key in self._pending if user_id is None or key[0] == user_id]
+            if not keys:
+                return
+            groups = [self._pending.pop(key) for key in keys]
+            self._pending_count -= sum(len(group) for group in groups)
+            done = asyncio.Event()
+            for key in keys:
+                self._in_flight.setdefault(key, set()).add(done)
+
+            batches, current = [], []
+            for group in groups:
+                if current and len(current) + len(group) > FIRESTORE_BATCH_LIMIT:
+                    batches.append(current)
+                    current = []
+                for op in group:
+                    if len(current) == FIRESTORE_BATCH_LIMIT:
+                        batches.append(current)
+                        current = []
+                    current.append(op)
+            if current:
+                batches.append(current)
+            try:
+                await asyncio.gather(*(self._commit(ops) for ops in batches))
+            finally:
+                for key in keys:
+                    self._in_flight[key].discard(done)
+                    if not self._in_flight[key]:
+                        del self._in_flight[key]
+                done.set()
+
+    async def _commit(self, ops: list):
+        if await _with_retries(_commit_batch, ops, description=f"committing {len(ops)} Firestore writes"):
+            self.committed += len(ops)
+        else:
+            self.failed += len(ops)
+
+    async def drain(self):
+        """Flushes everything still queued and stops the background flusher. Called on shutdown."""
+        if self._flusher is not None:
+            # Let an in-progress flush finish instead of cancelling its commits.
+            self._stopping = True
+            self._wakeup.set()
+            await self._flusher
+            self._flusher = None
+            self._stopping = False
+        await self.flush()
+
+    def stats(self) -> dict:
+        return {"pending": self._pending_count, "committed": self.committed, "failed": self.failed}
+
+async def _with_retries(fn, *args, description: str) -> bool:
+    """Runs blocking `fn(*args)` in a thread, retrying with exponential backoff. Returns whether it succeeded."""
+    for attempt in range(PERSISTENCE_MAX_RETRIES + 1):
+        try:
+            await asyncio.to_thread(fn, *args)
+            return True
+        except Exception as e:
+            if attempt == PERSISTENCE_MAX_RETRIES:
+                print(f"Error {description}, giving up: {e}")
+                return False
+            delay = PERSISTENCE_RETRY_BASE_DELAY * (2 ** attempt)
+            print(f"Error {description}, retrying in {delay:.1f}s: {e}")
+            await asyncio.sleep(delay)
+
+@instrumented("firestore.batch_commit")
+def _commit_batch(ops: list):
+    batch = db.batch()
+    for ref, data, merge in ops:
+        batch.set(ref, data, merge=merge)
+    batch.commit()
+
+@instrumented("firestore.batch_delete")
+def _delete_batch(refs: list):
+    batch = db.batch()
+    for ref in refs:
+        batch.delete(ref)
+    batch.commit()
+
+class BulkDeleter:
+    """
+    Deletes Firestore documents in batched writes of FIRESTORE_BATCH_LIMIT,
+    with up to `parallel_batches` batches in flight while the next page of
+    documents is read. `on_progress(deleted, batches)` is called after each
+    committed batch. Counts are in `deleted`, `batches` and `failed`.
+    """
+
+    def __init__(self, parallel_batches: int = DELETE_PARALLEL_BATCHES, on_progress=None):
+        self._slots = asyncio.Semaphore(parallel_batches)
+        self._queries = asyncio.Semaphore(parallel_batches)
+        self._tasks = set()
+        self.on_progress = on_progress
+        self.deleted = 0
+        self.batches = 0
+        self.failed = 0
+
+    async def _commit_delete(self, refs: list):
+        try:
+            if await _with_retries(_delete_batch, refs, description=f"deleting {len(refs)} Firestore documents"):
+                self.deleted += len(refs)
+                self.batches += 1
+                if self.on_progress is not None:
+                    self.on_progress(self.deleted, self.batches)
+            else:
+                self.failed += len(refs)
+        finally:
+            self._slots.release()
+
+    async def delete_documents(self, refs: list):
+        """Schedules deletion of `refs`; waits only for a free batch slot, not for the commit."""
+        for start in range(0, len(refs), FIRESTORE_BATCH_LIMIT):
+            await self._slots.acquire()
+            task = asyncio.create_task(self._commit_delete(refs[start:start + FIRESTORE_BATCH_LIMIT]))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _reference_pages(self, collection_ref, show_missing: bool):
+        """
+        Yields the document references of `collection_ref`, up to
+        FIRESTORE_BATCH_LIMIT at a time. With `show_missing`, documents that
+        don't exist but still have subcollections are listed too; otherwise
+        the collection is paged with keys-only queries.
+        """
+        if show_missing:
+            listing = iter(collection_ref.list_documents(page_size=FIRESTORE_BATCH_LIMIT, show_missing=True))
+            while True:
+                async with self._queries:
+                    refs = await timed_thread("firestore.list_documents", lambda: list(itertools.islice(listing, FIRESTORE_BATCH_LIMIT)))
+                if refs:
+                    yield refs
+                if len(refs) < FIRESTORE_BATCH_LIMIT:
+                    return
+
+        last = None
+        while True:
+            # An empty projection would return every field; "__name__" returns none.
+            query = collection_ref.select(["__name__"]).limit(FIRESTORE_BATCH_LIMIT)
+            if last is not None:
+                query = query.start_after(last)
+            async with self._queries:
+                page = await timed_thread("firestore.page_query", lambda: list(query.stream()))
+            if page:
+                yield [doc.reference for doc in page]
+            if len(page) < FIRESTORE_BATCH_LIMIT:
+                return
+            last = page[-1]
+
+    async def delete_collection(self, collection_ref, subcollections: tuple = ()):
+        """
+        Deletes every document of `collection_ref`, first emptying the named
+        `subcollections` of each one. Firestore doesn't delete subcollections
+        with their parent, so a parent deleted on its own leaves them behind;
+        when there are subcollections, those missing parents are listed too.
+        """
+        async for refs in self._reference_pages(collection_ref, show_missing=bool(subcollections)):
+            for name in subcollections:
+                await asyncio.gather(*(self.delete_collection(ref.collection(name)) for ref in refs))
+            await self.delete_documents(refs)
+
+    async def wait(self):
+        """Waits for every scheduled batch to be committed."""
+        while self._tasks:
+            await asyncio.gather(*list(self._tasks))
+
+    def progress(self) -> dict:
+        return {"deleted_documents": self.deleted, "batches": self.batches, "failed_documents": self.failed}
+
+persistence_queue = WriteBehindQueue()
@@ -0,0 +1,151 @@
+# backend/policy_backends.py
+"""
+Pluggable runtimes for the PPO policy's deterministic actions.
+
+For deterministic inference only the actor is needed: features -> policy MLP
+-> action_net gives the Gaussian mean, which is the action (clamped to
+[-1, 1]). The value head and the distribution objects are never used.
+policy_export.py extracts that actor from the stable-baselines3 zip into a
+standalone TorchScript or ONNX file, optionally with int8 dynamically
+quantized weights. These backends run either artifact, or the full SB3 policy:
+
+    sb3               PPO.load + policy.get_distribution (the reference)
+    torchscript       <model>_actor.pt            (needs torch only)
+    torchscript-int8  <model>_actor.int8.pt
+    onnx              <model>_actor.onnx          (needs onnxruntime only)
+    onnx-int8         <model>_actor.int8.onnx
+    auto              onnx, then torchscript, then sb3: the first that loads
+
+FINRL_INFERENCE_BACKEND picks one (default: auto). An exported artifact is
+only used while the model zip it came from is unchanged; otherwise, or when
+its runtime isn't installed, the backend falls back to sb3.
+"""
+import json
+import os
+import numpy as np
+
+FINRL_INFERENCE_BACKEND = os.getenv("FINRL_INFERENCE_BACKEND", "auto")
+
+# Threads a single forward pass may use (0: the runtime's default).
+FINRL_INFERENCE_THREADS = int(os.getenv("FINRL_INFERENCE_THREADS", "0"))
+
+_ARTIFACT_SUFFIXES = {
+    "torchscript": "_actor.pt",
+    "torchscript-int8": "_actor.int8.pt",
+    "onnx": "_actor.onnx",
+    "onnx-int8": "_actor.int8.onnx",
+}
+_AUTO_ORDER = ("onnx", "torchscript")
+
+class StaleArtifactError(Exception):
+    pass
+
+def artifact_path(model_path: str, backend: str) -> str:
+    """Where policy_export.py writes the `backend` artifact for the SB3 model at `model_path` (without .zip)."""
+    return model_path + _ARTIFACT_SUFFIXES[backend]
+
+def model_signature(model_path: str) -> dict:
+    """Size and mtime of the SB3 zip; stored with each export to detect a retrained model."""
+    stat = os.stat(model_path + ".zip")
+    return {"source_size": stat.st_size, "source_mtime": int(stat.st_mtime)}
+
+def _check_artifact(model_path: str, path: str) -> dict:
+    with open(path + ".json", "r") as f:
+        meta = json.load(f)
+    if os.path.exists(model_path + ".zip") and any(meta.get(key) != value for key, value in model_signature(model_path).items()):
+        raise StaleArtifactError(f"{path} was exported from a different {model_path}.zip; run policy_export.py again.")
+    return meta
+
+class SB3Backend:
+    """The full stable-baselines3 policy, as loaded for training."""
+
+    name = "sb3"
+
+    def __init__(self, model_path: str):
+        import torch
+        from stable_baselines3 import PPO
+
+        if FINRL_INFERENCE_THREADS:
+            torch.set_num_threads(FINRL_INFERENCE_THREADS)
+        self._torch = torch
+        self.model = PPO.load(model_path)
+        self.artifact = model_path + ".zip"
+        self.state_space = self.model.observation_space.shape[0]
+
+    def predict(self, observations: np.ndarray) -> np.ndarray:
+        torch = self._torch
+        with torch.no_grad():
+            obs_tensor = torch.as_tensor(observations).to(self.model.policy.device)
+            distribution = self.model.policy.get_distribution(obs_tensor)
+            actions = distribution.get_actions(deterministic=True).clamp(-1, 1)
+        return actions.cpu().numpy()
+
+class TorchScriptBackend:
+    """The exported actor as a TorchScript module."""
+
+    def __init__(self, model_path: str, quantized: bool = False):
+        import torch
+
+        self.name = "torchscript-int8" if quantized else "torchscript"
+        self.artifact = artifact_path(model_path, self.name)
+        self.meta = _check_artifact(model_path, self.artifact)
+        if FINRL_INFERENCE_THREADS:
+            torch.set_num_threads(FINRL_INFERENCE_THREADS)
+        self._torch = torch
+        self.module = torch.jit.load(self.artifact, map_location="cpu").eval()
+        self.state_space = self.meta["state_space"]
+
+    def predict(self, observations: np.ndarray) -> np.ndarray:
+        torch = self._torch
+        with torch.inference_mode():
+            return self.module(torch.as_tensor(observations, dtype=torch.float32)).numpy()
+
+class OnnxBackend:
+    """The exported actor run by onnxruntime; torch isn't imported at all."""
+
+    def __init__(self, model_path: str, quantized: bool = False):
+        import onnxruntime
+
+        self.name = "onnx-int8" if quantized else "onnx"
+        self.artifact = artifact_path(model_path, self.name)
+        self.meta = _check_artifact(model_path, self.artifact)
+        options = onnxruntime.SessionOptions()
+        if FINRL_INFERENCE_THREADS:
+            options.intra_op_num_threads = FINRL_INFERENCE_THREADS
+        self.session = onnxruntime.InferenceSession(self.artifact, options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+        self.state_space = self.meta["state_space"]
+
+    def predict(self, observations: np.ndarray) -> np.ndarray:
+        observations = np.ascontiguousarray(observations, dtype=np.float32)
+        return self.session.run(None, {self.input_name: observations})[0]
+
+def _create(backend: str, model_path: str):
+    if backend == "sb3":
+        return SB3Backend(model_path)
+    if backend.startswith("torchscript"):
+        return TorchScriptBackend(model_path, quantized=backend.endswith("-int8"))
+    if backend.startswith("onnx"):
+        return OnnxBackend(model_path, quantized=backend.endswith("-int8"))
+    raise ValueError(f"Unknown FINRL_INFERENCE_BACKEND {backend!r}; use auto, sb3, {', '.join(_ARTIFACT_SUFFIXES)}.")
+
+def load_policy_backend(model_path: str, backend: str = FINRL_INFERENCE_BACKEND):
+    """
+    Loads `backend` for the SB3 model at `model_path`. Anything but sb3 falls
+    back to it (with a message) when its artifact is missing or stale or its
+    runtime isn't installed. The result has `name`, `artifact`,
+    `state_space` and `predict(observations) -> actions`.
+    """
+    candidates = list(_AUTO_ORDER) if backend == "auto" else [backend]
+    for candidate in candidates:
+        if candidate == "sb3":
+            break
+        if candidate not in _ARTIFACT_SUFFIXES:
+            raise ValueError(f"Unknown FINRL_INFERENCE_BACKEND {backend!r}; use auto, sb3, {', '.join(_ARTIFACT_SUFFIXES)}.")
+        if backend == "auto" and not os.path.exists(artifact_path(model_path, candidate)):
+            continue
+        try:
+            return _create(candidate, model_path)
+        except (OSError, ImportError, RuntimeError, StaleArtifactError, json.JSONDecodeError) as e:
+            print(f"Backend: Inference backend {candidate} unavailable, falling back: {e}")
+    return _create("sb3", model_path)
@@ -0,0 +1,122 @@
+# backend/policy_export.py
+"""
+Exports the deterministic actor of the PPO model for policy_backends.
+
+The actor is the SB3 policy's features extractor, actor MLP and action_net,
+clamped to [-1, 1]: exactly what
+`policy.get_distribution(obs).get_actions(deterministic=True).clamp(-1, 1)`
+computes, without the value head or the distribution. It is written as
+TorchScript and/or ONNX (opset 17, dynamic batch size), optionally with int8
+dynamically quantized Linear weights, each next to a .json file recording the
+source zip it came from. Check the result with
+`python -m benchmarks.policy_inference` before switching
+FINRL_INFERENCE_BACKEND over.
+
+Export (from the backend directory; ONNX needs `pip install onnx onnxruntime`):
+    python policy_export.py --format torchscript onnx --int8
+"""
+import argparse
+import json
+import os
+from datetime import datetime, timezone
+from policy_backends import artifact_path, model_signature
+
+PPO_MODEL_PATH = "inference_engine/agent_ppo_v1"
+ONNX_OPSET = 17
+
+def build_actor(policy):
+    """A torch module mapping a (rows, state_space) float32 batch to the policy's deterministic actions."""
+    import torch
+    from stable_baselines3.common.distributions import DiagGaussianDistribution
+
+    if not isinstance(policy.action_dist, DiagGaussianDistribution) or policy.squash_output:
+        raise ValueError(f"Only unsquashed Gaussian policies can be exported, not {type(policy.action_dist).__name__}.")
+
+    class DeterministicActor(torch.nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.features_extractor = getattr(policy, "pi_features_extractor", policy.features_extractor)
+            self.mlp_extractor = policy.mlp_extractor
+            self.action_net = policy.action_net
+
+        def forward(self, observations):
+            # forward_actor covers both the old shared-trunk and the current separate-network MLP layouts.
+            latent = self.mlp_extractor.forward_actor(self.features_extractor(observations))
+            return self.action_net(latent).clamp(-1.0, 1.0)
+
+    return DeterministicActor().eval()
+
+def _quantize(actor):
+    import torch
+    return torch.ao.quantization.quantize_dynamic(actor, {torch.nn.Linear}, dtype=torch.qint8)
+
+def _write_meta(path: str, model_path: str, state_space: int, backend: str):
+    meta = {
+        "backend": backend,
+        "state_space": state_space,
+        "exported_at": datetime.now(timezone.utc).isoformat(),
+        **model_signature(model_path),
+    }
+    with open(path + ".json", "w") as f:
+        json.dump(meta, f)
+
+def export_torchscript(actor, example, path: str, quantized: bool):
+    import torch
+    with torch.no_grad():
+        module = torch.jit.trace(actor, example)
+        if not quantized:
+            # Folds the weights into the graph; dynamically quantized Linear layers are left as traced.
+            module = torch.jit.freeze(module)
+    module.save(path)
+
+def export_onnx(actor, example, path: str, quantized: bool):
+    import torch
+
+    target = path + ".fp32.tmp" if quantized else path
+    with torch.no_grad():
+        torch.onnx.export(
+            actor, example, target,
+            input_names=["observations"], output_names=["actions"],
+            dynamic_axes={"observations": {0: "batch"}, "actions": {0: "batch"}},
+            opset_version=ONNX_OPSET,
+        )
+    if quantized:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        try:
+            quantize_dynamic(target, path, weight_type=QuantType.QInt8)
+        finally:
+            os.remove(target)
+
+def export(model_path: str = PPO_MODEL_PATH, formats=("torchscript",), int8: bool = False) -> list:
+    """Writes the requested artifacts (fp32, plus int8 when `int8`). Returns their paths."""
+    import torch
+    from stable_baselines3 import PPO
+
+    print(f"Loading {model_path}.zip...")
+    policy = PPO.load(model_path, device="cpu").policy.eval()
+    state_space = policy.observation_space.shape[0]
+    example = torch.zeros((1, state_space), dtype=torch.float32)
+    actor = build_actor(policy)
+
+    written = []
+    for fmt in formats:
+        for quantized in ((False, True) if int8 else (False,)):
+            backend = f"{fmt}-int8" if quantized else fmt
+            path = artifact_path(model_path, backend)
+            module = _quantize(actor) if quantized and fmt == "torchscript" else actor
+            if fmt == "torchscript":
+                export_torchscript(module, example, path, quantized)
+            else:
+                export_onnx(module, example, path, quantized)
+            _write_meta(path, model_path, state_space, backend)
+            print(f"Wrote {path} ({os.path.getsize(path) / 1e6:.1f} MB)")
+            written.append(path)
+    return written
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default=PPO_MODEL_PATH, help="SB3 model path without .zip.")
+    parser.add_argument("--format", nargs="+", choices=("torchscript", "onnx"), default=["torchscript"])
+    parser.add_argument("--int8", action="store_true", help="Also write dynamically quantized int8 variants.")
+    args = parser.parse_args()
+    export(args.model, args.format, args.int8)
@@ -1,5 +1,5 @@
 
-import requests
+import httpx
 import json
 
 # List of financial terms to fetch definitions for
@@ -30,7 +30,7 @@ financial_dictionary = {}
 
 for term in financial_terms:
     try:
-        response = requests.get(f"https://api.dictionaryapi.dev/api/v2/entries/en/{term}")
+        response = httpx.get(f"https://api.dictionaryapi.dev/api/v2/entries/en/{term}")
         response.raise_for_status()  # Raise an exception for bad status codes
         data = response.json()
         
@@ -53,7 +53,7 @@ for term in financial_terms:
         else:
             print(f"No data or unexpected format for: {term}")
 
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         print(f"Error fetching definition for {term}: {e}")
     except (KeyError, IndexError) as e:
         print(f"Error parsing definition for {term}: {e}")
@@ -0,0 +1,326 @@
+# backend/precompute.py
+"""
+Nightly precompute of the model's recommendations.
+
+The PPO policy's output for a trading date is the same for every user without
+a saved portfolio, so it is computed once per trading day instead of inside
+each chat. The job:
+
+1. refreshes market data and indicator state for every ticker in the universe,
+   in chunks, recording each ticker as it is brought up to date;
+2. runs one forward pass over the full observation and stores every
+   ticker's prediction;
+3. optionally generates the LLM card analysis for the most requested tickers.
+
+Progress is kept in the store, so an interrupted run picks up where it
+stopped. Chat and watchlist analysis read predictions (and analyses, when
+present) from the store while they're for the last completed session.
+
+A run is keyed to the last completed session, which becomes today's session
+at MARKET_CLOSE_TIME in the exchange's timezone (see data_utils). Run it
+once per trading day after that, before the next close (from the backend
+directory):
+    python precompute.py --cards 25
+"""
+import argparse
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from finrl_engine import (
+    TICKER_LIST_FROM_DATA,
+    flush_indicator_state,
+    get_batch_dynamic_finrl_predictions,
+    last_completed_session,
+    refresh_indicators,
+    wait_until_ready,
+)
+from instrumentation import instrumented
+from llm import get_ollama_llm_response
+from ollama_client import close_client
+
+PRECOMPUTE_DB_PATH = os.getenv("PRECOMPUTE_DB_PATH", "inference_engine/precompute.sqlite3")
+
+# Tickers refreshed per multi-ticker download.
+PRECOMPUTE_CHUNK_SIZE = int(os.getenv("PRECOMPUTE_CHUNK_SIZE", "50"))
+
+# How many of the most requested tickers get a pre-generated card analysis,
+# and how many of those generations run at once.
+PRECOMPUTE_CARD_TICKERS = int(os.getenv("PRECOMPUTE_CARD_TICKERS", "25"))
+PRECOMPUTE_LLM_CONCURRENCY = int(os.getenv("PRECOMPUTE_LLM_CONCURRENCY", "2"))
+
+# Trading days of stored predictions kept after a run completes.
+PRECOMPUTE_KEEP_DAYS = 5
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    trading_date TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    started_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    finished_at REAL
+);
+CREATE TABLE IF NOT EXISTS run_progress (
+    trading_date TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    item TEXT NOT NULL,
+    PRIMARY KEY (trading_date, stage, item)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS predictions (
+    trading_date TEXT NOT NULL,
+    ticker TEXT NOT NULL,
+    prediction TEXT NOT NULL,
+    analysis TEXT,
+    PRIMARY KEY (trading_date, ticker)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS ticker_requests (
+    ticker TEXT PRIMARY KEY,
+    count INTEGER NOT NULL,
+    last_requested REAL NOT NULL
+);
+"""
+
+# Run statuses. Predictions are served once a run is "scored"; "complete"
+# means the card analyses are done too.
+RUNNING, SCORED, COMPLETE = "running", "scored", "complete"
+
+class PrecomputeStore:
+    """Precomputed predictions and analyses per trading date, plus job progress and ticker request counts."""
+
+    def __init__(self, path: str = PRECOMPUTE_DB_PATH):
+        self.path = path
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        connection = self._connection()
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.executescript(_SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    # --- Job progress ---
+
+    def run_status(self, trading_date: str):
+        row = self._connection().execute("SELECT status FROM runs WHERE trading_date = ?", (trading_date,)).fetchone()
+        return row[0] if row else None
+
+    def start_run(self, trading_date: str, restart: bool = False):
+        """Creates the run for `trading_date`, or resumes it. `restart` discards its recorded progress."""
+        now = time.time()
+        with self._connection() as connection:
+            if restart:
+                connection.execute("DELETE FROM run_progress WHERE trading_date = ?", (trading_date,))
+                connection.execute("DELETE FROM runs WHERE trading_date = ?", (trading_date,))
+            connection.execute(
+                "INSERT OR IGNORE INTO runs (trading_date, status, started_at, updated_at) VALUES (?, ?, ?, ?)",
+                (trading_date, RUNNING, now, now),
+            )
+
+    def set_status(self, trading_date: str, status: str):
+        now = time.time()
+        with self._connection() as connection:
+            connection.execute(
+                "UPDATE runs SET status = ?, updated_at = ?, finished_at = ? WHERE trading_date = ?",
+                (status, now, now if status == COMPLETE else None, trading_date),
+            )
+
+    def completed_items(self, trading_date: str, stage: str) -> set:
+        rows = self._connection().execute(
+            "SELECT item FROM run_progress WHERE trading_date = ? AND stage = ?", (trading_date, stage)
+        ).fetchall()
+        return {row[0] for row in rows}
+
+    def mark_done(self, trading_date: str, stage: str, items: list):
+        with self._connection() as connection:
+            connection.executemany(
+                "INSERT OR IGNORE INTO run_progress (trading_date, stage, item) VALUES (?, ?, ?)",
+                [(trading_date, stage, item) for item in items],
+            )
+            connection.execute("UPDATE runs SET updated_at = ? WHERE trading_date = ?", (time.time(), trading_date))
+
+    # --- Results ---
+
+    def save_predictions(self, trading_date: str, predictions: dict):
+        with self._connection() as connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO predictions (trading_date, ticker, prediction) VALUES (?, ?, ?)",
+                [(trading_date, ticker, json.dumps(prediction)) for ticker, prediction in predictions.items()],
+            )
+
+    def save_analysis(self, trading_date: str, ticker: str, analysis: dict):
+        with self._connection() as connection:
+            connection.execute(
+                "UPDATE predictions SET analysis = ? WHERE trading_date = ? AND ticker = ?",
+                (json.dumps(analysis), trading_date, ticker),
+            )
+
+    def latest_trading_date(self):
+        """The newest trading date whose predictions are ready, or None."""
+        row = self._connection().execute(
+            "SELECT MAX(trading_date) FROM runs WHERE status IN (?, ?)", (SCORED, COMPLETE)
+        ).fetchone()
+        return row[0] if row else None
+
+    def get_predictions(self, tickers: list[str], trading_date: str) -> dict:
+        """
+        {ticker: {"prediction", "analysis"}} for the `tickers` stored under
+        `trading_date`; "analysis" is None where no card was pre-generated.
+        Every call returns fresh dicts, so callers may modify them.
+        """
+        if not tickers:
+            return {}
+        rows = self._connection().execute(
+            f"SELECT ticker, prediction, analysis FROM predictions WHERE trading_date = ? AND ticker IN ({','.join('?' * len(tickers))})",
+            (trading_date, *tickers),
+        ).fetchall()
+        return {
+            ticker: {"prediction": json.loads(prediction), "analysis": json.loads(analysis) if analysis else None}
+            for ticker, prediction, analysis in rows
+        }
+
+    def purge(self, keep: int = PRECOMPUTE_KEEP_DAYS):
+        """Drops predictions and progress for all but the newest `keep` trading dates."""
+        with self._connection() as connection:
+            cutoff = connection.execute(
+                "SELECT trading_date FROM runs ORDER BY trading_date DESC LIMIT 1 OFFSET ?", (keep - 1,)
+            ).fetchone()
+            if cutoff is None:
+                return
+            for table in ("predictions", "run_progress", "runs"):
+                connection.execute(f"DELETE FROM {table} WHERE trading_date < ?", (cutoff[0],))
+
+    # --- Request counts ---
+
+    def record_requests(self, tickers: list[str]):
+        now = time.time()
+        with self._connection() as connection:
+            connection.executemany(
+                "INSERT INTO ticker_requests (ticker, count, last_requested) VALUES (?, 1, ?) "
+                "ON CONFLICT(ticker) DO UPDATE SET count = count + 1, last_requested = excluded.last_requested",
+                [(ticker, now) for ticker in tickers],
+            )
+
+    def most_requested(self, limit: int) -> list[str]:
+        rows = self._connection().execute(
+            "SELECT ticker FROM ticker_requests ORDER BY count DESC, last_requested DESC LIMIT ?", (limit,)
+        ).fetchall()
+        return [row[0] for row in rows]
+
+_store = None
+_store_guard = threading.Lock()
+
+def get_precompute_store() -> PrecomputeStore:
+    """The process-wide store, opened on first use."""
+    global _store
+    with _store_guard:
+        if _store is None:
+            _store = PrecomputeStore()
+        return _store
+
+@instrumented("precompute.read")
+def read_precomputed(tickers: list[str], record: bool = True) -> dict:
+    """
+    Precomputed {ticker: {"prediction", "analysis"}} for `tickers` from the
+    newest run, if that run is for the last completed session; otherwise {}.
+    `record` counts the request towards the most-requested tickers. Blocking;
+    call it from a worker thread.
+    """
+    try:
+        store = get_precompute_store()
+        if record and tickers:
+            store.record_requests(tickers)
+        trading_date = store.latest_trading_date()
+        if trading_date is None or trading_date < last_completed_session().strftime('%Y-%m-%d'):
+            return {}
+        return store.get_predictions(tickers, trading_date)
+    except Exception as e:
+        print(f"Backend: Could not read precomputed predictions: {e}")
+        return {}
+
+async def run_precompute(card_tickers: int = PRECOMPUTE_CARD_TICKERS, chunk_size: int = PRECOMPUTE_CHUNK_SIZE, restart: bool = False) -> dict:
+    """Runs (or resumes) the job for the last completed session. Returns a summary."""
+    if not await wait_until_ready():
+        return {"error": "FinRL model or data not available."}
+
+    store = get_precompute_store()
+    trading_date = last_completed_session().strftime('%Y-%m-%d')
+    if not restart and store.run_status(trading_date) == COMPLETE:
+        print(f"Precompute: {trading_date} is already complete.")
+        return {"trading_date": trading_date, "status": COMPLETE}
+    store.start_run(trading_date, restart=restart)
+
+    universe = list(TICKER_LIST_FROM_DATA)
+    refreshed = store.completed_items(trading_date, "refresh")
+    pending = [t for t in universe if t not in refreshed]
+    print(f"Precompute: {trading_date}: refreshing {len(pending)} of {len(universe)} tickers...")
+    stale = []
+    for start in range(0, len(pending), chunk_size):
+        chunk = pending[start:start + chunk_size]
+        current = await refresh_indicators(chunk)
+        store.mark_done(trading_date, "refresh", current)
+        stale.extend(t for t in chunk if t not in current)
+        print(f"Precompute: refreshed {min(start + chunk_size, len(pending))}/{len(pending)}")
+    if stale:
+        # Holidays, delistings or failed downloads; the run still scores them
+        # from their last bar, and the next run tries them again.
+        print(f"Precompute: {len(stale)} tickers have no bar for {trading_date}: {', '.join(stale[:20])}")
+
+    if not store.completed_items(trading_date, "score"):
+        predictions = await get_batch_dynamic_finrl_predictions(universe)
+        if "error" in predictions:
+            print(f"Precompute: scoring failed: {predictions['error']}")
+            return {"trading_date": trading_date, "status": RUNNING, "error": predictions["error"]}
+        store.save_predictions(trading_date, {t: p for t, p in predictions.items() if "error" not in p})
+        store.mark_done(trading_date, "score", ["all"])
+        store.set_status(trading_date, SCORED)
+        print(f"Precompute: stored predictions for {len(predictions)} tickers.")
+
+    generated = store.completed_items(trading_date, "cards")
+    wanted = [t for t in store.most_requested(card_tickers) if t not in generated] if card_tickers > 0 else []
+    stored = store.get_predictions(wanted, trading_date)
+    semaphore = asyncio.Semaphore(PRECOMPUTE_LLM_CONCURRENCY)
+    failed = []
+
+    async def generate(ticker: str):
+        async with semaphore:
+            analysis = await get_ollama_llm_response(stored[ticker]["prediction"])
+        if "error" in analysis:
+            failed.append(ticker)
+            return
+        store.save_analysis(trading_date, ticker, analysis)
+        store.mark_done(trading_date, "cards", [ticker])
+
+    if stored:
+        print(f"Precompute: generating card analyses for {len(stored)} tickers...")
+        await asyncio.gather(*(generate(t) for t in stored))
+    if failed:
+        print(f"Precompute: card analysis failed for {', '.join(failed)}; rerun to retry.")
+        return {"trading_date": trading_date, "status": SCORED, "failed_cards": failed}
+
+    store.set_status(trading_date, COMPLETE)
+    store.purge()
+    print(f"Precompute: {trading_date} complete.")
+    return {"trading_date": trading_date, "status": COMPLETE}
+
+async def _main(args):
+    try:
+        await run_precompute(card_tickers=args.cards, chunk_size=args.chunk_size, restart=args.restart)
+    finally:
+        await flush_indicator_state()
+        await close_client()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Precompute the day's model recommendations.")
+    parser.add_argument("--cards", type=int, default=PRECOMPUTE_CARD_TICKERS, help="Pre-generate card analyses for this many of the most requested tickers.")
+    parser.add_argument("--chunk-size", type=int, default=PRECOMPUTE_CHUNK_SIZE, help="Tickers per market data download.")
+    parser.add_argument("--restart", action="store_true", help="Discard recorded progress for today's run and start over.")
+    asyncio.run(_main(parser.parse_args()))
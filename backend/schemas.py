@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional
+from typing import Dict, List, Optional
 
 class ChatRequest(BaseModel):
     user_id: Optional[str] = None
@@ -14,3 +14,15 @@ class ChatResponse(BaseModel):
 
 class RenameRequest(BaseModel):
     new_title: str
+
+class PortfolioHoldings(BaseModel):
+    cash: Optional[float] = None
+    shares: Dict[str, float] = {}
+
+class UserPortfolio(PortfolioHoldings):
+    user_id: str
+
+class PortfolioPredictionRequest(BaseModel):
+    portfolios: List[UserPortfolio]
+    tickers: Optional[List[str]] = None
+    days: int = 90
@@ -1,24 +1,278 @@
 import asyncio
 import json
+import os
 import uuid
+from datetime import datetime, timezone
+import pandas as pd
 from fastapi import HTTPException
-from firebase_admin import firestore
-from firebase_config import db
-from finrl_engine import get_batch_dynamic_finrl_predictions, TICKER_LIST_FROM_DATA
+from firebase_config import db, firestore
+from finrl_engine import (
+    get_batch_dynamic_finrl_predictions,
+    get_inference_stats,
+    get_portfolio_predictions,
+    normalize_holdings,
+    TICKER_LIST_FROM_DATA,
+    wait_until_ready,
+)
 from llm import (
     add_tooltips,
+    add_tooltips_batch,
     get_generic_llm_summary,
     get_ollama_llm_response,
-    get_summarized_title,
-    process_natural_language_prompt,
-    extract_time_window_from_llm,
-    should_analyze_watchlist,
     get_watchlist_analysis_summary,
+    stream_generic_llm_summary,
 )
-from data_utils import get_yfinance_quote, get_yfinance_profile, get_historical_data
-from schemas import ChatRequest, ChatResponse, RenameRequest
+from intent_router import DEFAULT_DAYS, route_chat_intent
+from cache_utils import LRUCache
+from card_cache import get_card_cache
+from instrumentation import instrumented, timed_thread
+from lazy_imports import LazyObject
+from precompute import read_precomputed
+from persistence import BulkDeleter, client_timestamp, persistence_queue
+from data_utils import get_bulk_historical_data, get_bulk_quotes, get_yfinance_quote, get_yfinance_profile
+from schemas import ChatRequest, ChatResponse, PortfolioHoldings, PortfolioPredictionRequest, RenameRequest
+
+# Page sizes for paginated chat history and conversation listings.
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+# Finished "delete all my data" jobs stay queryable this long.
+DELETION_JOB_TTL = 24 * 3600
+
+# Maximum number of LLM generations a single chat request runs at once.
+LLM_CONCURRENCY_LIMIT = int(os.getenv("LLM_CONCURRENCY_LIMIT", "3"))
+
+_deletion_jobs = LRUCache(1000, ttl=DELETION_JOB_TTL)
+_deletion_tasks = set()
+
+def _ignore_event(event: dict):
+    pass
+
+async def _summarize(prompt: str, emit, message_id: str, prefix: str = "") -> str:
+    """
+    Runs a free-text LLM summary. When `emit` is streaming, the summary is requested
+    in Ollama's streaming mode and every token is pushed as a `token` event.
+    """
+    if emit is _ignore_event:
+        return prefix + await get_generic_llm_summary(prompt)
+
+    if prefix:
+        emit({"event": "token", "message_id": message_id, "delta": prefix})
+    chunks = [prefix]
+    async for delta in stream_generic_llm_summary(prompt):
+        chunks.append(delta)
+        emit({"event": "token", "message_id": message_id, "delta": delta})
+    return "".join(chunks)
+
+async def _get_trend_summary(ticker: str, days: int, history_task: asyncio.Task, llm_semaphore: asyncio.Semaphore, emit):
+    hist_data = await history_task
+    if hist_data.empty:
+        return None
+    trend_prompt = f"The following is the historical price data for {ticker} for the last {days} days, from oldest to newest:\n\n{hist_data[['date', 'close']].to_string(index=False)}\n\nBased *only* on this data, briefly summarize the price trend over this period."
+    message_id = f"trend:{ticker}"
+    async with llm_semaphore:
+        trend_summary = await _summarize(trend_prompt, emit, message_id, prefix=f"Regarding the {days}-day trend for {ticker}: ")
+    message = add_tooltips(trend_summary)
+    emit({"event": "chat_message", "message_id": message_id, "message": message})
+    return message
+
+async def _get_company_overview(ticker: str, llm_semaphore: asyncio.Semaphore, emit):
+    general_llm_prompt = f"Please provide a brief, general overview of the company with the stock ticker {ticker}. I cannot provide a detailed FinRL analysis for it. Keep the summary concise and conversational."
+    message_id = f"overview:{ticker}"
+    async with llm_semaphore:
+        summary = await _summarize(general_llm_prompt, emit, message_id)
+    message = add_tooltips(summary)
+    emit({"event": "chat_message", "message_id": message_id, "message": message})
+    return message
+
+def _build_card(finrl_data: dict, llm_response: dict) -> dict:
+    key_metrics = finrl_data.get("key_metrics", {})
+    pros = llm_response.get("pros", [])
+    cons = llm_response.get("cons", [])
+    summary, *annotated = add_tooltips_batch([llm_response.get("summary_text"), *pros, *cons])
+    return {
+        "ticker": finrl_data.get("ticker"),
+        "prediction_date": finrl_data.get("prediction_date"),
+        "recommendation": {
+            "action": finrl_data.get("recommended_action"),
+            "summary": summary,
+            "action_tags": llm_response.get("action_tags")
+        },
+        "analysis": {
+            "pros": annotated[:len(pros)],
+            "cons": annotated[len(pros):]
+        },
+        "data": {
+            "close_price": key_metrics.get("close_price"),
+            "volume": key_metrics.get("volume"),
+            "technical_indicators": {
+                "macd": key_metrics.get("macd"),
+                "rsi_30": key_metrics.get("rsi_30"),
+                "cci_30": key_metrics.get("cci_30"),
+                "boll_ub": key_metrics.get("boll_ub"),
+                "boll_lb": key_metrics.get("boll_lb"),
+                "dx_30": key_metrics.get("dx_30"),
+                "close_30_sma": key_metrics.get("close_30_sma"),
+                "close_60_sma": key_metrics.get("close_60_sma")
+            },
+            "current_price": key_metrics.get("current_price"),
+            "percent_change": key_metrics.get("percent_change"),
+        },
+        "is_finrl_advice": True
+    }
 
-async def handle_chat(request: ChatRequest):
+async def _get_ticker_card(ticker: str, index: int, finrl_data: dict, quote_task: asyncio.Task, llm_semaphore: asyncio.Semaphore, emit, analysis: dict = None):
+    """
+    Attaches the live quote to a FinRL prediction and generates its analysis card.
+    A precomputed `analysis` is used as is instead of calling the LLM.
+    Returns the card (or None on failure) and any chat messages for this ticker.
+    """
+    messages = []
+    quote = await quote_task
+    finrl_data.setdefault("key_metrics", {})
+    if quote and 'error' not in quote:
+        finrl_data["key_metrics"]["current_price"] = quote.get("current_price")
+        finrl_data["key_metrics"]["percent_change"] = quote.get("percent_change")
+    else:
+        finrl_data["key_metrics"]["current_price"] = "N/A"
+        finrl_data["key_metrics"]["percent_change"] = "N/A"
+        error_message = quote.get("error") if quote else f"Could not fetch real-time price for {ticker} from Finnhub. The displayed price may be from the last trading day."
+        messages.append(error_message)
+
+    if analysis is not None:
+        llm_response = analysis
+    else:
+        async with llm_semaphore:
+            llm_response = await get_ollama_llm_response(finrl_data)
+
+    if "error" in llm_response:
+        messages.append(f"The AI model failed to generate a detailed analysis for {ticker}.")
+        card = None
+    else:
+        card = _build_card(finrl_data, llm_response)
+
+    for message in messages:
+        emit({"event": "chat_message", "message_id": f"ticker:{ticker}", "message": message})
+    if card is not None:
+        emit({"event": "card", "index": index, "ticker": ticker, "card": card})
+    return card, messages
+
+async def _ticker_history(bulk_history_task: asyncio.Task, ticker: str):
+    histories = await bulk_history_task
+    return histories.get(ticker, pd.DataFrame())
+
+async def _run_ticker_pipeline(supported_tickers: list[str], unsupported_tickers: list[str], days: int, emit=_ignore_event, user_id: str = None):
+    """
+    Runs the per-request task graph for the tickers in a chat message: history
+    (one bulk download for all tickers), quotes and the user's holdings are
+    fetched concurrently, the FinRL prediction
+    starts as soon as all history is in, and every LLM generation (trend
+    summaries, cards, overviews) shares a semaphore of LLM_CONCURRENCY_LIMIT
+    slots. Results are assembled in the original ticker order. Returns the cards
+    and the chat messages.
+
+    Users without saved holdings get the nightly precomputed predictions (and
+    card analyses, where generated) when every ticker has one for the last
+    completed session; the model, its history download and those LLM calls
+    are skipped.
+    """
+    llm_semaphore = asyncio.Semaphore(LLM_CONCURRENCY_LIMIT)
+    precomputed = await asyncio.to_thread(read_precomputed, supported_tickers) if supported_tickers else {}
+    if len(precomputed) < len(supported_tickers):
+        precomputed = {}
+    holdings_task = asyncio.create_task(asyncio.to_thread(_load_holdings, user_id)) if user_id and supported_tickers else None
+    all_tasks = [holdings_task] if holdings_task is not None else []
+    history_tasks = {}
+
+    def start_history():
+        bulk_history_task = asyncio.create_task(asyncio.to_thread(get_bulk_historical_data, supported_tickers, days))
+        history_tasks.update({t: asyncio.create_task(_ticker_history(bulk_history_task, t)) for t in supported_tickers})
+        all_tasks.extend([bulk_history_task, *history_tasks.values()])
+
+    # Trend summaries are only written for a window other than the default.
+    wants_trends = days != DEFAULT_DAYS
+    # History feeds the prediction and the trend summaries. When the
+    # precomputed store answers the request, the prediction only needs it if
+    # the user turns out to have holdings, so it isn't fetched until they're loaded.
+    if supported_tickers and (not precomputed or wants_trends):
+        start_history()
+    quote_tasks = {t: asyncio.create_task(asyncio.to_thread(get_yfinance_quote, t)) for t in supported_tickers}
+    trend_tasks = [
+        asyncio.create_task(_get_trend_summary(t, days, history_tasks[t], llm_semaphore, emit))
+        for t in supported_tickers
+    ] if wants_trends else []
+    overview_tasks = [asyncio.create_task(_get_company_overview(t, llm_semaphore, emit)) for t in unsupported_tickers]
+    all_tasks.extend([*quote_tasks.values(), *trend_tasks, *overview_tasks])
+
+    card_responses = []
+    chat_responses = []
+    try:
+        prediction_messages = []
+        card_tasks = []
+        if supported_tickers:
+            holdings = await holdings_task if holdings_task is not None else None
+            if precomputed and holdings is None:
+                predictions = {t: entry["prediction"] for t, entry in precomputed.items()}
+            else:
+                precomputed = {}
+                if not history_tasks:
+                    start_history()
+                await asyncio.gather(*history_tasks.values())
+                history = {t: task.result() for t, task in history_tasks.items()}
+                predictions = await get_batch_dynamic_finrl_predictions(supported_tickers, days=days, history=history, holdings=holdings)
+
+            if "error" in predictions:
+                prediction_messages.append(f"I couldn't retrieve FinRL predictions at this time.")
+            else:
+                for index, ticker in enumerate(supported_tickers):
+                    finrl_data = predictions.get(ticker)
+                    if not finrl_data or "error" in finrl_data:
+                        card_tasks.append((ticker, None))
+                        continue
+                    analysis = precomputed.get(ticker, {}).get("analysis")
+                    task = asyncio.create_task(_get_ticker_card(ticker, index, finrl_data, quote_tasks[ticker], llm_semaphore, emit, analysis))
+                    card_tasks.append((ticker, task))
+                    all_tasks.append(task)
+            for message in prediction_messages:
+                emit({"event": "chat_message", "message_id": "predictions", "message": message})
+
+        for summary in await asyncio.gather(*trend_tasks):
+            if summary is not None:
+                chat_responses.append(summary)
+        chat_responses.extend(prediction_messages)
+
+        for ticker, task in card_tasks:
+            if task is None:
+                message = f"I couldn't retrieve a FinRL prediction for {ticker} at this time."
+                emit({"event": "chat_message", "message_id": f"ticker:{ticker}", "message": message})
+                chat_responses.append(message)
+                continue
+            card, messages = await task
+            chat_responses.extend(messages)
+            if card is not None:
+                card_responses.append(card)
+
+        chat_responses.extend(await asyncio.gather(*overview_tasks))
+    finally:
+        for task in all_tasks:
+            if not task.done():
+                task.cancel()
+
+    return card_responses, chat_responses
+
+def _cards_intro(ticker_names: list[str]) -> str:
+    if len(ticker_names) > 1:
+        return f"I have prepared a detailed analysis for {', '.join(ticker_names)}. You can find the cards below."
+    return f"Here is the analysis for {ticker_names[0]}."
+
+def _conversation_ref(user_id: str, conversation_id: str):
+    return db.collection('users').document(user_id).collection('conversations').document(conversation_id)
+
+async def _process_chat(request: ChatRequest, emit=_ignore_event) -> ChatResponse:
+    """
+    Handles one chat turn. Progress is reported through `emit` as it happens
+    (see stream_chat for the event types); the assembled response is returned.
+    """
     user_id = request.user_id
     user_message = request.user_message
     conversation_id = request.conversation_id
@@ -26,139 +280,78 @@ async def handle_chat(request: ChatRequest):
         conversation_id = str(uuid.uuid4())
     is_new_chat = request.is_new_chat
 
-    if user_id:
-        if not conversation_id:
-            conversation_id = str(uuid.uuid4())
-            is_new_chat = True
+    if user_id and not conversation_id:
+        conversation_id = str(uuid.uuid4())
+        is_new_chat = True
+
+    emit({"event": "start", "conversation_id": conversation_id})
+    # The ticker universe is known once the engine has loaded.
+    await wait_until_ready()
+
+    needs_title = bool(user_id and is_new_chat and conversation_id)
+    intent = await route_chat_intent(user_message, TICKER_LIST_FROM_DATA, include_title=needs_title)
 
-        if is_new_chat and conversation_id:
+    if user_id:
+        if needs_title:
             try:
-                summarized_title = await get_summarized_title(user_message)
-                await asyncio.to_thread(lambda: db.collection('users').document(user_id).collection('conversations').document(conversation_id).set({
+                summarized_title = intent.get("title") or user_message[:50]
+                persistence_queue.set(user_id, conversation_id, _conversation_ref(user_id, conversation_id), {
                     'title': summarized_title,
-                    'timestamp': firestore.SERVER_TIMESTAMP
-                }))
+                    'timestamp': client_timestamp()
+                })
             except Exception as e:
                 print(f"Error creating new conversation in Firestore: {e}")
 
-    if await should_analyze_watchlist(user_message):
+    if intent["analyze_watchlist"]:
         analysis_response = await analyze_watchlist(user_id)
         if "error" in analysis_response:
-            return ChatResponse(bot_message=json.dumps({"chat_messages": [analysis_response["error"]], "cards": []}), conversation_id=conversation_id, is_advice=True)
+            chat_messages = [analysis_response["error"]]
+            watchlist_cards = []
         else:
-            chat_message = analysis_response.get("summary_text", "")
+            chat_messages = [add_tooltips(analysis_response.get("summary_text", ""))]
             watchlist_cards = analysis_response.get("watchlist_cards", [])
-            return ChatResponse(bot_message=json.dumps({"chat_messages": [add_tooltips(chat_message)], "cards": watchlist_cards}), conversation_id=conversation_id, is_advice=True)
+        emit({"event": "chat_message", "message_id": "watchlist", "message": chat_messages[0]})
+        for index, card in enumerate(watchlist_cards):
+            emit({"event": "card", "index": index, "ticker": card.get("ticker"), "card": card})
+        return ChatResponse(bot_message=json.dumps({"chat_messages": chat_messages, "cards": watchlist_cards}), conversation_id=conversation_id, is_advice=True)
 
     card_responses = []
     chat_responses = []
 
     if user_id:
         try:
-            await asyncio.to_thread(lambda: db.collection('users').document(user_id).collection('conversations').document(conversation_id).collection('messages').add({
-                'timestamp': firestore.SERVER_TIMESTAMP,
+            persistence_queue.add(user_id, conversation_id, _conversation_ref(user_id, conversation_id).collection('messages'), {
+                'timestamp': client_timestamp(),
                 'sender': 'user',
                 'message': user_message
-            }))
+            })
         except Exception as e:
             print(f"Error saving user message to Firestore: {e}")
 
-    identified_tickers = await process_natural_language_prompt(user_message)
+    identified_tickers = intent["tickers"]
     supported_tickers = [t for t in identified_tickers if t in TICKER_LIST_FROM_DATA]
     unsupported_tickers = [t for t in identified_tickers if t not in TICKER_LIST_FROM_DATA]
 
-    days = await extract_time_window_from_llm(user_message)
+    days = intent["days"]
 
     is_advice_response = bool(supported_tickers)
 
     if supported_tickers:
-        if days != 90:
-            for ticker in supported_tickers:
-                hist_data = get_historical_data(ticker, days)
-                if not hist_data.empty:
-                    trend_prompt = f"The following is the historical price data for {ticker} for the last {days} days, from oldest to newest:\n\n{hist_data[['date', 'close']].to_string(index=False)}\n\nBased *only* on this data, briefly summarize the price trend over this period."
-                    trend_summary = await get_generic_llm_summary(trend_prompt)
-                    chat_responses.append(add_tooltips(f"Regarding the {days}-day trend for {ticker}: {trend_summary}"))
-
-        predictions = await get_batch_dynamic_finrl_predictions(supported_tickers, days=days)
-
-        if "error" in predictions:
-            chat_responses.append(f"I couldn't retrieve FinRL predictions at this time.")
-        else:
-            for ticker in supported_tickers:
-                finrl_data = predictions.get(ticker)
-                if not finrl_data or "error" in finrl_data:
-                    chat_responses.append(f"I couldn't retrieve a FinRL prediction for {ticker} at this time.")
-                    continue
-
-                quote = get_yfinance_quote(ticker)
-                if quote and 'error' not in quote:
-                    finrl_data.setdefault("key_metrics", {})
-                    finrl_data["key_metrics"]["current_price"] = quote.get("current_price")
-                    finrl_data["key_metrics"]["percent_change"] = quote.get("percent_change")
-                else:
-                    finrl_data.setdefault("key_metrics", {})
-                    finrl_data["key_metrics"]["current_price"] = "N/A"
-                    finrl_data["key_metrics"]["percent_change"] = "N/A"
-                    error_message = quote.get("error") if quote else f"Could not fetch real-time price for {ticker} from Finnhub. The displayed price may be from the last trading day."
-                    chat_responses.append(error_message)
-
-                llm_response = await get_ollama_llm_response(finrl_data)
-
-                if "error" in llm_response:
-                    chat_responses.append(f"The AI model failed to generate a detailed analysis for {ticker}.")
-                    continue
-
-                card = {
-                    "ticker": finrl_data.get("ticker"),
-                    "prediction_date": finrl_data.get("prediction_date"),
-                    "recommendation": {
-                        "action": finrl_data.get("recommended_action"),
-                        "summary": add_tooltips(llm_response.get("summary_text")),
-                        "action_tags": llm_response.get("action_tags")
-                    },
-                    "analysis": {
-                        "pros": [add_tooltips(pro) for pro in llm_response.get("pros", [])],
-                        "cons": [add_tooltips(con) for con in llm_response.get("cons", [])]
-                    },
-                    "data": {
-                        "close_price": finrl_data.get("key_metrics", {}).get("close_price"),
-                        "volume": finrl_data.get("key_metrics", {}).get("volume"),
-                        "technical_indicators": {
-                            "macd": finrl_data.get("key_metrics", {}).get("macd"),
-                            "rsi_30": finrl_data.get("key_metrics", {}).get("rsi_30"),
-                            "cci_30": finrl_data.get("key_metrics", {}).get("cci_30"),
-                            "boll_ub": finrl_data.get("key_metrics", {}).get("boll_ub"),
-                            "boll_lb": finrl_data.get("key_metrics", {}).get("boll_lb"),
-                            "dx_30": finrl_data.get("key_metrics", {}).get("dx_30"),
-                            "close_30_sma": finrl_data.get("key_metrics", {}).get("close_30_sma"),
-                            "close_60_sma": finrl_data.get("key_metrics", {}).get("close_60_sma")
-                        },
-                        "current_price": finrl_data.get("key_metrics", {}).get("current_price"),
-                        "percent_change": finrl_data.get("key_metrics", {}).get("percent_change"),
-                    },
-                    "is_finrl_advice": True
-                }
-                card_responses.append(card)
+        emit({"event": "intro", "message": add_tooltips(_cards_intro(supported_tickers))})
 
-    if unsupported_tickers:
-        for ticker in unsupported_tickers:
-            general_llm_prompt = f"Please provide a brief, general overview of the company with the stock ticker {ticker}. I cannot provide a detailed FinRL analysis for it. Keep the summary concise and conversational."
-            summary = await get_generic_llm_summary(general_llm_prompt)
-            chat_responses.append(add_tooltips(summary))
+    if supported_tickers or unsupported_tickers:
+        card_responses, ticker_messages = await _run_ticker_pipeline(supported_tickers, unsupported_tickers, days, emit, user_id)
+        chat_responses.extend(ticker_messages)
 
     if not identified_tickers and not unsupported_tickers and not supported_tickers:
         is_advice_response = False
-        summary = await get_generic_llm_summary(user_message)
+        summary = await _summarize(user_message, emit, "summary")
         chat_responses.append(add_tooltips(summary))
+        emit({"event": "chat_message", "message_id": "summary", "message": chat_responses[-1]})
 
     if card_responses:
         ticker_names = [card['ticker'] for card in card_responses]
-        if len(ticker_names) > 1:
-            summary_for_cards = f"I have prepared a detailed analysis for {', '.join(ticker_names)}. You can find the cards below."
-        else:
-            summary_for_cards = f"Here is the analysis for {ticker_names[0]}."
-        chat_responses.insert(0, add_tooltips(summary_for_cards))
+        chat_responses.insert(0, add_tooltips(_cards_intro(ticker_names)))
 
     final_response_payload = {
         "cards": card_responses,
@@ -168,19 +361,65 @@ async def handle_chat(request: ChatRequest):
     
     if user_id:
         try:
-            await asyncio.to_thread(lambda: db.collection('users').document(user_id).collection('conversations').document(conversation_id).collection('messages').add({
-                'timestamp': firestore.SERVER_TIMESTAMP,
+            persistence_queue.add(user_id, conversation_id, _conversation_ref(user_id, conversation_id).collection('messages'), {
+                'timestamp': client_timestamp(),
                 'sender': 'bot',
                 'message': final_bot_message
-            }))
+            })
         except Exception as e:
             print(f"Error saving bot message to Firestore: {e}")
 
     return ChatResponse(bot_message=final_bot_message, conversation_id=conversation_id, is_advice=is_advice_response)
 
+async def handle_chat(request: ChatRequest):
+    return await _process_chat(request)
+
+async def stream_chat(request: ChatRequest):
+    """
+    Streaming variant of handle_chat. Yields events as the chat turn progresses:
+
+    - {"event": "start", "conversation_id"}
+    - {"event": "intro", "message"}: sent before any card when tickers are analyzed
+    - {"event": "token", "message_id", "delta"}: tokens of a free-text summary
+    - {"event": "chat_message", "message_id", "message"}: a finished chat message
+    - {"event": "card", "index", "ticker", "card"}: a card, as soon as it is ready;
+      `index` is its position among the requested tickers
+    - {"event": "done", "bot_message", "conversation_id", "is_advice"}: the final
+      assembled message, identical to the handle_chat response and the one persisted
+    - {"event": "error", "detail"}: the turn failed; sent instead of "done" and
+      ends the stream (with the detail handle_chat's error response would carry)
+
+    Events from concurrent tickers may interleave.
+    """
+    queue = asyncio.Queue()
+    worker = asyncio.create_task(_process_chat(request, queue.put_nowait))
+    worker.add_done_callback(lambda _: queue.put_nowait(None))
+    try:
+        while True:
+            event = await queue.get()
+            if event is None:
+                break
+            yield event
+        try:
+            response = worker.result()
+        except Exception as e:
+            print(f"Error in streamed chat: {e}")
+            detail = e.detail if isinstance(e, HTTPException) else f"Error processing chat: {e}"
+            yield {"event": "error", "detail": detail}
+            return
+        yield {
+            "event": "done",
+            "bot_message": response.bot_message,
+            "conversation_id": response.conversation_id,
+            "is_advice": response.is_advice,
+        }
+    finally:
+        if not worker.done():
+            worker.cancel()
+
 async def add_to_watchlist(user_id: str, ticker: str):
     try:
-        await asyncio.to_thread(lambda: db.collection('users').document(user_id).collection('watchlist').document(ticker).set({
+        await timed_thread("firestore.watchlist_add", lambda: db.collection('users').document(user_id).collection('watchlist').document(ticker).set({
             'ticker': ticker,
             'added_at': firestore.SERVER_TIMESTAMP
         }))
@@ -190,49 +429,221 @@ async def add_to_watchlist(user_id: str, ticker: str):
 
 async def remove_from_watchlist(user_id: str, ticker: str):
     try:
-        await asyncio.to_thread(lambda: db.collection('users').document(user_id).collection('watchlist').document(ticker).delete())
+        await timed_thread("firestore.watchlist_remove", lambda: db.collection('users').document(user_id).collection('watchlist').document(ticker).delete())
         return {"message": f"Removed {ticker} from {user_id}'s watchlist."}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error removing from watchlist: {e}")
 
 async def get_watchlist(user_id: str):
     try:
-        loop = asyncio.get_event_loop()
         watchlist_ref = db.collection('users').document(user_id).collection('watchlist')
-        docs = await asyncio.to_thread(watchlist_ref.get)
-        
+        docs = await timed_thread("firestore.watchlist_get", watchlist_ref.get)
+        entries = [doc.to_dict() for doc in docs]
+        entries = [entry for entry in entries if entry.get('ticker')]
+        quotes = await asyncio.to_thread(get_bulk_quotes, [entry['ticker'] for entry in entries])
+
         watchlist_with_data = []
-        for doc in docs:
-            ticker_data = doc.to_dict()
-            ticker = ticker_data.get('ticker')
-            if ticker:
-                quote = await loop.run_in_executor(None, get_yfinance_quote, ticker)
-                profile = await loop.run_in_executor(None, get_yfinance_profile, ticker)
-                if quote and 'error' not in quote:
-                    ticker_data.update(quote)
-                    ticker_data['price'] = ticker_data.get('current_price')
-                    ticker_data['change'] = ticker_data.get('percent_change')
-                    ticker_data['name'] = profile.get('name', ticker)
-                else:
-                    ticker_data['current_price'] = 'N/A'
-                    ticker_data['change'] = 'N/A'
-                    ticker_data['percent_change'] = 'N/A'
-                    ticker_data['high_price_of_the_day'] = 'N/A'
-                    ticker_data['low_price_of_the_day'] = 'N/A'
-                    ticker_data['open_price_of_the_day'] = 'N/A'
-                    ticker_data['previous_close_price'] = 'N/A'
-                    ticker_data['error'] = quote.get('error') if quote else 'Could not fetch real-time price from yfinance.'
-                watchlist_with_data.append(ticker_data)
+        for ticker_data in entries:
+            ticker = ticker_data['ticker']
+            quote = quotes.get(ticker.strip().upper())
+            if quote and 'error' not in quote:
+                ticker_data.update(quote)
+                ticker_data['price'] = ticker_data.get('current_price')
+                ticker_data['change'] = ticker_data.get('percent_change')
+                ticker_data['name'] = quote.get('name', ticker)
+            else:
+                ticker_data['current_price'] = 'N/A'
+                ticker_data['change'] = 'N/A'
+                ticker_data['percent_change'] = 'N/A'
+                ticker_data['high_price_of_the_day'] = 'N/A'
+                ticker_data['low_price_of_the_day'] = 'N/A'
+                ticker_data['open_price_of_the_day'] = 'N/A'
+                ticker_data['previous_close_price'] = 'N/A'
+                ticker_data['error'] = quote.get('error') if quote else 'Could not fetch real-time price from yfinance.'
+            watchlist_with_data.append(ticker_data)
 
         return {"watchlist": watchlist_with_data}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error getting watchlist: {e}")
 
+def _watchlist_ref(user_id: str):
+    return db.collection('users').document(user_id).collection('watchlist')
+
+_ACTION_TAGS = {"BUY": "BULLISH", "SELL": "BEARISH", "HOLD": "NEUTRAL"}
+
+def _signal_analysis(finrl_data: dict) -> dict:
+    """A card analysis stated from the model's signal alone, for tickers without a generated one."""
+    action = finrl_data.get("recommended_action")
+    return {
+        "summary_text": f"The model's signal for {finrl_data.get('ticker')} is {action} (action value {finrl_data.get('action_value', 0):+.2f}) as of {finrl_data.get('prediction_date')}. Ask about {finrl_data.get('ticker')} for a detailed analysis.",
+        "action_tags": [_ACTION_TAGS.get(action, "NEUTRAL")],
+        "pros": [],
+        "cons": [],
+    }
+
+def _watchlist_summary_fallback(buckets: dict) -> str:
+    parts = [f"{action.title()}: {', '.join(tickers)}" for action, tickers in buckets.items() if tickers]
+    return "Here is the model's latest view of your watchlist. " + "; ".join(parts) + "."
+
+async def analyze_watchlist(user_id: str) -> dict:
+    """
+    Scores the user's whole watchlist at once: one Firestore read for the
+    watchlist, one forward pass for every ticker (or none, when the nightly
+    precompute covers them), one bulk quote lookup and one LLM call for the
+    summary. Cards use the precomputed card analysis where there is one and a
+    signal-only analysis otherwise, so their cost doesn't grow with the
+    watchlist. Returns {"summary_text", "watchlist_cards", "buy", "sell",
+    "hold", "unsupported_tickers"} or {"error"}.
+    """
+    if not user_id:
+        return {"error": "Please sign in to analyze your watchlist."}
+    await wait_until_ready()
+    try:
+        docs = await timed_thread("firestore.watchlist_get", _watchlist_ref(user_id).get)
+    except Exception as e:
+        print(f"Error reading watchlist for {user_id}: {e}")
+        return {"error": "I couldn't read your watchlist right now."}
+
+    tickers = list(dict.fromkeys(
+        (doc.to_dict() or {}).get('ticker', '').strip().upper() for doc in docs
+    ))
+    tickers = [t for t in tickers if t]
+    if not tickers:
+        return {"summary_text": "Your watchlist is empty. Add some stocks to it and I can analyze them together.", "watchlist_cards": []}
+    supported = [t for t in tickers if t in TICKER_LIST_FROM_DATA]
+    unsupported = [t for t in tickers if t not in TICKER_LIST_FROM_DATA]
+    if not supported:
+        return {"error": f"I don't have model coverage for the stocks on your watchlist ({', '.join(unsupported)})."}
+
+    holdings_task = asyncio.create_task(asyncio.to_thread(_load_holdings, user_id))
+    quotes_task = asyncio.create_task(asyncio.to_thread(get_bulk_quotes, supported))
+    try:
+        precomputed = await asyncio.to_thread(read_precomputed, supported, False)
+        holdings = await holdings_task
+        if holdings is None and len(precomputed) == len(supported):
+            predictions = {t: entry["prediction"] for t, entry in precomputed.items()}
+        else:
+            precomputed = {}
+            predictions = await get_batch_dynamic_finrl_predictions(supported, holdings=holdings)
+        if "error" in predictions:
+            return {"error": "I couldn't retrieve FinRL predictions for your watchlist at this time."}
+
+        buckets = {"BUY": [], "SELL": [], "HOLD": []}
+        for ticker in supported:
+            prediction = predictions.get(ticker)
+            if prediction and "error" not in prediction:
+                buckets[prediction["recommended_action"]].append(ticker)
+
+        summary_task = asyncio.create_task(get_watchlist_analysis_summary(buckets["BUY"], buckets["SELL"], buckets["HOLD"]))
+        quotes = await quotes_task
+        cards = []
+        for ticker in supported:
+            finrl_data = predictions.get(ticker)
+            if not finrl_data or "error" in finrl_data:
+                continue
+            quote = quotes.get(ticker) or {}
+            finrl_data.setdefault("key_metrics", {})
+            finrl_data["key_metrics"]["current_price"] = quote.get("current_price", "N/A") if "error" not in quote else "N/A"
+            finrl_data["key_metrics"]["percent_change"] = quote.get("percent_change", "N/A") if "error" not in quote else "N/A"
+            analysis = precomputed.get(ticker, {}).get("analysis") or _signal_analysis(finrl_data)
+            cards.append(_build_card(finrl_data, analysis))
+
+        summary = await summary_task
+    finally:
+        for task in (holdings_task, quotes_task):
+            if not task.done():
+                task.cancel()
+
+    summary_text = summary.get("summary_text") if "error" not in summary else None
+    return {
+        "summary_text": summary_text or _watchlist_summary_fallback(buckets),
+        "watchlist_cards": cards,
+        "buy": buckets["BUY"],
+        "sell": buckets["SELL"],
+        "hold": buckets["HOLD"],
+        "unsupported_tickers": unsupported,
+    }
+
+def _portfolio_ref(user_id: str):
+    return db.collection('users').document(user_id).collection('portfolio').document('holdings')
+
+@instrumented("firestore.portfolio_get")
+def _load_holdings(user_id: str):
+    """The user's saved holdings, or None if they haven't submitted any (or they can't be read)."""
+    try:
+        doc = _portfolio_ref(user_id).get()
+        return doc.to_dict() if doc.exists else None
+    except Exception as e:
+        print(f"Error loading holdings for {user_id}: {e}")
+        return None
+
+async def set_portfolio(user_id: str, holdings: PortfolioHoldings):
+    # Holdings are normalized against the model's universe.
+    await wait_until_ready()
+    try:
+        normalized = normalize_holdings(holdings.dict())
+        await timed_thread("firestore.portfolio_set", lambda: _portfolio_ref(user_id).set({
+            **normalized,
+            'updated_at': firestore.SERVER_TIMESTAMP
+        }))
+        ignored = sorted(set(t.upper() for t in holdings.shares) - set(normalized["shares"]))
+        return {"message": f"Saved holdings for {user_id}.", "holdings": normalized, "ignored_tickers": ignored}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error saving holdings: {e}")
+
+async def get_portfolio(user_id: str):
+    holdings = await asyncio.to_thread(_load_holdings, user_id)
+    if holdings is None:
+        raise HTTPException(status_code=404, detail="No holdings saved for this user.")
+    holdings.pop('updated_at', None)
+    return {"holdings": holdings}
+
+async def get_portfolio_advice(user_id: str, tickers: str = None, days: int = 90):
+    holdings = await asyncio.to_thread(_load_holdings, user_id)
+    if holdings is None:
+        raise HTTPException(status_code=404, detail="No holdings saved for this user.")
+    await wait_until_ready()
+    holdings = normalize_holdings(holdings)
+    ticker_list = [t.strip().upper() for t in tickers.split(',') if t.strip()] if tickers else list(holdings["shares"])
+    if not ticker_list:
+        return {"predictions": {}}
+    predictions = await get_batch_dynamic_finrl_predictions(ticker_list, days=days, holdings=holdings)
+    if "error" in predictions:
+        raise HTTPException(status_code=503, detail=predictions["error"])
+    return {"predictions": predictions}
+
+async def score_portfolios(request: PortfolioPredictionRequest):
+    portfolios = {p.user_id: {"cash": p.cash, "shares": p.shares} for p in request.portfolios}
+    tickers = [t.upper() for t in request.tickers] if request.tickers is not None else None
+    predictions = await get_portfolio_predictions(portfolios, tickers=tickers, days=request.days)
+    if "error" in predictions:
+        raise HTTPException(status_code=503, detail=predictions["error"])
+    return {"predictions": predictions}
+
 async def get_stocks(limit: int = None):
+    await wait_until_ready()
     if limit:
         return {"stocks": TICKER_LIST_FROM_DATA[:limit]}
     return {"stocks": TICKER_LIST_FROM_DATA}
 
+async def get_inference_metrics():
+    return {**get_inference_stats(), "card_cache": get_card_cache().stats()}
+
+def _connect_firestore():
+    try:
+        if isinstance(db, LazyObject):
+            db.resolve()
+    except Exception as e:
+        print(f"Error initializing Firestore: {e}")
+
+async def warm_up():
+    """
+    Loads the FinRL engine (model, trade data, one dummy forward pass) and
+    creates the Firestore client, both in worker threads. Started once the
+    server is accepting connections; /readyz reports when the engine is ready.
+    """
+    await asyncio.gather(wait_until_ready(), asyncio.to_thread(_connect_firestore))
+
 async def get_single_stock_data(ticker: str):
     loop = asyncio.get_event_loop()
     quote_data = await loop.run_in_executor(None, get_yfinance_quote, ticker)
@@ -247,74 +658,214 @@ async def get_single_stock_data(ticker: str):
     return combined_data
 
 async def get_stock_data(tickers: str):
-    loop = asyncio.get_event_loop()
     ticker_list = tickers.split(',')
+    quotes = await asyncio.to_thread(get_bulk_quotes, ticker_list)
     results = []
     for ticker in ticker_list:
-        quote_data = await loop.run_in_executor(None, get_yfinance_quote, ticker)
-        profile_data = await loop.run_in_executor(None, get_yfinance_profile, ticker)
+        quote_data = quotes.get(ticker.strip().upper()) or {"error": f"Could not fetch data for {ticker}."}
         
         combined_data = {"ticker": ticker}
         if "error" in quote_data:
             combined_data["error"] = quote_data["error"]
         else:
             combined_data.update(quote_data)
-            combined_data["name"] = profile_data.get("name", ticker)
+            combined_data["name"] = quote_data.get("name", ticker)
 
         results.append(combined_data)
     return results
 
-async def get_conversations(user_id: str):
+def _parse_cursor(value: str, name: str):
+    """
+    (timestamp, document id) from a `next_before` / `next_after` token
+    ("<ISO 8601 timestamp>/<document id>"), or (timestamp, None) for a bare timestamp.
+    """
+    if value is None:
+        return None
+    timestamp, _, doc_id = value.partition('/')
+    try:
+        cursor = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid '{name}' cursor; expected a page token or an ISO 8601 timestamp.")
+    return (cursor if cursor.tzinfo else cursor.replace(tzinfo=timezone.utc)), doc_id or None
+
+def _apply_cursor(query, cursor, op: str, starts_page: bool):
+    """
+    Bounds `query` (ordered by timestamp, then document id) by `cursor`. With a
+    document id, documents sharing the cursor's timestamp are split by id, so
+    none is skipped or repeated; a bare timestamp is compared with `op`.
+    """
+    timestamp, doc_id = cursor
+    if doc_id is None:
+        return query.where('timestamp', op, timestamp)
+    values = {'timestamp': timestamp, '__name__': doc_id}
+    return query.start_after(values) if starts_page else query.end_before(values)
+
+def _page_size(limit: int, before, after, delta: bool = False):
+    """Documents to read: everything when no paging parameter is given, else a bounded page."""
+    if limit is None:
+        if delta:
+            return MAX_PAGE_SIZE
+        if before is None and after is None:
+            return None
+        return DEFAULT_PAGE_SIZE
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+async def _fetch_page(collection_ref, limit: int, before, after):
+    """
+    Reads one page of `collection_ref` by `timestamp` (ties broken by document
+    id), using Firestore limits so only the page (plus one document, to detect
+    more) is read. With `after`, the page is the oldest documents newer than
+    it; otherwise the newest ones older than `before`. Returns (documents
+    oldest first, has_more).
+    """
+    newest_first = after is None
+    direction = firestore.Query.DESCENDING if newest_first else firestore.Query.ASCENDING
+    query = collection_ref.order_by('timestamp', direction=direction).order_by('__name__', direction=direction)
+    if before is not None:
+        query = _apply_cursor(query, before, '<', starts_page=newest_first)
+    if after is not None:
+        query = _apply_cursor(query, after, '>', starts_page=not newest_first)
+    if limit is not None:
+        query = query.limit(limit + 1)
+
+    docs = await timed_thread("firestore.page_query", lambda: list(query.stream()))
+    has_more = limit is not None and len(docs) > limit
+    docs = docs[:limit] if limit is not None else docs
+    return (docs[::-1] if newest_first else docs), has_more
+
+def _page_token(doc):
+    timestamp = doc.to_dict().get("timestamp") if doc is not None else None
+    return f"{timestamp.isoformat()}/{doc.id}" if timestamp else None
+
+def _page_cursors(docs: list) -> dict:
+    return {
+        "next_before": _page_token(docs[0] if docs else None),
+        "next_after": _page_token(docs[-1] if docs else None),
+    }
+
+async def get_conversations(user_id: str, limit: int = None, before: str = None, since: str = None):
+    """
+    Lists a user's conversations, newest first. Without parameters every
+    conversation is returned. `limit` returns one page; `before` (the
+    `next_before` of the previous page) continues with older ones, and `since`
+    returns only conversations started after that timestamp.
+    """
+    before, after = _parse_cursor(before, "before"), _parse_cursor(since, "since")
     try:
-        conversations_ref = db.collection('users').document(user_id).collection('conversations').order_by('timestamp', direction=firestore.Query.DESCENDING)
-        docs = await asyncio.to_thread(conversations_ref.stream)
+        await persistence_queue.flush(user_id)
+        conversations_ref = db.collection('users').document(user_id).collection('conversations')
+        docs, has_more = await _fetch_page(conversations_ref, _page_size(limit, before, after), before, after)
         conversations = []
-        for doc in docs:
+        for doc in reversed(docs):
             conv_data = doc.to_dict()
             conversations.append({
                 "id": doc.id,
                 "title": conv_data.get("title", "Untitled Conversation"),
                 "timestamp": conv_data.get("timestamp").isoformat() if conv_data.get("timestamp") else None
             })
-        return {"conversations": conversations}
+        return {"conversations": conversations, "has_more": has_more, **_page_cursors(docs)}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error getting conversations: {e}")
 
 async def delete_conversation(user_id: str, conversation_id: str):
     try:
-        loop = asyncio.get_event_loop()
-        messages_ref = db.collection('users').document(user_id).collection('conversations').document(conversation_id).collection('messages')
-        docs = await loop.run_in_executor(None, messages_ref.stream)
-        for doc in docs:
-            await loop.run_in_executor(None, doc.reference.delete)
-
-        await loop.run_in_executor(None, lambda: db.collection('users').document(user_id).collection('conversations').document(conversation_id).delete())
-        return {"message": f"Conversation {conversation_id} deleted successfully."}
+        await persistence_queue.discard(user_id, conversation_id)
+        conversation_ref = _conversation_ref(user_id, conversation_id)
+        deleter = BulkDeleter()
+        await deleter.delete_collection(conversation_ref.collection('messages'))
+        await deleter.delete_documents([conversation_ref])
+        await deleter.wait()
+        if deleter.failed:
+            raise RuntimeError(f"{deleter.failed} documents could not be deleted")
+        return {"message": f"Conversation {conversation_id} deleted successfully.", **deleter.progress()}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error deleting conversation: {e}")
 
+# Subcollections nested under each document of a user's subcollections.
+USER_DATA_NESTED_SUBCOLLECTIONS = {'conversations': ('messages',)}
+
+async def _run_user_data_deletion(user_id: str, job: dict):
+    def on_progress(deleted: int, batches: int):
+        job.update(deleted_documents=deleted, batches=batches)
+
+    try:
+        await persistence_queue.discard(user_id)
+        user_ref = db.collection('users').document(user_id)
+        deleter = BulkDeleter(on_progress=on_progress)
+        subcollections = await timed_thread("firestore.list_collections", lambda: list(user_ref.collections()))
+        await asyncio.gather(*(
+            deleter.delete_collection(collection_ref, USER_DATA_NESTED_SUBCOLLECTIONS.get(collection_ref.id, ()))
+            for collection_ref in subcollections
+        ))
+        await deleter.delete_documents([user_ref])
+        await deleter.wait()
+        job.update(deleter.progress())
+        job["status"] = "failed" if deleter.failed else "completed"
+    except Exception as e:
+        print(f"Error deleting data for {user_id}: {e}")
+        job.update(status="failed", error=str(e))
+
+async def delete_user_data(user_id: str):
+    """
+    Starts deleting everything stored for a user (conversations with their
+    messages, watchlist, holdings and the user document) in the background.
+    Returns a job whose progress can be polled with get_deletion_job.
+    """
+    job_id = str(uuid.uuid4())
+    job = {"job_id": job_id, "user_id": user_id, "status": "running", "deleted_documents": 0, "batches": 0}
+    _deletion_jobs.set(job_id, job)
+    task = asyncio.create_task(_run_user_data_deletion(user_id, job))
+    _deletion_tasks.add(task)
+    task.add_done_callback(_deletion_tasks.discard)
+    return job
+
+async def get_deletion_job(user_id: str, job_id: str):
+    job = _deletion_jobs.get(job_id)
+    if job is None or job["user_id"] != user_id:
+        raise HTTPException(status_code=404, detail="Deletion job not found.")
+    return job
+
 async def rename_conversation(user_id: str, conversation_id: str, request: RenameRequest):
     try:
-        loop = asyncio.get_event_loop()
-        await loop.run_in_executor(None, lambda: db.collection('users').document(user_id).collection('conversations').document(conversation_id).update({
+        await persistence_queue.flush(user_id)
+        await timed_thread("firestore.conversation_rename", lambda: db.collection('users').document(user_id).collection('conversations').document(conversation_id).update({
             'title': request.new_title
         }))
         return {"message": f"Conversation {conversation_id} renamed successfully."}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error renaming conversation: {e}")
 
-async def get_chat_history(user_id: str, conversation_id: str):
+async def get_chat_history(user_id: str, conversation_id: str, limit: int = None, before: str = None, after: str = None, since: str = None):
+    """
+    Returns a conversation's messages, oldest first. Without parameters the
+    whole history is returned. Otherwise one page is read:
+
+    - `limit` alone: the latest `limit` messages
+    - `before`: messages older than the cursor (scrolling back)
+    - `after`: messages newer than the cursor
+    - `since`: delta mode, every message newer than the client's last one
+      (up to MAX_PAGE_SIZE; follow `next_after` while `has_more`)
+
+    Each page returns `next_before` and `next_after` tokens for the next
+    request; a bare ISO 8601 timestamp (e.g. of the client's last message)
+    also works as a cursor.
+    """
+    before = _parse_cursor(before, "before")
+    after = _parse_cursor(since, "since") if since is not None else _parse_cursor(after, "after")
     try:
-        loop = asyncio.get_event_loop()
-        messages_ref = db.collection('users').document(user_id).collection('conversations').document(conversation_id).collection('messages').order_by('timestamp')
-        docs = await loop.run_in_executor(None, messages_ref.stream)
+        await persistence_queue.flush(user_id)
+        messages_ref = _conversation_ref(user_id, conversation_id).collection('messages')
+        docs, has_more = await _fetch_page(messages_ref, _page_size(limit, before, after, delta=since is not None), before, after)
         chat_history = []
         for doc in docs:
             message_data = doc.to_dict()
+            timestamp = message_data.get("timestamp")
             chat_history.append({
+                "id": doc.id,
                 "sender": message_data.get("sender"),
-                "message": message_data.get("message")
+                "message": message_data.get("message"),
+                "timestamp": timestamp.isoformat() if timestamp else None
             })
-        return {"chat_history": chat_history}
+        return {"chat_history": chat_history, "has_more": has_more, **_page_cursors(docs)}
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error getting chat history: {e}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Error getting chat history: {e}")
@@ -0,0 +1,159 @@
+# backend/term_annotator.py
+"""
+Glossary term annotation for chat text.
+
+The glossary is compiled once into a single regular expression shaped like a
+trie of the terms (`s(?:tock|&p 500)|bond|...`), so scanning a text costs
+time proportional to its length: at each word start the matcher walks one path
+down the trie rather than trying every term in turn, however big the glossary
+gets. The JSON file is watched and recompiled when it changes.
+
+Matching is what add_tooltips' pattern meant: case-insensitive whole words
+(a word boundary on both sides, so "stock" doesn't mark the stem of
+"stocks"), with the longest term preferred where several start together.
+"""
+import json
+import os
+import re
+import threading
+import time
+
+FINANCIAL_TERMS_PATH = os.getenv("FINANCIAL_TERMS_PATH", "../frontend/lib/financial-terms.json")
+
+# How often, at most, the glossary file is checked for changes.
+TERMS_RELOAD_INTERVAL = float(os.getenv("TERMS_RELOAD_INTERVAL", "2"))
+
+_END = ""
+
+def _trie_pattern(node: dict) -> str:
+    """Regex source matching every term in the trie `node`, longest alternative preferred."""
+    branches = [re.escape(char) + _trie_pattern(child) for char, child in sorted(node.items()) if char != _END]
+    if not branches:
+        return ""
+    body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+    if _END in node:
+        # The term ending here also matches; the greedy `?` tries longer terms
+        # first and backs off to this one if they don't end on a word boundary.
+        return "(?:" + body + ")?"
+    return body
+
+def compile_glossary(terms) -> re.Pattern:
+    """Compiles `terms` into one case-insensitive trie-shaped matcher, or None if there are none."""
+    trie = {}
+    for term in terms:
+        if not term:
+            continue
+        node = trie
+        for char in term.lower():
+            node = node.setdefault(char, {})
+        node[_END] = {}
+    if not trie:
+        return None
+    return re.compile(r"\b(?:" + _trie_pattern(trie) + r")\b", re.IGNORECASE)
+
+class TermAnnotator:
+    """
+    Splits text into parts for the frontend: plain runs as
+    {"text", "isTerm": False} and glossary terms as
+    {"text", "isTerm": True, "definition"}.
+    """
+
+    def __init__(self, glossary: dict = None, path: str = None, reload_interval: float = TERMS_RELOAD_INTERVAL):
+        self.path = path
+        self.reload_interval = reload_interval
+        self._lock = threading.Lock()
+        self._checked_at = 0.0
+        self._signature = None
+        self._reloading = False
+        self._definitions = {}
+        self._pattern = None
+        if glossary is not None:
+            self._build(glossary)
+        elif path is not None:
+            self.reload()
+
+    def _build(self, glossary: dict):
+        definitions = {}
+        for term, entry in glossary.items():
+            definitions.setdefault(term.lower(), (entry or {}).get("definition", ""))
+        pattern = compile_glossary(definitions)
+        # Swapped together, so a concurrent annotate() sees one glossary or the other.
+        self._definitions, self._pattern = definitions, pattern
+
+    def _file_signature(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def reload(self) -> bool:
+        """Recompiles from `path` if the file changed. A file that can't be read or parsed keeps the current glossary."""
+        with self._lock:
+            self._checked_at = time.monotonic()
+            signature = self._file_signature()
+            if signature == self._signature:
+                return False
+            try:
+                with open(self.path, 'r') as f:
+                    glossary = json.load(f)
+            except FileNotFoundError:
+                glossary = {}
+            except (OSError, json.JSONDecodeError) as e:
+                print(f"Backend: Could not load financial terms from {self.path}: {e}")
+                return False
+            self._build(glossary)
+            self._signature = signature
+            print(f"Backend: Loaded {len(self._definitions)} financial terms.")
+            return True
+
+    def _maybe_reload(self):
+        """
+        Checks the file at most every `reload_interval` seconds. A changed
+        glossary is recompiled on a background thread (large ones take a
+        while); annotation keeps using the current one until it's swapped in.
+        """
+        if self.path is None or self._reloading or time.monotonic() - self._checked_at < self.reload_interval:
+            return
+        self._checked_at = time.monotonic()
+        if self._file_signature() == self._signature:
+            return
+        self._reloading = True
+        threading.Thread(target=self._background_reload, daemon=True).start()
+
+    def _background_reload(self):
+        try:
+            self.reload()
+        finally:
+            self._reloading = False
+
+    def _annotate(self, pattern, definitions: dict, text: str) -> list:
+        if pattern is None or not text:
+            return [{"text": text, "isTerm": False}]
+        parts = []
+        last_idx = 0
+        for match in pattern.finditer(text):
+            start, end = match.span()
+            if start > last_idx:
+                parts.append({"text": text[last_idx:start], "isTerm": False})
+            term = match.group(0)
+            parts.append({"text": term, "isTerm": True, "definition": definitions.get(term.lower(), "")})
+            last_idx = end
+        if last_idx < len(text):
+            parts.append({"text": text[last_idx:], "isTerm": False})
+        return parts
+
+    def annotate(self, text: str) -> list:
+        self._maybe_reload()
+        return self._annotate(self._pattern, self._definitions, text)
+
+    def annotate_many(self, texts: list) -> list:
+        """annotate() for each of `texts`, all against the same glossary version."""
+        self._maybe_reload()
+        pattern, definitions = self._pattern, self._definitions
+        return [self._annotate(pattern, definitions, text) for text in texts]
+
+    def __len__(self):
+        return len(self._definitions)
+
+term_annotator = TermAnnotator(path=FINANCIAL_TERMS_PATH)
@@ -0,0 +1,65 @@
+# backend/tests/test_chat_history_paging.py
+"""
+Tests of chat history pagination against the in-memory Firestore double.
+
+Run from the backend directory:
+    python -m unittest discover tests
+"""
+import unittest
+from datetime import datetime, timedelta, timezone
+from benchmarks import fake_firestore
+
+fake_firestore.install(fake_firestore.FakeFirestore())
+
+import services
+
+START = datetime(2024, 1, 2, 9, 30, tzinfo=timezone.utc)
+
+class ChatHistoryPagingTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.client = fake_firestore.FakeFirestore()
+        services.db = self.client
+        messages = (self.client.collection('users').document('u1')
+                    .collection('conversations').document('c1').collection('messages'))
+        # m2-m4 were committed in one batch and share a timestamp.
+        offsets = [0, 1, 2, 2, 2, 3, 4]
+        self.ids = [f"m{i}" for i in range(len(offsets))]
+        for doc_id, offset in zip(self.ids, offsets):
+            messages.document(doc_id).set({
+                'sender': 'user', 'message': doc_id, 'timestamp': START + timedelta(seconds=offset),
+            })
+
+    async def _history(self, **params):
+        return await services.get_chat_history('u1', 'c1', **params)
+
+    async def test_scrolling_back_returns_every_message_once(self):
+        page = await self._history(limit=2)
+        seen = [m['id'] for m in page['chat_history']]
+        while page['has_more']:
+            page = await self._history(limit=2, before=page['next_before'])
+            seen = [m['id'] for m in page['chat_history']] + seen
+        self.assertEqual(seen, self.ids)
+
+    async def test_paging_forward_returns_every_message_once(self):
+        page = await self._history(limit=2, after=f"{START.isoformat()}/m0")
+        seen = ['m0'] + [m['id'] for m in page['chat_history']]
+        while page['has_more']:
+            page = await self._history(limit=2, after=page['next_after'])
+            seen += [m['id'] for m in page['chat_history']]
+        self.assertEqual(seen, self.ids)
+
+    async def test_delta_after_a_tied_message(self):
+        page = await self._history(since=f"{(START + timedelta(seconds=2)).isoformat()}/m3")
+        self.assertEqual([m['id'] for m in page['chat_history']], ['m4', 'm5', 'm6'])
+
+    async def test_bare_timestamp_cursor(self):
+        page = await self._history(since=(START + timedelta(seconds=2)).isoformat())
+        self.assertEqual([m['id'] for m in page['chat_history']], ['m5', 'm6'])
+
+    async def test_invalid_cursor_is_rejected(self):
+        with self.assertRaises(services.HTTPException) as raised:
+            await self._history(before="yesterday")
+        self.assertEqual(raised.exception.status_code, 400)
+
+if __name__ == "__main__":
+    unittest.main()
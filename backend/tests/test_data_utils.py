@@ -0,0 +1,69 @@
+# backend/tests/test_data_utils.py
+"""
+Tests of bulk quote lookups against a stubbed yfinance.
+
+Run from the backend directory:
+    python -m unittest discover tests
+"""
+import types
+import unittest
+from unittest import mock
+import pandas as pd
+import data_utils
+from cache_utils import LRUCache
+
+class _Upstream:
+    """yfinance stand-in that knows AAA; .info raises for anything else, as it can for unknown symbols."""
+
+    def __init__(self):
+        self.info_calls = []
+        self.module = types.SimpleNamespace(download=self.download, Ticker=self.ticker)
+
+    def download(self, tickers, **kwargs) -> pd.DataFrame:
+        bars = pd.DataFrame(
+            {"Open": [9.5, 10.5], "High": [10.5, 11.0], "Low": [9.0, 10.0], "Close": [10.0, 10.8], "Volume": [1e6, 1e6]},
+            index=pd.to_datetime(["2024-01-02", "2024-01-03"]),
+        )
+        return pd.concat({"AAA": bars}, axis=1) if "AAA" in tickers else pd.DataFrame()
+
+    def ticker(self, symbol: str):
+        upstream = self
+
+        class Ticker:
+            @property
+            def info(self):
+                upstream.info_calls.append(symbol)
+                if symbol != "AAA":
+                    raise ValueError(f"No data found for {symbol}")
+                return {"regularMarketPrice": 10.8, "previousClose": 10.0, "longName": "AAA Inc."}
+        return Ticker()
+
+class BulkQuotesTest(unittest.TestCase):
+    def setUp(self):
+        self.upstream = _Upstream()
+        patches = [
+            mock.patch.object(data_utils, "yf", self.upstream.module),
+            mock.patch.object(data_utils, "_quote_cache", LRUCache(64, ttl=60)),
+            mock.patch.object(data_utils, "_profile_cache", LRUCache(64, ttl=60)),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def test_names_are_looked_up_for_quoted_tickers_only(self):
+        quotes = data_utils.get_bulk_quotes(["aaa", "bad"])
+        self.assertEqual(list(quotes), ["AAA", "BAD"])
+        self.assertEqual(quotes["AAA"]["name"], "AAA Inc.")
+        self.assertAlmostEqual(quotes["AAA"]["change"], 0.8)
+        self.assertIn("error", quotes["BAD"])
+        # One .info for AAA's name and one for BAD's fallback quote, none for BAD's name.
+        self.assertEqual(sorted(self.upstream.info_calls), ["AAA", "BAD"])
+
+    def test_cached_error_quote_skips_the_name_lookup(self):
+        data_utils._quote_cache.set("BAD", {"error": "Could not fetch data for BAD."})
+        quotes = data_utils.get_bulk_quotes(["BAD"])
+        self.assertIn("error", quotes["BAD"])
+        self.assertEqual(self.upstream.info_calls, [])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,53 @@
+# backend/tests/test_indicators.py
+"""
+Parity of the vectorized indicator engine and the incremental indicator state
+with stockstats, on a small fixed OHLCV universe.
+
+Run from the backend directory:
+    python -m unittest discover tests
+"""
+import unittest
+import numpy as np
+from benchmarks.indicator_parity import make_universe, stockstats_per_ticker
+from indicators import INDICATOR_COLUMNS, PARITY_ATOL, PARITY_RTOL, preprocess_panel
+from indicator_state import IndicatorState
+
+class IndicatorParityTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        universe = make_universe(num_tickers=4, num_days=120, seed=11)
+        # One ticker lists late and one stops trading early.
+        dates = sorted(universe["date"].unique())
+        late = (universe["tic"] == "T0001") & (universe["date"] < dates[20])
+        delisted = (universe["tic"] == "T0002") & (universe["date"] > dates[-15])
+        cls.universe = universe[~late & ~delisted].reset_index(drop=True)
+        cls.expected = stockstats_per_ticker(cls.universe).sort_values(["tic", "date"]).reset_index(drop=True)
+
+    def assert_matches(self, actual, expected):
+        for column in INDICATOR_COLUMNS:
+            np.testing.assert_allclose(
+                actual[column].to_numpy(dtype=float), expected[column].to_numpy(dtype=float),
+                rtol=PARITY_RTOL, atol=PARITY_ATOL, equal_nan=True, err_msg=column,
+            )
+
+    def test_panel_matches_stockstats(self):
+        actual = preprocess_panel(self.universe).sort_values(["tic", "date"]).reset_index(drop=True)
+        self.assertEqual(len(actual), len(self.expected))
+        np.testing.assert_array_equal(actual["date"].to_numpy(), self.expected["date"].to_numpy())
+        self.assert_matches(actual, self.expected)
+
+    def test_incremental_state_matches_stockstats(self):
+        tickers = sorted(self.universe["tic"].unique())
+        state = IndicatorState(tickers)
+        state.update(self.universe)
+        last_bars = self.expected.groupby("tic").tail(1).reset_index(drop=True)
+        actual = [state.latest(t) for t in tickers]
+        self.assertEqual([row["date"] for row in actual], list(last_bars["date"]))
+        for column in INDICATOR_COLUMNS:
+            np.testing.assert_allclose(
+                [row[column] for row in actual], last_bars[column].to_numpy(dtype=float),
+                rtol=PARITY_RTOL, atol=PARITY_ATOL, err_msg=column,
+            )
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,37 @@
+# backend/tests/test_intent_router.py
+"""
+Tests of the chat intent fast path.
+
+Run from the backend directory:
+    python -m unittest discover tests
+"""
+import unittest
+from intent_router import DEFAULT_DAYS, parse_intent_fast_path
+
+KNOWN_TICKERS = ['AAPL', 'META', 'MSFT', 'NVDA']
+
+def _tickers(user_message: str):
+    intent = parse_intent_fast_path(user_message, KNOWN_TICKERS)
+    return None if intent is None else intent["tickers"]
+
+class FastPathTest(unittest.TestCase):
+    def test_aliases_and_tickers(self):
+        intent = parse_intent_fast_path("how are apple and $NVDA doing over 2 weeks?", KNOWN_TICKERS)
+        self.assertEqual(intent, {"analyze_watchlist": False, "tickers": ["AAPL", "NVDA"], "days": 14})
+        self.assertEqual(parse_intent_fast_path("what about microsoft", KNOWN_TICKERS)["days"], DEFAULT_DAYS)
+
+    def test_meta_as_a_ticker(self):
+        self.assertEqual(_tickers("should I buy META?"), ["META"])
+        self.assertEqual(_tickers("thoughts on $meta"), ["META"])
+        self.assertEqual(_tickers("is meta stock a buy"), ["META"])
+        self.assertEqual(_tickers("how did meta platforms do this year"), ["META"])
+
+    def test_meta_as_an_ordinary_word(self):
+        self.assertIsNone(_tickers("that's a bit meta"))
+        self.assertEqual(_tickers("apple again? that's a bit meta"), ["AAPL"])
+
+    def test_unknown_upper_case_token_needs_the_llm(self):
+        self.assertIsNone(_tickers("how is XYZQ doing"))
+
+if __name__ == "__main__":
+    unittest.main()
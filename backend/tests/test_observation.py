@@ -0,0 +1,63 @@
+# backend/tests/test_observation.py
+"""
+Tests of the latest-date observation vector.
+
+Run from the backend directory:
+    python -m unittest discover tests
+"""
+import unittest
+import numpy as np
+import pandas as pd
+from observation import LatestObservation
+
+INDICATORS = ['macd', 'rsi_30']
+
+def _latest_slice() -> pd.DataFrame:
+    return pd.DataFrame({
+        'date': pd.to_datetime(['2024-01-02'] * 3),
+        'tic': ['AAA', 'BBB', 'CCC'],
+        'close': [10.0, 20.0, 30.0],
+        'volume': [100.0, 200.0, 300.0],
+        'macd': [0.1, 0.2, 0.3],
+        'rsi_30': [40.0, 50.0, 60.0],
+    })
+
+class LatestObservationTest(unittest.TestCase):
+    def setUp(self):
+        self.base = LatestObservation(_latest_slice(), INDICATORS, 1000.0)
+
+    def test_layout_matches_the_training_state(self):
+        expected = [1000.0, 0, 0, 0, 10, 20, 30, 0.1, 0.2, 0.3, 40, 50, 60]
+        np.testing.assert_allclose(self.base.observation, expected, rtol=1e-6)
+
+    def test_patching_a_copy_leaves_the_base_untouched(self):
+        before = self.base.observation.copy()
+        observation = self.base.copy()
+        observation.patch('BBB', {'date': pd.Timestamp('2024-01-03'), 'close': 21.0, 'macd': 0.25})
+
+        self.assertEqual(observation.value('BBB', 'close'), 21.0)
+        self.assertEqual(observation.observation[5], 21.0)
+        self.assertEqual(observation.prediction_date, pd.Timestamp('2024-01-03'))
+        np.testing.assert_array_equal(self.base.observation, before)
+        self.assertEqual(self.base.value('BBB', 'close'), 20.0)
+        self.assertEqual(self.base.overrides, {})
+        self.assertEqual(self.base.prediction_date, pd.Timestamp('2024-01-02'))
+
+    def test_requests_for_other_tickers_see_the_same_vector(self):
+        first = self.base.copy()
+        first.patch('AAA', {'date': pd.Timestamp('2024-01-03'), 'close': 11.0})
+        second = self.base.copy()
+        second.patch('CCC', {'date': pd.Timestamp('2024-01-03'), 'close': 31.0})
+
+        self.assertEqual(second.value('AAA', 'close'), 10.0)
+        self.assertNotEqual(first.state_key, second.state_key)
+        self.assertEqual(self.base.copy().state_key, self.base.state_key)
+
+    def test_with_holdings_sets_cash_and_shares_only(self):
+        observation = self.base.with_holdings(500.0, {'CCC': 7.0, 'ZZZ': 1.0})
+        self.assertEqual(observation[0], 500.0)
+        np.testing.assert_array_equal(observation[1:4], [0.0, 0.0, 7.0])
+        np.testing.assert_array_equal(observation[4:], self.base.observation[4:])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,135 @@
+# backend/tests/test_persistence.py
+"""
+Tests of the write-behind queue and the bulk deleter against the in-memory
+Firestore double.
+
+Run from the backend directory:
+    python -m unittest discover tests
+"""
+import asyncio
+import unittest
+from unittest import mock
+from benchmarks import fake_firestore
+
+fake_firestore.install(fake_firestore.FakeFirestore())
+
+import persistence
+from persistence import BulkDeleter, WriteBehindQueue
+
+class WriteBehindQueueTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.client = fake_firestore.FakeFirestore()
+        persistence.db = self.client
+
+    def _message_ref(self, user_id: str, conversation_id: str, message_id: str):
+        return (self.client.collection('users').document(user_id)
+                .collection('conversations').document(conversation_id)
+                .collection('messages').document(message_id))
+
+    def _queue_messages(self, queue: WriteBehindQueue, user_id: str, conversation_id: str, count: int):
+        refs = [self._message_ref(user_id, conversation_id, f"m{i}") for i in range(count)]
+        for i, ref in enumerate(refs):
+            queue.set(user_id, conversation_id, ref, {"text": f"message {i}"})
+        return refs
+
+    def _stored(self, refs) -> list:
+        return [self.client._read(ref._path) is not None for ref in refs]
+
+    async def test_flushes_when_flush_size_is_reached(self):
+        queue = WriteBehindQueue(flush_size=3, flush_interval=60)
+        refs = self._queue_messages(queue, "u1", "c1", 2)
+        await asyncio.sleep(0.05)
+        self.assertEqual(self._stored(refs), [False, False])
+
+        refs += self._queue_messages(queue, "u1", "c2", 1)
+        await asyncio.sleep(0.05)
+        self.assertEqual(self._stored(refs), [True, True, True])
+        self.assertEqual(queue.stats(), {"pending": 0, "committed": 3, "failed": 0})
+        await queue.drain()
+
+    async def test_flushes_after_flush_interval(self):
+        queue = WriteBehindQueue(flush_size=100, flush_interval=0.05)
+        refs = self._queue_messages(queue, "u1", "c1", 2)
+        self.assertEqual(self._stored(refs), [False, False])
+        await asyncio.sleep(0.2)
+        self.assertEqual(self._stored(refs), [True, True])
+        await queue.drain()
+
+    async def test_drain_commits_everything_queued(self):
+        queue = WriteBehindQueue(flush_size=100, flush_interval=60)
+        refs = self._queue_messages(queue, "u1", "c1", 3) + self._queue_messages(queue, "u2", "c1", 2)
+        await queue.drain()
+        self.assertEqual(self._stored(refs), [True] * 5)
+        self.assertEqual(queue.stats()["pending"], 0)
+
+    async def test_drain_splits_batches_at_the_firestore_limit(self):
+        queue = WriteBehindQueue(flush_size=10_000, flush_interval=60)
+        refs = self._queue_messages(queue, "u1", "c1", persistence.FIRESTORE_BATCH_LIMIT + 10)
+        round_trips = self.client.round_trips
+        await queue.drain()
+        self.assertTrue(all(self._stored(refs)))
+        self.assertEqual(self.client.round_trips - round_trips, 2)
+
+    async def test_discard_drops_pending_writes(self):
+        queue = WriteBehindQueue(flush_size=100, flush_interval=60)
+        dropped = self._queue_messages(queue, "u1", "c1", 2)
+        kept = self._queue_messages(queue, "u1", "c2", 1) + self._queue_messages(queue, "u2", "c1", 1)
+        await queue.discard("u1", "c1")
+        await queue.drain()
+        self.assertEqual(self._stored(dropped), [False, False])
+        self.assertEqual(self._stored(kept), [True, True])
+
+    async def test_discard_of_a_user_drops_all_their_conversations(self):
+        queue = WriteBehindQueue(flush_size=100, flush_interval=60)
+        dropped = self._queue_messages(queue, "u1", "c1", 1) + self._queue_messages(queue, "u1", "c2", 1)
+        kept = self._queue_messages(queue, "u2", "c1", 1)
+        await queue.discard("u1")
+        await queue.drain()
+        self.assertEqual(self._stored(dropped), [False, False])
+        self.assertEqual(self._stored(kept), [True])
+
+    async def test_discard_waits_for_in_flight_commits(self):
+        self.client.latency = 0.2
+        queue = WriteBehindQueue(flush_size=100, flush_interval=60)
+        refs = self._queue_messages(queue, "u1", "c1", 2)
+        flush = asyncio.create_task(queue.flush())
+        await asyncio.sleep(0.05)
+        self.assertEqual(queue.stats()["pending"], 0)
+
+        await queue.discard("u1", "c1")
+        # The batch taken before the discard has landed, so a deletion that
+        # starts now removes it for good.
+        self.assertEqual(self._stored(refs), [True, True])
+        await flush
+        await queue.drain()
+
+class BulkDeleterTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.client = fake_firestore.FakeFirestore()
+        persistence.db = self.client
+        self.conversations = self.client.collection('users').document('u1').collection('conversations')
+        for conversation_id in ('c1', 'c2'):
+            self.conversations.document(conversation_id).set({'title': conversation_id})
+            for i in range(3):
+                self.conversations.document(conversation_id).collection('messages').document(f"m{i}").set({'message': 'x' * 100})
+        # c3's document was deleted on its own; its messages are still there.
+        self.conversations.document('c3').collection('messages').document('m0').set({'message': 'orphan'})
+
+    async def test_deletes_nested_messages_including_orphans(self):
+        deleter = BulkDeleter()
+        await deleter.delete_collection(self.conversations, ('messages',))
+        await deleter.wait()
+        self.assertEqual(self.client.document_count(), 0)
+        self.assertEqual(deleter.progress(), {"deleted_documents": 10, "batches": 4, "failed_documents": 0})
+
+    async def test_pages_read_document_names_only(self):
+        select = fake_firestore.Query.select
+        with mock.patch.object(fake_firestore.Query, 'select', autospec=True, side_effect=select) as selected:
+            deleter = BulkDeleter()
+            await deleter.delete_collection(self.conversations.document('c1').collection('messages'))
+            await deleter.wait()
+        selected.assert_called_once_with(mock.ANY, ["__name__"])
+        self.assertEqual(deleter.deleted, 3)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+# backend/tests/test_precompute.py
+"""
+Tests of the nightly precompute job's refresh stage against the replayed
+yfinance double.
+
+Run from the backend directory:
+    python -m unittest discover tests
+"""
+import os
+import tempfile
+import unittest
+from unittest import mock
+import numpy as np
+import pandas as pd
+from benchmarks import fake_yfinance
+from trade_store import _panel_from_frame
+
+TICKERS = ['AAA', 'BBB', 'CCC']
+# A Tuesday; the job runs at 17:00 New York time, after that day's close.
+SESSION = pd.Timestamp('2024-03-05')
+NOW = SESSION + pd.Timedelta(hours=17)
+
+def _replay_panel(days: int = 300):
+    dates = pd.bdate_range(end=SESSION, periods=days)
+    rng = np.random.default_rng(3)
+    frames = []
+    for i, ticker in enumerate(TICKERS):
+        close = 50.0 * (i + 1) + np.cumsum(rng.normal(0, 1, days))
+        frames.append(pd.DataFrame({
+            'date': dates, 'tic': ticker,
+            'open': close - 0.5, 'high': close + 1.0, 'low': close - 1.0,
+            'close': close, 'volume': rng.integers(1_000, 10_000, days).astype(float),
+        }))
+    return _panel_from_frame(pd.concat(frames, ignore_index=True))
+
+fake_yfinance.install(fake_yfinance.ReplayMarket(_replay_panel(), last_session=SESSION))
+
+import data_utils
+import finrl_engine
+import history_store
+import precompute
+from indicator_state import IndicatorState
+
+class RunPrecomputeTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        workdir = tempfile.TemporaryDirectory()
+        self.addCleanup(workdir.cleanup)
+        self.history = history_store.HistoryStore(os.path.join(workdir.name, 'history.sqlite3'))
+        self.store = precompute.PrecomputeStore(os.path.join(workdir.name, 'precompute.sqlite3'))
+        self.state = IndicatorState(TICKERS)
+        scored = mock.AsyncMock(return_value={t: {"ticker": t, "suggested_action": "HOLD"} for t in TICKERS})
+        patches = [
+            mock.patch.object(data_utils, '_market_now', return_value=NOW),
+            mock.patch.object(history_store, '_store', self.history),
+            mock.patch.object(precompute, '_store', self.store),
+            mock.patch.object(precompute, 'get_batch_dynamic_finrl_predictions', scored),
+            mock.patch.object(finrl_engine, 'indicator_state', self.state),
+            mock.patch.object(finrl_engine, 'finrl_concept_available', True),
+            mock.patch.object(finrl_engine, 'INDICATOR_STATE_PATH', os.path.join(workdir.name, 'indicator_state.npz')),
+            mock.patch.dict(finrl_engine._engine_state, {"status": "ready"}),
+            mock.patch.object(finrl_engine, 'TICKER_LIST_FROM_DATA', TICKERS),
+            mock.patch.object(precompute, 'TICKER_LIST_FROM_DATA', TICKERS),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    async def test_run_after_the_close_ingests_that_sessions_bar(self):
+        result = await precompute.run_precompute(card_tickers=0)
+        await finrl_engine.flush_indicator_state()
+
+        trading_date = SESSION.strftime('%Y-%m-%d')
+        self.assertEqual(result, {"trading_date": trading_date, "status": precompute.COMPLETE})
+        self.assertEqual(self.store.completed_items(trading_date, "refresh"), set(TICKERS))
+        for ticker in TICKERS:
+            self.assertEqual(self.state.last_date(ticker), SESSION)
+            self.assertEqual(len(self.history.read(ticker, SESSION, SESSION + pd.Timedelta(days=1))), 1)
+
+    def test_session_rolls_over_at_the_close(self):
+        with mock.patch.object(data_utils, '_market_now', return_value=SESSION + pd.Timedelta(hours=16)):
+            self.assertEqual(data_utils.last_completed_session(), SESSION - pd.offsets.BDay(1))
+        self.assertEqual(data_utils.last_completed_session(), SESSION)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,161 @@
+# backend/trade_store.py
+"""
+Columnar storage for the FinRL trade data.
+
+The trade CSV is converted once into a directory of memory-mapped NumPy arrays,
+one (dates x tickers) array per numeric column. Every worker maps the same files,
+so the OS page cache is shared instead of each process holding its own parsed
+copy of the CSV, and only the rows that are actually read get paged in.
+
+Convert (from the backend directory):
+    python trade_store.py
+"""
+import json
+import os
+import shutil
+import numpy as np
+import pandas as pd
+
+TRADE_CSV_PATH = "inference_engine/trade_data_sp500.csv"
+TRADE_PANEL_DIR = "inference_engine/trade_panel"
+
+_META_FILE = "meta.json"
+_DATES_FILE = "dates.npy"
+_PRESENT_FILE = "present.npy"
+
+class TradePanel:
+    """
+    Trade data as a dates x tickers panel. Numeric columns are arrays (usually
+    memory-mapped); `present` marks which (date, ticker) rows exist in the source.
+    """
+
+    def __init__(self, dates: np.ndarray, tickers: list[str], columns: list[str], arrays: dict, present: np.ndarray):
+        self.dates = dates
+        self.tickers = tickers
+        self.columns = columns
+        self.arrays = arrays
+        self.present = present
+
+    @property
+    def latest_date(self) -> pd.Timestamp:
+        return pd.Timestamp(self.dates[-1])
+
+    def date_slice(self, row: int) -> pd.DataFrame:
+        """The rows of one date, sorted by ticker, with the source's column order."""
+        mask = np.asarray(self.present[row])
+        tickers = np.asarray(self.tickers, dtype=object)[mask]
+        data = {}
+        for column in self.columns:
+            if column == 'date':
+                data[column] = np.repeat(np.datetime64(self.dates[row], 'ns'), len(tickers))
+            elif column == 'tic':
+                data[column] = tickers
+            else:
+                data[column] = np.asarray(self.arrays[column][row])[mask]
+        return pd.DataFrame(data).sort_values(by='tic').reset_index(drop=True)
+
+    def latest_slice(self) -> pd.DataFrame:
+        """Equivalent of trade_df[trade_df['date'] == latest].sort_values('tic'), read from the last row only."""
+        return self.date_slice(len(self.dates) - 1)
+
+    def to_long_frame(self, columns: list[str] = None) -> pd.DataFrame:
+        """Materializes the whole panel (or some columns) back into long format."""
+        columns = [c for c in (columns or self.columns) if c not in ('date', 'tic')]
+        date_index, ticker_index = np.nonzero(np.asarray(self.present))
+        data = {
+            'date': pd.to_datetime(self.dates[date_index]),
+            'tic': np.asarray(self.tickers, dtype=object)[ticker_index],
+        }
+        for column in columns:
+            data[column] = np.asarray(self.arrays[column])[date_index, ticker_index]
+        return pd.DataFrame(data)
+
+def _panel_from_frame(df: pd.DataFrame) -> TradePanel:
+    df = df.copy()
+    df['date'] = pd.to_datetime(df['date'])
+    tickers = df['tic'].unique().tolist()
+    dates = np.unique(df['date'].to_numpy(dtype='datetime64[ns]'))
+    date_index = np.searchsorted(dates, df['date'].to_numpy())
+    ticker_slots = {ticker: i for i, ticker in enumerate(tickers)}
+    ticker_index = df['tic'].map(ticker_slots).to_numpy()
+
+    present = np.zeros((len(dates), len(tickers)), dtype=bool)
+    present[date_index, ticker_index] = True
+    arrays = {}
+    columns = list(df.columns)
+    for column in columns:
+        if column in ('date', 'tic'):
+            continue
+        values = np.full((len(dates), len(tickers)), np.nan)
+        values[date_index, ticker_index] = pd.to_numeric(df[column], errors='coerce').to_numpy(dtype=np.float64)
+        arrays[column] = values
+    return TradePanel(dates, tickers, columns, arrays, present)
+
+def _source_signature(csv_path: str) -> dict:
+    stat = os.stat(csv_path)
+    return {"source_size": stat.st_size, "source_mtime": int(stat.st_mtime)}
+
+def convert_trade_csv(csv_path: str = TRADE_CSV_PATH, panel_dir: str = TRADE_PANEL_DIR) -> TradePanel:
+    """
+    Converts the trade CSV into the columnar panel directory. The new panel is
+    written next to it and swapped in whole: running workers keep their
+    mappings of the old files (which stay valid until they exit), and are never
+    handed a mix of old and new arrays.
+    """
+    print(f"Reading {csv_path}...")
+    df = pd.read_csv(csv_path, index_col=0)
+    panel = _panel_from_frame(df)
+
+    staging_dir, retired_dir = f"{panel_dir}.tmp", f"{panel_dir}.old"
+    for leftover in (staging_dir, retired_dir):
+        shutil.rmtree(leftover, ignore_errors=True)
+    os.makedirs(staging_dir)
+    np.save(os.path.join(staging_dir, _DATES_FILE), panel.dates)
+    np.save(os.path.join(staging_dir, _PRESENT_FILE), panel.present)
+    for column, values in panel.arrays.items():
+        np.save(os.path.join(staging_dir, f"{column}.npy"), values)
+    meta = {"columns": panel.columns, "tickers": panel.tickers, **_source_signature(csv_path)}
+    # meta.json is written last so a half-written directory is never loaded.
+    with open(os.path.join(staging_dir, _META_FILE), 'w') as f:
+        json.dump(meta, f)
+
+    # A directory can't be renamed over a non-empty one, so the old panel is
+    # moved aside first; a worker starting in between reads the CSV instead.
+    if os.path.exists(panel_dir):
+        os.replace(panel_dir, retired_dir)
+    os.replace(staging_dir, panel_dir)
+    shutil.rmtree(retired_dir, ignore_errors=True)
+
+    print(f"Wrote {len(panel.dates)} dates x {len(panel.tickers)} tickers to {panel_dir}")
+    return panel
+
+def _load_panel_dir(panel_dir: str):
+    with open(os.path.join(panel_dir, _META_FILE), 'r') as f:
+        meta = json.load(f)
+    dates = np.load(os.path.join(panel_dir, _DATES_FILE))
+    present = np.load(os.path.join(panel_dir, _PRESENT_FILE), mmap_mode='r')
+    arrays = {
+        column: np.load(os.path.join(panel_dir, f"{column}.npy"), mmap_mode='r')
+        for column in meta["columns"] if column not in ('date', 'tic')
+    }
+    return TradePanel(dates, meta["tickers"], meta["columns"], arrays, present), meta
+
+def load_trade_panel(csv_path: str = TRADE_CSV_PATH, panel_dir: str = TRADE_PANEL_DIR) -> TradePanel:
+    """
+    Loads the trade panel from the memory-mapped directory. Falls back to parsing
+    the CSV when the directory is missing or was built from a different CSV.
+    """
+    if os.path.exists(os.path.join(panel_dir, _META_FILE)):
+        panel, meta = _load_panel_dir(panel_dir)
+        stale = os.path.exists(csv_path) and any(
+            meta.get(key) != value for key, value in _source_signature(csv_path).items()
+        )
+        if not stale:
+            return panel
+        print(f"Backend: {panel_dir} is out of date with {csv_path}; run trade_store.py to rebuild it. Using the CSV.")
+
+    df = pd.read_csv(csv_path, index_col=0)
+    return _panel_from_frame(df)
+
+if __name__ == "__main__":
+    convert_trade_csv()